@@ -1,10 +1,22 @@
 #version 430
 #define CHUNK_SIZE 256
 #define INDEX_MASK 255
+#define MAX_BLOCKS 256
+#define BLOCK_FACES 6
+#define BRICK_LEVELS 3
+#define STORAGE_CHUNK_BITS 4
 
 
-// chunk cube diagonal
-const float CUBE_DIAG = pow(CHUNK_SIZE * CHUNK_SIZE * 3, 0.5f);
+// occupancy bricks; bits of the brick size for each level, from the finest to the coarsest
+const int BRICK_BITS[BRICK_LEVELS] = int[](2, 4, 6);
+
+// offsets of each occupancy level in `ssbo_occupancy`; each level is padded to 32 bits
+const int BRICK_LEVEL_0 = ((CHUNK_SIZE >> 2) * (CHUNK_SIZE >> 2) * (CHUNK_SIZE >> 2) + 31) / 32;
+const int BRICK_LEVEL_1 = ((CHUNK_SIZE >> 4) * (CHUNK_SIZE >> 4) * (CHUNK_SIZE >> 4) + 31) / 32;
+const int BRICK_OFFSETS[BRICK_LEVELS] = int[](0, BRICK_LEVEL_0, BRICK_LEVEL_0 + BRICK_LEVEL_1);
+
+// checkerboard shadows alternate between tiles of 8 pixels, so that neighbouring pixels take the same branch
+const int CHECKER_BITS = 3;
 
 
 // DDA struct
@@ -13,6 +25,8 @@ struct DDAData {
     ivec3 istep;    // integer step
     vec3 ustep;     // unit step size
     vec3 alen;      // length for each axis
+    vec3 first;     // length for each axis at the start
+    ivec3 count;    // steps made along each axis
 };
 
 // information about the point of ray collision
@@ -39,9 +53,10 @@ out vec4 fragColor;
 
 // uniforms
 uniform vec3 u_resolution;
+uniform vec2 u_fragOffset;  // offset of the rendered tile within the whole image
+uniform ivec3 u_windowOffset;  // world buffer is a toroidal window; offset of its origin within the buffer
 
 // textures
-uniform int u_textureMapping[256 * 6];  // 256 blocks with 6 sides per block
 uniform sampler2DArray u_textureArray;
 
 // player uniforms
@@ -51,13 +66,57 @@ uniform vec2 u_playerDirection;
 
 // world uniforms
 uniform vec3 u_worldSun;
+uniform vec3 u_boundsMin;  // box around all solid blocks, in window coordinates; rays are clipped to it
+uniform vec3 u_boundsMax;
+
+// checkerboard shadows; parity of the tiles that trace shadows this frame, -1 when all of them do
+uniform int u_checkerboard;
+
+// shadow cache; 1 when shadows of surfaces seen in the last frame are reused
+uniform int u_shadowCache;
+uniform int u_shadowEpoch;  // changes whenever the world does, which invalidates cached shadows
+uniform ivec3 u_windowOrigin;  // world position of the window origin
+
+// player pose of the last frame; position is relative to the current window origin
+uniform vec3 u_previousPosition;
+uniform vec2 u_previousDirection;
+uniform float u_previousFov;
 
+// sun lightmap; 1 when shadows are looked up in it instead of being traced
+uniform int u_sunLightmap;
 
-// chunk data
+
+// world blocks in the chunk major layout, see `getBlock`
 layout (std430, binding = 0) buffer voxelData {
     int ssbo_voxelData[CHUNK_SIZE * CHUNK_SIZE * CHUNK_SIZE / 4];
 };
 
+// occupancy pyramid; one bit per brick, set when brick isn't empty
+layout (std430, binding = 1) buffer occupancyData {
+    uint ssbo_occupancy[];
+};
+
+// texture layer for every side of every block; written once
+layout (std430, binding = 2) readonly buffer textureMapping {
+    int ssbo_textureMapping[MAX_BLOCKS * BLOCK_FACES];
+};
+
+// shadow of the first hit of every pixel, row by row; entries of the last frame are read,
+// entries of this frame are written. Entry is world X and Y of the hit voxel, its Z packed with face index + 1,
+// texel within the face and epoch as `z | face << 8 | u << 11 | v << 16 | epoch << 21`, and the shadow.
+// Face index is 0 when nothing was hit
+layout (std430, binding = 3) readonly buffer shadowPrevious {
+    ivec4 ssbo_shadowPrevious[];
+};
+layout (std430, binding = 4) writeonly buffer shadowCurrent {
+    ivec4 ssbo_shadowCurrent[];
+};
+
+// sunlight that passes through every block, from 0 to 255; index is 'z * CHUNK_SIZE ** 2 + y * CHUNK_SIZE + x'
+layout (std430, binding = 5) readonly buffer sunLight {
+    int ssbo_sunLight[CHUNK_SIZE * CHUNK_SIZE * CHUNK_SIZE / 4];
+};
+
 
 // simple vector math. Rotations around different axises
 // Uses `point` as a point to rotate
@@ -102,22 +161,36 @@ vec3 rotateZ(vec3 point, float angle) {
 }
 
 
+// check if block is inside the chunk
+// Uses `pos` to define integer block position
+// Returns true when block is in bounds
+bool isInside(ivec3 pos) {
+    return (pos.x > -1 && pos.x < CHUNK_SIZE &&
+            pos.y > -1 && pos.y < CHUNK_SIZE &&
+            pos.z > -1 && pos.z < CHUNK_SIZE);
+}
+
+
 // get block / voxel
 // Uses `pos` to define integer block position
 // Returns int that defines the block. Returns -1 when block is out of bounds
 int getBlock(ivec3 pos) {
-    if (pos.x > -1 && pos.x < CHUNK_SIZE &&
-        pos.y > -1 && pos.y < CHUNK_SIZE &&
-        pos.z > -1 && pos.z < CHUNK_SIZE) {
+    if (isInside(pos)) {
+        // wrap the position around the window
+        pos = (pos + u_windowOffset) & (CHUNK_SIZE - 1);
 
-        // calculate generic index
-        int index = pos.z * CHUNK_SIZE * CHUNK_SIZE + pos.y * CHUNK_SIZE + pos.x;
+        // calculate chunk major index; storage chunks follow each other, blocks within a chunk are in ZYX order
+        const int chunks = CHUNK_SIZE >> STORAGE_CHUNK_BITS;
+        ivec3 chunk = pos >> STORAGE_CHUNK_BITS;
+        ivec3 local = pos & ((1 << STORAGE_CHUNK_BITS) - 1);
+        int index = (((chunk.z * chunks + chunk.y) * chunks + chunk.x) << (3 * STORAGE_CHUNK_BITS)) +
+            (((local.z << STORAGE_CHUNK_BITS) + local.y) << STORAGE_CHUNK_BITS) + local.x;
 
         // calculate the bitwise mask offset
         int mask_offset = (index & 3) << 3;
 
         // return the block / voxel
-        return (ssbo_voxelData[index >> 2] & (INDEX_MASK << mask_offset)) >> mask_offset;
+        return (ssbo_voxelData[index >> 2] >> mask_offset) & INDEX_MASK;
     }
 
     // return -1 (void / sky)
@@ -125,6 +198,58 @@ int getBlock(ivec3 pos) {
 }
 
 
+// ray distances to the box around all solid blocks
+// Uses `origin` as the ray origin
+// Uses `direction` as the ray direction
+// Returns distances where the ray enters and exits the box; the ray misses the box when the first is larger
+vec2 getBoundsDistances(vec3 origin, vec3 direction) {
+    vec3 low = (u_boundsMin - origin) / direction;
+    vec3 high = (u_boundsMax - origin) / direction;
+    vec3 near = min(low, high);
+    vec3 far = max(low, high);
+    return vec2(max(max(near.x, near.y), near.z), min(min(far.x, far.y), far.z));
+}
+
+
+// get sunlight
+// Uses `pos` to define integer block position
+// Returns fraction of sunlight that passes through the block. Out of bounds blocks are fully lit
+float getLight(ivec3 pos) {
+    if (!isInside(pos))
+        return 1.f;
+
+    // wrapped like in `getBlock`
+    pos = (pos + u_windowOffset) & (CHUNK_SIZE - 1);
+    int index = pos.z * CHUNK_SIZE * CHUNK_SIZE + pos.y * CHUNK_SIZE + pos.x;
+    return float((ssbo_sunLight[index >> 2] >> ((index & 3) << 3)) & 255) / 255.f;
+}
+
+
+// find empty brick
+// Uses `pos` to define integer block position
+// Returns bits of the largest empty brick size containing the block, 0 when the finest brick isn't empty.
+// Out of bounds blocks are always in an empty brick of the coarsest level
+int getEmptyBrick(ivec3 pos) {
+    if (!isInside(pos))
+        return BRICK_BITS[BRICK_LEVELS - 1];
+
+    // wrap the position around the window; window moves by whole coarsest bricks, so the bricks stay aligned
+    pos = (pos + u_windowOffset) & (CHUNK_SIZE - 1);
+
+    for (int level = BRICK_LEVELS - 1; level >= 0; level--) {
+        // calculate brick index within the level
+        int size = CHUNK_SIZE >> BRICK_BITS[level];
+        ivec3 brick = pos >> BRICK_BITS[level];
+        int index = (brick.z * size + brick.y) * size + brick.x;
+
+        // check brick bit
+        if ((ssbo_occupancy[BRICK_OFFSETS[level] + (index >> 5)] & (1u << (index & 31))) == 0u)
+            return BRICK_BITS[level];
+    }
+    return 0;
+}
+
+
 // voxel normal vector
 // Uses `pos` as a position to check
 // Uses `ipos` as a position for the voxel that will be checked
@@ -191,23 +316,23 @@ vec2 getUvCoord(vec3 pos, ivec3 norm) {
 int getLayerByVoxel(int voxelId, ivec3 norm) {
     if (norm.x != 0) {
         if (norm.x > 0) {
-            return u_textureMapping[voxelId * 6];
+            return ssbo_textureMapping[voxelId * BLOCK_FACES];
         } else {
-            return u_textureMapping[voxelId * 6 + 1];
+            return ssbo_textureMapping[voxelId * BLOCK_FACES + 1];
         }
     }
     if (norm.y != 0) {
         if (norm.y > 0) {
-            return u_textureMapping[voxelId * 6 + 2];
+            return ssbo_textureMapping[voxelId * BLOCK_FACES + 2];
         } else {
-            return u_textureMapping[voxelId * 6 + 3];
+            return ssbo_textureMapping[voxelId * BLOCK_FACES + 3];
         }
     }
     if (norm.z != 0) {
         if (norm.z > 0) {
-            return u_textureMapping[voxelId * 6 + 4];
+            return ssbo_textureMapping[voxelId * BLOCK_FACES + 4];
         } else {
-            return u_textureMapping[voxelId * 6 + 5];
+            return ssbo_textureMapping[voxelId * BLOCK_FACES + 5];
         }
     }
     return 0;
@@ -245,11 +370,82 @@ DDAData computeDDA(vec3 origin, vec3 direction) {
         dda.alen.z = (origin.z - float(dda.ipos.z)) * dda.ustep.z;
     }
 
+    // never step along the axes the ray is parallel to
+    if (isinf(dda.ustep.x))
+        dda.alen.x = dda.ustep.x;
+    if (isinf(dda.ustep.y))
+        dda.alen.y = dda.ustep.y;
+    if (isinf(dda.ustep.z))
+        dda.alen.z = dda.ustep.z;
+
+    // lengths are always computed as `first + count * ustep`, so that skipping a brick lands on the same values
+    dda.first = dda.alen;
+    dda.count = ivec3(0);
+
     // return
     return dda;
 }
 
 
+// checks whether DDA step comes before the brick exiting step
+// DDA steps are ordered by axial length, on ties Z goes before Y and Y before X
+bool isStepBefore(DDAData dda, int axis, int step, float exitLength, int exitAxis) {
+    float stepLength = dda.first[axis] + float(step) * dda.ustep[axis];
+    return stepLength < exitLength || (stepLength == exitLength && axis > exitAxis);
+}
+
+
+// skips empty brick
+// Uses `dda` as DDA state to advance to the first block outside the brick
+// Uses `bits` as bits of the brick size
+// Returns ray length at the brick exit
+float skipBrick(inout DDAData dda, int bits) {
+    // steps left along each axis until the brick is left
+    ivec3 brickStart = (dda.ipos >> bits) << bits;
+    ivec3 steps = ivec3(
+        dda.istep.x > 0 ? brickStart.x + (1 << bits) - dda.ipos.x : dda.ipos.x - brickStart.x + 1,
+        dda.istep.y > 0 ? brickStart.y + (1 << bits) - dda.ipos.y : dda.ipos.y - brickStart.y + 1,
+        dda.istep.z > 0 ? brickStart.z + (1 << bits) - dda.ipos.z : dda.ipos.z - brickStart.z + 1);
+
+    // axial length of the exiting step along each axis; the first one in DDA order leaves the brick
+    vec3 exits = dda.first + vec3(dda.count + steps - 1) * dda.ustep;
+    for (int axis = 0; axis < 3; axis++)
+        if (isinf(dda.ustep[axis]))
+            exits[axis] = dda.ustep[axis];
+
+    int exitAxis;
+    if (exits.x < exits.y && exits.x < exits.z)
+        exitAxis = 0;
+    else if (exits.y < exits.z)
+        exitAxis = 1;
+    else
+        exitAxis = 2;
+    float exitLength = exits[exitAxis];
+
+    // count steps along other axes that come before the exiting step
+    for (int axis = 0; axis < 3; axis++) {
+        int taken = 0;
+        if (axis == exitAxis) {
+            taken = steps[axis];
+        } else if (!isinf(dda.ustep[axis])) {
+            int step = max(dda.count[axis], int(ceil((exitLength - dda.first[axis]) / dda.ustep[axis])));
+            while (step > dda.count[axis] && !isStepBefore(dda, axis, step - 1, exitLength, exitAxis))
+                step--;
+            while (isStepBefore(dda, axis, step, exitLength, exitAxis))
+                step++;
+            taken = step - dda.count[axis];
+        }
+
+        if (taken != 0) {
+            dda.ipos[axis] += taken * dda.istep[axis];
+            dda.count[axis] += taken;
+            dda.alen[axis] = dda.first[axis] + float(dda.count[axis]) * dda.ustep[axis];
+        }
+    }
+    return exitLength;
+}
+
+
 // ray caster
 // Uses `origin` as a starting position for the ray
 // Uses `direction` as a direction in which to cast ray
@@ -258,39 +454,53 @@ RayCast castRay(vec3 origin, vec3 direction, ivec3 skipPos) {
     // compute DDA variables
     DDAData dda = computeDDA(origin, direction);
 
+    // nothing can be hit after leaving the box around solid blocks
+    float limit = getBoundsDistances(origin, direction).y;
+
     // distance
-    float dist;
+    float dist = 0.f;
 
     // cast ray
-    int voxelId;
+    int voxelId = -1;
     while (true) {
-        // if not skipPos
-        if (dda.ipos != skipPos) {
-            // fetch block
-            voxelId = getBlock(dda.ipos);
-
-            // if collided
-            if (voxelId > 0)
-                break;
-        }
-
-        // make a step
-        if (dda.alen.x < dda.alen.y && dda.alen.x < dda.alen.z) {
-            dda.ipos.x += dda.istep.x;
-            dist = dda.alen.x;
-            dda.alen.x += dda.ustep.x;
-        } else if (dda.alen.y < dda.alen.z) {
-            dda.ipos.y += dda.istep.y;
-            dist = dda.alen.y;
-            dda.alen.y += dda.ustep.y;
+        // find the largest empty brick around
+        int brickBits = getEmptyBrick(dda.ipos);
+        if (brickBits > 0) {
+            // cross the whole brick; it is either all air or all out of bounds
+            voxelId = isInside(dda.ipos) ? 0 : -1;
+            dist = skipBrick(dda, brickBits);
         } else {
-            dda.ipos.z += dda.istep.z;
-            dist = dda.alen.z;
-            dda.alen.z += dda.ustep.z;
+            // if not skipPos
+            if (dda.ipos != skipPos) {
+                // fetch block
+                voxelId = getBlock(dda.ipos);
+
+                // if collided
+                if (voxelId > 0)
+                    break;
+            }
+
+            // make a step
+            if (dda.alen.x < dda.alen.y && dda.alen.x < dda.alen.z) {
+                dda.ipos.x += dda.istep.x;
+                dist = dda.alen.x;
+                dda.count.x++;
+                dda.alen.x = dda.first.x + float(dda.count.x) * dda.ustep.x;
+            } else if (dda.alen.y < dda.alen.z) {
+                dda.ipos.y += dda.istep.y;
+                dist = dda.alen.y;
+                dda.count.y++;
+                dda.alen.y = dda.first.y + float(dda.count.y) * dda.ustep.y;
+            } else {
+                dda.ipos.z += dda.istep.z;
+                dist = dda.alen.z;
+                dda.count.z++;
+                dda.alen.z = dda.first.z + float(dda.count.z) * dda.ustep.z;
+            }
         }
 
         // check for length; if too far then return
-        if (dist > CUBE_DIAG)
+        if (dist > limit)
             break;
     }
     return RayCast(
@@ -340,10 +550,11 @@ vec4 calculatePixel(vec3 origin, vec3 direction) {
     vec3 curDirection = direction;
 
     // accumulated color; calculated color
-    vec4 cumColor, baseColor;
+    vec4 cumColor = vec4(0), baseColor;
 
-    // ray collision
+    // ray collision; first ray has no voxel to skip
     CollisionData rayHit;
+    rayHit.ray.dda.ipos = ivec3(-1);
     for (int i = 0; i < 10; i++) {
         // cast ray from curPosition in curDirection
         rayHit = castColorRay(curPosition, curDirection, rayHit.ray.dda.ipos);
@@ -373,15 +584,74 @@ vec4 calculatePixel(vec3 origin, vec3 direction) {
 }
 
 
+// index of the pixel in per pixel buffers
+int getPixelIndex() {
+    ivec2 pixel = ivec2(gl_FragCoord.xy);
+    return pixel.y * int(u_resolution.x) + pixel.x;
+}
+
+
+// projects a point onto the screen of the last frame
+// Uses `pos` as a point to project
+// Returns pixel position, or -1 when the point is behind the last camera
+ivec2 getPreviousPixel(vec3 pos) {
+    // undo the rotations of the ray direction
+    vec3 local = rotateX(rotateZ(pos - u_previousPosition, -u_previousDirection.y), -u_previousDirection.x);
+    if (local.y <= 0.f)
+        return ivec2(-1);
+
+    vec2 uv = local.xz / local.y * u_previousFov;
+    return ivec2(floor(uv * u_resolution.y + u_resolution.xy * 0.5f));
+}
+
+
+// shadow of the first hit, using the shadow cache
+// Uses `rayHit` as the first hit
+// Uses `direction` as the ray direction
+// Returns shadow multiplier. It is reused when the last frame saw the same texel of the same voxel face at this point,
+// or with checkerboard shadows, when the tile doesn't trace shadows this frame. Otherwise it is traced
+float getFirstShadow(CollisionData rayHit, vec3 direction) {
+    // hit voxel in world coordinates; face index + 1; texel within the face, as shadows change from texel to texel
+    ivec3 voxel = rayHit.ray.dda.ipos + u_windowOrigin;
+    int face = rayHit.normal.x > 0 ? 1 : rayHit.normal.x < 0 ? 2 : rayHit.normal.y > 0 ? 3 :
+               rayHit.normal.y < 0 ? 4 : rayHit.normal.z > 0 ? 5 : 6;
+    int cells = min(textureSize(u_textureArray, 0).x, 32);
+    ivec2 texel = clamp(ivec2(rayHit.uv * float(cells)), ivec2(0), ivec2(cells - 1));
+    int info = voxel.z | (face << 8) | (texel.x << 11) | (texel.y << 16) | (u_shadowEpoch << 21);
+
+    // entry of the last frame seeing this point; entries of older epochs are ignored
+    ivec2 previous = getPreviousPixel(rayHit.ray.pos);
+    ivec4 entry = ivec4(0);
+    if (all(greaterThanEqual(previous, ivec2(0))) && all(lessThan(previous, ivec2(u_resolution.xy))))
+        entry = ssbo_shadowPrevious[previous.y * int(u_resolution.x) + previous.x];
+    bool current = ((entry.z >> 8) & 7) != 0 && (entry.z >> 21) == u_shadowEpoch;
+
+    float shadow;
+    ivec2 tile = ivec2(gl_FragCoord.xy) >> CHECKER_BITS;
+    if (current && u_shadowCache == 1 && entry.xyz == ivec3(voxel.xy, info)) {
+        shadow = intBitsToFloat(entry.w);
+    } else if (current && u_checkerboard >= 0 && ((tile.x + tile.y) & 1) != u_checkerboard) {
+        shadow = intBitsToFloat(entry.w);
+    } else {
+        vec4 collisionColor = calculatePixel(rayHit.ray.pos - direction * 1e-3, -u_worldSun);
+        shadow = max(0.3f, 1.f - collisionColor.a);
+    }
+
+    ssbo_shadowCurrent[getPixelIndex()] = ivec4(voxel.xy, info, floatBitsToInt(shadow));
+    return shadow;
+}
+
+
 vec4 calculatePixel_0(vec3 origin, vec3 direction) {
     vec3 curPosition = origin;
     vec3 curDirection = direction;
 
     // accumulated color; calculated color
-    vec4 cumColor, baseColor;
+    vec4 cumColor = vec4(0), baseColor;
 
-    // ray collision
+    // ray collision; first ray has no voxel to skip
     CollisionData rayHit;
+    rayHit.ray.dda.ipos = ivec3(-1);
     for (int i = 0; i < 10; i++) {
         // cast ray from curPosition in curDirection
         rayHit = castColorRay(curPosition, curDirection, rayHit.ray.dda.ipos);
@@ -396,9 +666,18 @@ vec4 calculatePixel_0(vec3 origin, vec3 direction) {
         // normal shading
         baseColor.rgb *= max(0.5f, dot(rayHit.normal, -u_worldSun));
 
-        // cast shadow
-        vec4 collisionColor = calculatePixel(rayHit.ray.pos - curDirection * 1e-3, -u_worldSun);
-        baseColor.rgb *= max(0.3f, 1.f - collisionColor.a);
+        // cast shadow; with the sun lightmap it is looked up instead. Faces towards the sun get the light reaching
+        // the block in front of them, other faces get the light passing through their own block.
+        // Without the lightmap, shadow of the first hit may come from the last frame
+        if (u_sunLightmap == 1) {
+            ivec3 ipos = rayHit.ray.dda.ipos;
+            baseColor.rgb *= max(0.3f, getLight(dot(rayHit.normal, -u_worldSun) > 0.f ? ipos + rayHit.normal : ipos));
+        } else if (i == 0 && (u_shadowCache == 1 || u_checkerboard >= 0)) {
+            baseColor.rgb *= getFirstShadow(rayHit, curDirection);
+        } else {
+            vec4 collisionColor = calculatePixel(rayHit.ray.pos - curDirection * 1e-3, -u_worldSun);
+            baseColor.rgb *= max(0.3f, 1.f - collisionColor.a);
+        }
 
         // accumulate color
         cumColor += baseColor * (1.f - cumColor.a);
@@ -416,17 +695,26 @@ vec4 calculatePixel_0(vec3 origin, vec3 direction) {
 
 
 void main() {
-    vec2 uv = (gl_FragCoord.xy - u_resolution.xy * 0.5f) / u_resolution.y;
-
-    // calculate distance to chunk border surface
-    float chunkDistance = max(distance(u_playerPosition, vec3(CHUNK_SIZE / 2)) - CUBE_DIAG / 2, 0.f);
+    vec2 fragCoord = gl_FragCoord.xy + u_fragOffset;
+    vec2 uv = (fragCoord - u_resolution.xy * 0.5f) / u_resolution.y;
 
     // calculate ray direction
     vec3 direction = normalize(vec3(uv.x, u_playerFov, uv.y));
     direction = rotateZ(rotateX(direction, u_playerDirection.x), u_playerDirection.y);
 
-    // calculate ray origin
-    vec3 origin = u_playerPosition + direction * chunkDistance;
+    // pixels hitting nothing leave an empty shadow cache entry
+    if (u_shadowCache == 1 || u_checkerboard >= 0)
+        ssbo_shadowCurrent[getPixelIndex()] = ivec4(0);
+
+    // rays missing the box around solid blocks only see the sky
+    vec2 bounds = getBoundsDistances(u_playerPosition, direction);
+    if (bounds.x > bounds.y || bounds.y < 0.f) {
+        fragColor = vec4(0);
+        return;
+    }
+
+    // calculate ray origin; rays start where they enter the box
+    vec3 origin = u_playerPosition + direction * max(bounds.x, 0.f);
 
     // calculate pixel data
     fragColor = calculatePixel_0(origin, direction);
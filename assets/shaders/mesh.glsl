@@ -0,0 +1,101 @@
+#version 430
+#define CHUNK_SIZE 256
+
+
+// shader input; position within the window, face normal and texture layer
+in vec3 v_position;
+flat in ivec3 v_normal;
+flat in int v_layer;
+
+// shader output
+out vec4 fragColor;
+
+// uniforms
+uniform ivec3 u_windowOffset;  // world buffer is a toroidal window; offset of its origin within the buffer
+
+// textures
+uniform sampler2DArray u_textureArray;
+
+// world uniforms
+uniform vec3 u_worldSun;
+
+// sunlight that passes through every block, from 0 to 255; same layout as chunk data
+layout (std430, binding = 5) readonly buffer sunLight {
+    int ssbo_sunLight[CHUNK_SIZE * CHUNK_SIZE * CHUNK_SIZE / 4];
+};
+
+
+// check if block is inside the chunk
+// Uses `pos` to define integer block position
+// Returns true when block is in bounds
+bool isInside(ivec3 pos) {
+    return (pos.x > -1 && pos.x < CHUNK_SIZE &&
+            pos.y > -1 && pos.y < CHUNK_SIZE &&
+            pos.z > -1 && pos.z < CHUNK_SIZE);
+}
+
+
+// get sunlight
+// Uses `pos` to define integer block position
+// Returns fraction of sunlight that passes through the block. Out of bounds blocks are fully lit
+float getLight(ivec3 pos) {
+    if (!isInside(pos))
+        return 1.f;
+
+    // same indexing as chunk data
+    pos = (pos + u_windowOffset) & (CHUNK_SIZE - 1);
+    int index = pos.z * CHUNK_SIZE * CHUNK_SIZE + pos.y * CHUNK_SIZE + pos.x;
+    return float((ssbo_sunLight[index >> 2] >> ((index & 3) << 3)) & 255) / 255.f;
+}
+
+
+// voxel UV coord; same as in the chunk tracer
+// Uses `pos` as a position to be converted
+// Uses `norm` as a normal, used to fetch coordinates from `pos` argument
+// Returns UV coord
+vec2 getUvCoord(vec3 pos, ivec3 norm) {
+    // wrap the position to be in 0.0 - 1.0 range
+    pos = mod(pos, 1.f);
+
+    // fetch the coordinates in the correct order according to the normal vector
+    if (norm.x != 0) {
+        if (norm.x > 0) {
+            return vec2(1.f - pos.y, pos.z);
+        } else {
+            return vec2(pos.y, pos.z);
+        }
+    }
+    if (norm.y != 0) {
+        if (norm.y > 0) {
+            return vec2(pos.x, pos.z);
+        } else {
+            return vec2(1.f - pos.x, pos.z);
+        }
+    }
+    if (norm.z != 0) {
+        if (norm.z > 0) {
+            return vec2(pos.x, pos.y);
+        } else {
+            return vec2(1.f - pos.x, 1.f - pos.y);
+        }
+    }
+    return vec2(-1.f, -1.f);
+}
+
+
+void main() {
+    // see through texels leave the blocks behind visible
+    vec4 baseColor = texture(u_textureArray, vec3(getUvCoord(v_position, v_normal), v_layer));
+    if (baseColor.a == 0.f)
+        discard;
+
+    // normal shading
+    baseColor.rgb *= max(0.5f, dot(v_normal, -u_worldSun));
+
+    // shadow; faces towards the sun get the light reaching the block in front of them,
+    // other faces get the light passing through their own block
+    ivec3 ipos = ivec3(floor(v_position - vec3(v_normal) * 0.5f));
+    baseColor.rgb *= max(0.3f, getLight(dot(v_normal, -u_worldSun) > 0.f ? ipos + v_normal : ipos));
+
+    fragColor = baseColor;
+}
@@ -0,0 +1,97 @@
+#version 430
+#define CHUNK_SIZE 256
+
+
+// depth range of the camera
+const float NEAR_PLANE = 0.05f;
+const float FAR_PLANE = 1024.f;
+
+// corners of the two triangles of a quad, counterclockwise
+const ivec2 QUAD_CORNERS[6] = ivec2[](ivec2(0, 0), ivec2(1, 0), ivec2(1, 1), ivec2(0, 0), ivec2(1, 1), ivec2(0, 1));
+
+
+// shader output; position within the window, face normal and texture layer
+out vec3 v_position;
+flat out ivec3 v_normal;
+flat out int v_layer;
+
+// uniforms
+uniform vec3 u_resolution;
+uniform ivec3 u_windowOffset;  // world buffer is a toroidal window; offset of its origin within the buffer
+
+// player uniforms
+uniform float u_playerFov;
+uniform vec3 u_playerPosition;
+uniform vec2 u_playerDirection;
+
+// quads of the world mesh; lowest block and face as `x | y << 8 | z << 16 | face << 24`,
+// size and texture layer as `width - 1 | height - 1 << 8 | layer << 16`. Every quad is 6 vertices
+layout (std430, binding = 6) readonly buffer meshQuads {
+    uvec2 ssbo_meshQuads[];
+};
+
+
+// simple vector math. Rotations around different axises
+// Uses `point` as a point to rotate
+// Uses `angle` to rotate the point
+// Returns the rotated point
+vec3 rotateX(vec3 point, float angle) {
+    vec3 temp = vec3(0);
+
+    temp.x = point.x;
+    temp.y = point.y * cos(angle) - point.z * sin(angle);
+    temp.z = point.z * cos(angle) + point.y * sin(angle);
+
+    return temp;
+}
+
+
+// Uses `point` as a point to rotate
+// Uses `angle` to rotate the point
+// Returns the rotated point
+vec3 rotateZ(vec3 point, float angle) {
+    vec3 temp = vec3(0);
+
+    temp.x = point.x * cos(angle) - point.y * sin(angle);
+    temp.y = point.y * cos(angle) + point.x * sin(angle);
+    temp.z = point.z;
+
+    return temp;
+}
+
+
+void main() {
+    // unpack the quad
+    uvec2 quad = ssbo_meshQuads[gl_VertexID / 6];
+    ivec3 block = ivec3(quad.x & 255u, (quad.x >> 8) & 255u, (quad.x >> 16) & 255u);
+    int face = int(quad.x >> 24);
+    ivec2 size = ivec2(quad.y & 255u, (quad.y >> 8) & 255u) + 1;
+
+    // unwrap the block position; window moves by whole chunks, so quads never cross the wrap
+    block.xy = (block.xy - u_windowOffset.xy) & (CHUNK_SIZE - 1);
+
+    // faces are in `X+, X-, Y+, Y-, Z+, Z-` order; width goes along the next axis after the normal
+    int axis = face / 2;
+    ivec3 normal = ivec3(0);
+    normal[axis] = 1 - face % 2 * 2;
+
+    // corners of faces towards negative axes go in the opposite order, so that all faces wind the same way
+    ivec2 corner = QUAD_CORNERS[gl_VertexID % 6];
+    corner = (face % 2 == 0 ? corner : corner.yx) * size;
+    vec3 position = vec3(block);
+    position[axis] += float(1 - face % 2);
+    position[(axis + 1) % 3] += float(corner.x);
+    position[(axis + 2) % 3] += float(corner.y);
+
+    v_position = position;
+    v_normal = normal;
+    v_layer = int(quad.y >> 16);
+
+    // same projection as the ray directions of the chunk tracer; camera looks along Y, with Z up
+    vec3 local = rotateX(rotateZ(position - u_playerPosition, -u_playerDirection.y), -u_playerDirection.x);
+    gl_Position = vec4(
+        local.x * u_playerFov * 2.f * u_resolution.y / u_resolution.x,
+        local.z * u_playerFov * 2.f,
+        (local.y * (FAR_PLANE + NEAR_PLANE) - 2.f * FAR_PLANE * NEAR_PLANE) / (FAR_PLANE - NEAR_PLANE),
+        local.y);
+}
@@ -7,6 +7,7 @@ out vec4 fragColor;
 
 // uniforms
 uniform vec3 u_resolution;
+uniform vec2 u_fragOffset;  // offset of the rendered tile within the whole image
 
 // player uniforms
 uniform vec2 u_playerDirection;
@@ -27,8 +28,9 @@ vec3 getColor(int index) {
 
 
 void main() {
-    vec2 uv = (gl_FragCoord.xy - u_resolution.xy * 0.5f) / u_resolution.y;
-    float t = (sin(u_playerDirection.x + (gl_FragCoord.y * 3.14159265f / u_resolution.y)) + 1.f) / 2.f;
+    vec2 fragCoord = gl_FragCoord.xy + u_fragOffset;
+    vec2 uv = (fragCoord - u_resolution.xy * 0.5f) / u_resolution.y;
+    float t = (sin(u_playerDirection.x + (fragCoord.y * 3.14159265f / u_resolution.y)) + 1.f) / 2.f;
 
     int skySliceIndex = int(t * (GRAD_LEN - 1));
 
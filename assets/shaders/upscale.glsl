@@ -0,0 +1,33 @@
+#version 430
+
+
+// shader output
+out vec4 fragColor;
+
+// uniforms
+uniform vec2 u_scale;  // size of the upscaled image relative to the window
+
+// textures
+uniform sampler2D u_image;
+
+
+// premultiplied color of a texel; edges are clamped
+// Uses `texel` as integer texel position
+// Returns color with alpha multiplied into it
+vec4 getPremultiplied(ivec2 texel) {
+    vec4 color = texelFetch(u_image, clamp(texel, ivec2(0), textureSize(u_image, 0) - 1), 0);
+    return vec4(color.rgb * color.a, color.a);
+}
+
+
+void main() {
+    // texel position under the pixel center
+    vec2 pos = gl_FragCoord.xy * u_scale - 0.5f;
+    ivec2 texel = ivec2(floor(pos));
+    vec2 t = pos - vec2(texel);
+
+    // bilinear filtering of premultiplied colors; filtering straight colors would bleed into transparent texels
+    vec4 bottom = mix(getPremultiplied(texel), getPremultiplied(texel + ivec2(1, 0)), t.x);
+    vec4 top = mix(getPremultiplied(texel + ivec2(0, 1)), getPremultiplied(texel + ivec2(1, 1)), t.x);
+    fragColor = mix(bottom, top, t.y);
+}
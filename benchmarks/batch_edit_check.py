@@ -0,0 +1,125 @@
+"""
+Batch voxel edit check file
+Run from the repository root: python -m benchmarks.batch_edit_check
+"""
+
+
+import time
+import argparse
+import numpy as np
+from source.world import World, WorldGen
+from source.blocks import *
+from source.options import *
+
+
+def dense_set_many(dense: np.ndarray, coords: np.ndarray, values: np.ndarray) -> int:
+    """
+    Reference of 'World.set_many' on a ZYX array, one position at a time
+    :param dense: ZYX array of block ids
+    :param coords: array of XYZ block positions with shape (N, 3)
+    :param values: array of N block ids; -1 is skipped
+    :return: amount of blocks that were changed
+    """
+
+    last = {}
+    for position, value in zip(map(tuple, coords.tolist()), values.tolist()):
+        if value > -1 and all(-1 < axis < WORLD_SIZE for axis in position):
+            last[position] = value
+    changed = 0
+    for (x, y, z), value in last.items():
+        changed += dense[z, y, x] != value
+        dense[z, y, x] = value
+    return changed
+
+
+def clip(minimum: np.ndarray, maximum: np.ndarray) -> tuple[slice, slice, slice]:
+    """
+    Clips a box to the world bounds
+    :param minimum: min box corner
+    :param maximum: max box corner, exclusive
+    :return: ZYX slices of a dense array
+    """
+
+    minimum, maximum = np.clip(minimum, 0, WORLD_SIZE), np.clip(maximum, 0, WORLD_SIZE)
+    return tuple(slice(int(minimum[axis]), max(int(maximum[axis]), int(minimum[axis]))) for axis in (2, 1, 0))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Applies random batch edits to a world and to a dense array, and compares them")
+    parser.add_argument("--seed", type=int, default=0, help="seed of generated world and edits")
+    parser.add_argument("--rounds", type=int, default=20, help="amount of rounds of edits")
+    parser.add_argument("--blocks", type=int, default=5000, help="amount of positions per batch")
+    args = parser.parse_args()
+
+    world = WorldGen.generate_landscape(WORLD_SIZE // 2, 32, seed=args.seed)
+    dense = world.get_voxels().reshape(WORLD_SIZE, WORLD_SIZE, WORLD_SIZE).copy()
+    random = np.random.default_rng(args.seed)
+    ids = np.array(sorted(Blocks.named.values()))
+    names = sorted(Blocks.named)
+    seconds = {"set_many": 0.0, "get_many": 0.0, "fill_box": 0.0, "replace": 0.0}
+
+    for round_index in range(args.rounds):
+        # positions around the world bounds, so that some are out of bounds; a part of them is repeated
+        coords = random.integers(-8, WORLD_SIZE + 8, [args.blocks, 3])
+        coords[random.random(args.blocks) < 0.2] = coords[0]
+        coords = np.concatenate([coords, coords[random.integers(0, args.blocks, args.blocks // 4)]])
+        if round_index % 2:
+            values = random.choice(ids, coords.shape[0])
+            values[random.random(coords.shape[0]) < 0.05] = -1
+            batch = values
+        else:
+            batch = np.array(random.choice(names, coords.shape[0]))
+            values = np.array([Blocks.named[name] for name in batch.tolist()])
+
+        start = time.perf_counter()
+        changed = world.set_many(coords, batch)
+        seconds["set_many"] += time.perf_counter() - start
+        assert changed == dense_set_many(dense, coords, values), \
+            f"set_many changed count differs in round {round_index}"
+
+        start = time.perf_counter()
+        read = world.get_many(coords)
+        seconds["get_many"] += time.perf_counter() - start
+        inbound = np.all((coords > -1) & (coords < WORLD_SIZE), axis=1)
+        expected = np.full(coords.shape[0], -1)
+        expected[inbound] = dense[coords[inbound, 2], coords[inbound, 1], coords[inbound, 0]]
+        assert np.array_equal(read, expected), f"get_many differs in round {round_index}"
+
+        # boxes spanning several chunks, partly out of bounds
+        minimum = random.integers(-20, WORLD_SIZE, 3)
+        maximum = minimum + random.integers(1, 3 * CHUNK_SIZE, 3)
+        value = int(random.choice(ids))
+        box = clip(minimum, maximum)
+        expected = np.count_nonzero(dense[box] != value)
+        dense[box] = value
+        start = time.perf_counter()
+        changed = world.fill_box(tuple(minimum.tolist()), tuple(maximum.tolist()), value)
+        seconds["fill_box"] += time.perf_counter() - start
+        assert changed == expected, f"fill_box changed count differs in round {round_index}"
+
+        # replace in a box, and in the whole world every few rounds
+        old, new = (int(block) for block in random.choice(ids, 2, replace=False))
+        region = None
+        box = (slice(None),) * 3
+        if round_index % 4:
+            minimum = random.integers(-20, WORLD_SIZE, 3)
+            region = (tuple(minimum.tolist()), tuple((minimum + random.integers(1, 4 * CHUNK_SIZE, 3)).tolist()))
+            box = clip(np.array(region[0]), np.array(region[1]))
+        part = dense[box]
+        expected = np.count_nonzero(part == old)
+        part[part == old] = new
+        start = time.perf_counter()
+        changed = world.replace(old, new, region)
+        seconds["replace"] += time.perf_counter() - start
+        assert changed == expected, f"replace changed count differs in round {round_index}"
+
+        assert np.array_equal(world.get_voxels(), dense.reshape(-1)), \
+            f"world differs from the dense array in round {round_index}"
+
+    print(f"{args.rounds} rounds of set_many, get_many, fill_box and replace; world matches the dense array")
+    print("; ".join(f"{name} {seconds[name] / args.rounds * 1e3:.1f}ms" for name in seconds))
+
+
+if __name__ == '__main__':
+    main()
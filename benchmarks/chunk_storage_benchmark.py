@@ -0,0 +1,109 @@
+"""
+Chunk storage benchmark file
+Run from the repository root: python -m benchmarks.chunk_storage_benchmark
+"""
+
+
+import time
+import argparse
+import tracemalloc
+import numpy as np
+from source.world import World, WorldGen
+from source.options import *
+from source.exceptions import *
+
+
+def timed(function, *args) -> tuple[object, float]:
+    """
+    Calls the function and times it
+    :param function: function to call
+    :param args: its arguments
+    :return: result of the function, and seconds it took
+    """
+
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compares memory and speed of the chunked world with a dense array of the same blocks")
+    parser.add_argument("--world", default=f"{SAVES_DIR}/debug.cubw", help="world save to compare with")
+    parser.add_argument("--seed", type=int, default=0, help="seed of generated world and positions")
+    parser.add_argument("--blocks", type=int, default=100000, help="amount of single block reads and writes")
+    parser.add_argument("--batch", type=int, default=1000000, help="amount of blocks read and written at once")
+    args = parser.parse_args()
+
+    world: World = World()
+    try:
+        world.load(args.world)
+        world.load_chunks()
+    except (WorldGenSizeError, WorldSaveError, FileNotFoundError):
+        world = WorldGen.generate_landscape(WORLD_SIZE // 2, 32, seed=args.seed)
+    dense = world.get_voxels()
+
+    # memory; traced allocations include the chunk objects and palettes, not only the packed data
+    tracemalloc.start()
+    chunked = World()
+    chunked.set_voxels(dense)
+    traced = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    mixed = sum(not isinstance(chunk, int) for chunk in chunked.chunks)
+    print(f"dense {dense.nbytes / 1024 ** 2:.2f} MiB; chunked {traced / 1024 ** 2:.2f} MiB traced, "
+          f"{chunked.nbytes / 1024 ** 2:.2f} MiB of block data; {dense.nbytes / traced:.1f}x smaller")
+    print(f"{mixed} of {len(chunked.chunks)} chunks hold more than one block")
+
+    random = np.random.default_rng(args.seed)
+    coords = random.integers(0, WORLD_SIZE, [args.blocks, 3])
+    values = random.integers(0, 6, args.blocks)
+    positions = [tuple(position) for position in coords.tolist()]
+    linear = (coords[:, 2] * WORLD_LAYER + coords[:, 1] * WORLD_SIZE + coords[:, 0]).tolist()
+
+    def dense_get():
+        return [dense[index] for index in linear]
+
+    def dense_set():
+        for index, value in zip(linear, values.tolist()):
+            dense[index] = value
+
+    def chunked_get():
+        return [chunked.get(position) for position in positions]
+
+    def chunked_set():
+        for position, value in zip(positions, values.tolist()):
+            chunked.set(position, value)
+
+    # single block access from python
+    dense_read, dense_seconds = timed(dense_get)
+    chunked_read, chunked_seconds = timed(chunked_get)
+    assert np.array_equal(dense_read, chunked_read), "chunked world reads differ from the dense array"
+    print(f"get: dense {args.blocks / dense_seconds / 1e6:.2f}M blocks/s, "
+          f"chunked {args.blocks / chunked_seconds / 1e6:.2f}M blocks/s")
+    _, dense_seconds = timed(dense_set)
+    _, chunked_seconds = timed(chunked_set)
+    print(f"set: dense {args.blocks / dense_seconds / 1e6:.2f}M blocks/s, "
+          f"chunked {args.blocks / chunked_seconds / 1e6:.2f}M blocks/s")
+
+    # batched access
+    coords = random.integers(0, WORLD_SIZE, [args.batch, 3])
+    values = random.integers(0, 6, args.batch).astype(np.uint8)
+    linear = coords[:, 2] * WORLD_LAYER + coords[:, 1] * WORLD_SIZE + coords[:, 0]
+    dense_read, dense_seconds = timed(dense.__getitem__, linear)
+    chunked_read, chunked_seconds = timed(chunked.get_many, coords)
+    assert np.array_equal(dense_read, chunked_read), "chunked world batch reads differ from the dense array"
+    print(f"get_many: dense {args.batch / dense_seconds / 1e6:.1f}M blocks/s, "
+          f"chunked {args.batch / chunked_seconds / 1e6:.1f}M blocks/s")
+    _, dense_seconds = timed(dense.__setitem__, linear, values)
+    _, chunked_seconds = timed(chunked.set_many, coords, values)
+    print(f"set_many: dense {args.batch / dense_seconds / 1e6:.1f}M blocks/s, "
+          f"chunked {args.batch / chunked_seconds / 1e6:.1f}M blocks/s")
+
+    # whole world in the shader layout
+    voxels, seconds = timed(chunked.get_voxels)
+    assert np.array_equal(voxels, dense), "chunked world differs from the dense array after the same writes"
+    print(f"get_voxels: {seconds * 1e3:.1f}ms; {dense.nbytes / seconds / 1024 ** 3:.2f} GiB/s")
+
+
+if __name__ == '__main__':
+    main()
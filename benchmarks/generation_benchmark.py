@@ -0,0 +1,127 @@
+"""
+World generation benchmark file
+Run from the repository root: python -m benchmarks.generation_benchmark
+"""
+
+
+import time
+import argparse
+import numpy as np
+from source.world import World, WorldGen
+from source.noise import Noise
+from source.blocks import *
+from source.options import *
+
+
+def generate(args: argparse.Namespace, processes: int) -> tuple[np.ndarray, float]:
+    """
+    Generates the landscape and times it
+    :param args: command line arguments
+    :param processes: amount of processes to generate with
+    :return: voxels of the generated world, and seconds it took
+    """
+
+    start = time.perf_counter()
+    world: World = WorldGen.generate_landscape(WORLD_SIZE // 2, 32, seed=args.seed, processes=processes)
+    seconds = time.perf_counter() - start
+    return world.get_voxels(), seconds
+
+
+def generate_loop(level: int, magnitude: float, seed: int) -> np.ndarray:
+    """
+    Generates the landscape block by block, the way the generator did before it was vectorized: columns are filled
+    one by one (Y then X), and every tree is placed right after the terrain of its column.
+    Random values are drawn from the same noise as 'WorldGen.generate_region', so the result must be identical
+    :param level: sea level
+    :param magnitude: magnitude
+    :param seed: world seed
+    :return: voxels in the 'World.get_voxels' layout
+    """
+
+    voxels = np.zeros(WORLD_SIZE ** 3, dtype=np.uint8)
+    named = Blocks.named
+
+    def set_block(position: tuple[int, int, int], value: int | str):
+        if isinstance(value, str):
+            value = named[value]
+        if (-1 < position[0] < WORLD_SIZE) and (-1 < position[1] < WORLD_SIZE) and (-1 < position[2] < WORLD_SIZE):
+            voxels[position[2] * WORLD_LAYER + position[1] * WORLD_SIZE + position[0]] = value
+
+    # columns around the world are generated too, so that their trees put leaves in
+    xs = np.arange(-1, WORLD_SIZE + 1, dtype=np.int64)[None, :]
+    ys = np.arange(-1, WORLD_SIZE + 1, dtype=np.int64)[:, None]
+    heights = ((Noise.fractal(Noise.value, seed, TERRAIN_OCTAVES, xs, ys) - 0.5) * magnitude + level).astype(np.int32)
+    bottom = level - CAVE_DEPTH
+    zs = np.arange(bottom, int(heights.max()))
+    caves = Noise.sparse_grid(
+        lambda *coords: Noise.fractal(Noise.perlin, seed, CAVE_OCTAVES, *coords, salt=-4),
+        CAVE_STEP, zs, ys.ravel(), xs.ravel()) > CAVE_THRESHOLD
+    trees = Noise.hash_random(seed, -1, xs, ys) > 0.9
+    tree_heights = (Noise.hash_random(seed, -2, xs, ys) * 4).astype(np.int32) + 3
+    leaves_heights = Noise.hash_random(seed, -3, xs, ys) * 2 + 1
+
+    for row, y in enumerate(range(-1, WORLD_SIZE + 1)):
+        for column, x in enumerate(range(-1, WORLD_SIZE + 1)):
+            height = int(heights[row, column])
+            for z in range(height):
+                if z == height - 1:  # grass
+                    set_block((x, y, z), "grass_block")
+                else:  # dirt
+                    set_block((x, y, z), "dirt_block")
+            for z in range(max(bottom, 0), height):
+                if caves[z - bottom, row, column]:
+                    set_block((x, y, z), 0)
+
+            # trees don't grow on top of caves
+            top = max(height - 1, 0)
+            if trees[row, column] and not (top >= bottom and caves[top - bottom, row, column]):
+                tree_height = int(tree_heights[row, column])
+                leaves_height = leaves_heights[row, column]
+                for i in range(tree_height):
+                    set_block((x, y, height + i), "oak_logs")
+                    if i >= leaves_height:
+                        set_block((x, y + 1, height + i), "oak_leaves")
+                        set_block((x, y - 1, height + i), "oak_leaves")
+                        set_block((x + 1, y, height + i), "oak_leaves")
+                        set_block((x - 1, y, height + i), "oak_leaves")
+                set_block((x, y, height + tree_height), "oak_leaves")
+    return voxels
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Generates the landscape, and compares it with block by block generation and with other seeds")
+    parser.add_argument("--seed", type=int, default=0, help="seed of generated world")
+    parser.add_argument("--repeats", type=int, default=3, help="amount of generations with the same seed")
+    parser.add_argument("--processes", type=int, default=None, help="amount of generation processes")
+    args = parser.parse_args()
+
+    # first generation is the reference; the rest, with any amount of processes, must be identical to it
+    reference, seconds = generate(args, 1)
+    fastest = seconds
+    print(f"seed {args.seed}, processes 1: {seconds:.2f}s; {WORLD_SIZE ** 3 / seconds / 1e6:.1f}M blocks/s")
+    for repeat in range(args.repeats - 1):
+        processes = args.processes if repeat % 2 == 0 else 1
+        voxels, seconds = generate(args, processes)
+        if processes == 1:
+            fastest = min(fastest, seconds)
+        print(f"seed {args.seed}, processes {processes or 'all'}: {seconds:.2f}s; "
+              f"{WORLD_SIZE ** 3 / seconds / 1e6:.1f}M blocks/s")
+        assert np.array_equal(voxels, reference), f"seed {args.seed} gave a different world on repeat {repeat + 2}"
+
+    # another seed must give another world
+    other = WorldGen.generate_landscape(WORLD_SIZE // 2, 32, seed=args.seed + 1, processes=args.processes)
+    assert not np.array_equal(other.get_voxels(), reference), f"seeds {args.seed} and {args.seed + 1} gave the same world"
+    print(f"{args.repeats} generations with seed {args.seed} are identical; seed {args.seed + 1} differs")
+
+    # block by block generation must give the same world
+    start = time.perf_counter()
+    looped = generate_loop(WORLD_SIZE // 2, 32, args.seed)
+    seconds = time.perf_counter() - start
+    assert np.array_equal(looped, reference), \
+        f"block by block generation differs in {np.count_nonzero(looped != reference)} blocks"
+    print(f"block by block: {seconds:.2f}s; same world, {seconds / fastest:.0f}x slower than one process")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+"""
+Headless meshing file
+Run from the repository root: python -m benchmarks.headless_meshing
+"""
+
+
+import time
+import argparse
+from source.world import World, WorldGen
+from source.options import *
+from source.exceptions import *
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Meshes the world on the CPU and reports the meshing speed")
+    parser.add_argument("--world", default=f"{SAVES_DIR}/debug.cubw", help="world save to mesh")
+    parser.add_argument("--seed", type=int, default=0, help="seed of generated world, when there is no save")
+    parser.add_argument("--batch", type=int, default=MESH_CHUNK_BUDGET, help="chunks meshed at once")
+    args = parser.parse_args()
+
+    world: World = World()
+    try:
+        world.load(args.world)
+    except (WorldGenSizeError, WorldSaveError, FileNotFoundError):
+        world = WorldGen.generate_landscape(WORLD_SIZE // 2, 32, seed=args.seed)
+
+    # chunks are read from the save before meshing, so that only the meshing is measured
+    world.load_chunks()
+    mesh = world.build_mesh()
+    chunks, faces, quads, seconds = 0, 0, 0, 0.0
+    start = time.perf_counter()
+    while mesh.update(args.batch):
+        chunks += mesh.meshed_chunks
+        faces += mesh.meshed_faces
+        quads += mesh.meshed_quads
+        seconds += mesh.meshed_seconds
+    print(f"{chunks} chunks in {time.perf_counter() - start:.2f}s; {seconds / chunks * 1e3:.3f}ms per chunk")
+    print(f"{faces} faces merged into {quads} quads; {faces / max(quads, 1):.2f} faces per quad")
+
+
+if __name__ == '__main__':
+    main()
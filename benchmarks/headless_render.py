@@ -0,0 +1,40 @@
+"""
+Headless render file
+Run from the repository root: python -m benchmarks.headless_render
+"""
+
+
+import math
+import argparse
+from source.world import World, WorldGen
+from source.options import *
+from source.renderer import CPURenderer
+from source.exceptions import *
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Renders a frame of the world without a window")
+    parser.add_argument("output", help="image filename")
+    parser.add_argument("--world", default=f"{SAVES_DIR}/debug.cubw", help="world save to render")
+    parser.add_argument("--resolution", type=int, nargs=2, default=WINDOW_RESOLUTION, metavar=("WIDTH", "HEIGHT"))
+    parser.add_argument("--position", type=float, nargs=3, default=(128, 100, 150), metavar=("X", "Y", "Z"))
+    parser.add_argument("--rotation", type=float, nargs=2, default=(-0.4, 0.3), metavar=("PITCH", "YAW"))
+    parser.add_argument("--aov", type=float, default=90, help="angle of view in degrees")
+    parser.add_argument("--processes", type=int, default=None, help="amount of rendering processes")
+    parser.add_argument("--seed", type=int, default=0, help="seed of generated world, when there is no save")
+    args = parser.parse_args()
+
+    world: World = World()
+    try:
+        world.load(args.world)
+    except (WorldGenSizeError, WorldSaveError, FileNotFoundError):
+        world = WorldGen.generate_landscape(WORLD_SIZE // 2, 32, seed=args.seed)
+
+    renderer = CPURenderer(world, tuple(args.resolution))
+    renderer.render_to_file(
+        args.output, args.position, args.rotation, 1 / math.tan(math.radians(args.aov) / 2), args.processes)
+    print(f"{renderer.rays} rays in {renderer.seconds:.2f}s; {renderer.rays_per_second:.0f} rays/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Import time benchmark file
+Run from the repository root: python -m benchmarks.import_time_check
+"""
+
+
+import os
+import sys
+import argparse
+import subprocess
+
+
+# max import time of every module in milliseconds, and modules it must not import
+IMPORT_BUDGETS: dict[str, tuple[float, tuple[str, ...]]] = {
+    "source.options": (50, ("numpy", "arcade", "pyglet", "scipy", "PIL")),
+    "source.blocks": (200, ("arcade", "pyglet", "scipy", "PIL")),
+    "source.world": (200, ("arcade", "pyglet", "scipy", "PIL")),
+    "source.application": (1000, ()),
+}
+
+
+def measure(module: str) -> tuple[float, set[str]]:
+    """
+    Imports the module in a new interpreter
+    :param module: module name
+    :return: import time in milliseconds as reported by '-X importtime', and names of all imported top level modules
+    """
+
+    # arcade is headless, so that the application imports without a display
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import sys, {module}; print(' '.join(sys.modules))"],
+        capture_output=True, text=True, env={**os.environ, "ARCADE_HEADLESS": "1"}, check=True)
+
+    # lines are 'import time: self | cumulative | name', in microseconds
+    for line in result.stderr.splitlines():
+        fields = line.split("|")
+        if len(fields) == 3 and fields[2].strip() == module:
+            return int(fields[1]) / 1000, {name.split(".")[0] for name in result.stdout.split()}
+    raise RuntimeError(f"No import time reported for '{module}'")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Times imports of the game modules, and fails when they go over budget")
+    parser.add_argument("--repeats", type=int, default=5, help="amount of imports of every module; the fastest is used")
+    args = parser.parse_args()
+
+    failed = []
+    for module, (budget, forbidden) in IMPORT_BUDGETS.items():
+        results = [measure(module) for _ in range(args.repeats)]
+        milliseconds = min(result[0] for result in results)
+        imported = sorted(results[0][1].intersection(forbidden))
+        print(f"{module}: {milliseconds:.1f}ms of {budget}ms" + (f"; imports {', '.join(imported)}" if imported else ""))
+        if milliseconds > budget:
+            failed.append(f"{module} takes {milliseconds:.1f}ms to import, over the {budget}ms budget")
+        if imported:
+            failed.append(f"{module} imports {', '.join(imported)}")
+
+    if failed:
+        sys.exit("\n".join(failed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+Sun lightmap check file
+Run from the repository root: python -m benchmarks.lightmap_check
+"""
+
+
+import time
+import argparse
+import tempfile
+import numpy as np
+from source.world import WorldGen
+from source.lightmap import SunLightmap
+from source.regions import RegionStreamer
+from source.options import *
+
+
+def check(lightmap: SunLightmap, copy: np.ndarray, name: str) -> float:
+    """
+    Compares the lightmap with a whole sweep of its world, and its copy kept up to date from the changed ranges
+    :param lightmap: updated lightmap
+    :param copy: flat copy of the lightmap; changed ranges are written to it
+    :param name: what was done to the world, for the messages
+    :return: seconds the whole sweep took
+    """
+
+    for start, end in lightmap.pop_changed_ranges():
+        copy[start:end] = lightmap.get_linear(start, end)
+    begin = time.perf_counter()
+    built = SunLightmap(lightmap.world, lightmap.world.sun, lightmap.offset)
+    seconds = time.perf_counter() - begin
+    assert np.array_equal(lightmap.light, built.light), \
+        f"lightmap after {name} differs from a whole sweep in {np.count_nonzero(lightmap.light != built.light)} blocks"
+    assert np.array_equal(copy, built.light.reshape(-1)), f"changed ranges after {name} miss some changes"
+    return seconds
+
+
+def box(random: np.random.Generator, size: int) -> tuple[tuple[int, int, int], tuple[int, int, int]]:
+    """
+    Random box within the world
+    :param random: random generator
+    :param size: box size
+    :return: min and max box corners
+    """
+
+    minimum = random.integers(0, WORLD_SIZE - size, 3)
+    return tuple(minimum.tolist()), tuple((minimum + size).tolist())
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Edits the world and compares the incrementally updated sun lightmap with whole sweeps")
+    parser.add_argument("--seed", type=int, default=0, help="seed of generated world and edits")
+    parser.add_argument("--edits", type=int, default=10, help="amount of edits of every kind")
+    args = parser.parse_args()
+
+    random = np.random.default_rng(args.seed)
+    world = WorldGen.generate_landscape(WORLD_SIZE // 2, 32, seed=args.seed)
+
+    # the world is lit as it is, and as a window wrapped around its origin
+    for offset in ((0, 0, 0), (WINDOW_STEP, 3 * WINDOW_STEP, 0)):
+        lightmap = world.build_lightmap(offset)
+        copy = lightmap.light.reshape(-1).copy()
+        lightmap.pop_changed_ranges()
+        edits = {
+            "single blocks": lambda: world.set(tuple(random.integers(0, WORLD_SIZE, 3).tolist()), "oak_planks"),
+            "batches": lambda: world.set_many(
+                random.integers(0, WORLD_SIZE, [4, 3]) + random.integers(-4, 5, [50, 1, 3]), "oak_leaves"),
+            "removed boxes": lambda: world.fill_box(*box(random, 12), 0),
+            "large boxes": lambda: world.fill_box(*box(random, 6 * CHUNK_SIZE), "dirt_block"),
+        }
+        for name, edit in edits.items():
+            update_seconds, build_seconds = 0.0, 0.0
+            for _ in range(args.edits):
+                edit()
+                begin = time.perf_counter()
+                lightmap.update()
+                update_seconds += time.perf_counter() - begin
+                build_seconds += check(lightmap, copy, f"{name} with offset {offset}")
+            print(f"offset {offset[:2]}, {name}: update {update_seconds / args.edits * 1e3:.1f}ms, "
+                  f"whole sweep {build_seconds / args.edits * 1e3:.1f}ms; same light")
+
+    # streamed window; whole sweeps run on the streamer threads after the window moves
+    with tempfile.TemporaryDirectory() as directory:
+        regions = RegionStreamer(directory, seed=args.seed, autosave_interval=0)
+        position = [WORLD_SIZE / 2, WORLD_SIZE / 2, WORLD_SIZE / 2]
+        regions.update(tuple(position), wait=True)
+        lightmap = regions.window.lightmap
+        lightmap.update(wait=True)
+        copy = lightmap.light.reshape(-1).copy()
+        lightmap.pop_changed_ranges()
+        for axis, step in ((0, WINDOW_STEP), (1, WINDOW_STEP), (0, -WINDOW_STEP), (1, -2 * WINDOW_STEP)):
+            position[axis] += step
+            regions.update(tuple(position), wait=True)
+            coords = random.integers(0, WORLD_SIZE, [50, 3])
+            coords[:, :2] += regions.origin
+            regions.set_many(coords, "oak_planks")
+            lightmap.update(wait=True)
+            check(lightmap, copy, f"window move to {regions.origin}")
+        regions.close()
+        print(f"window moves with edits: swept light matches whole sweeps at offset {regions.offset[:2]}")
+
+
+if __name__ == '__main__':
+    main()
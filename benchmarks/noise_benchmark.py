@@ -0,0 +1,103 @@
+"""
+Noise benchmark file
+Run from the repository root: python -m benchmarks.noise_benchmark
+"""
+
+
+import time
+import argparse
+import numpy as np
+from collections.abc import Callable
+from source.noise import Noise
+from source.options import *
+
+
+def on_grid(noise: Callable[..., np.ndarray]) -> Callable[[list[np.ndarray]], np.ndarray]:
+    """
+    Makes a noise function evaluate on a grid of 1D axes, like 'Noise.sparse_grid' does
+    :param noise: noise function taking broadcast coordinates of every axis
+    :return: function taking a list of 1D integer coordinates of every axis
+    """
+
+    return lambda axes: noise(*[
+        axis.reshape([axis.size if other == index else 1 for other in range(len(axes))])
+        for index, axis in enumerate(axes)])
+
+
+def make_noises(seed: int) -> dict[str, tuple[int, Callable[[list[np.ndarray]], np.ndarray]]]:
+    """
+    Makes the basic noises, and the terrain and cave noises of the world generation
+    :param seed: random seed
+    :return: amount of axes and grid function of every noise
+    """
+
+    return {
+        "value 2D": (2, on_grid(lambda *coords: Noise.value(seed, 16, *coords))),
+        "perlin 2D": (2, on_grid(lambda *coords: Noise.perlin(seed, 16, *coords))),
+        "perlin 3D": (3, on_grid(lambda *coords: Noise.perlin(seed, 16, *coords))),
+        "terrain": (2, on_grid(lambda *coords: Noise.fractal(Noise.value, seed, TERRAIN_OCTAVES, *coords))),
+        "caves": (3, lambda axes: Noise.sparse_grid(
+            lambda *coords: Noise.fractal(Noise.perlin, seed, CAVE_OCTAVES, *coords, salt=-4), CAVE_STEP, *axes)),
+    }
+
+
+def check_borders(grid: Callable[[list[np.ndarray]], np.ndarray], starts: np.ndarray) -> float:
+    """
+    Evaluates two neighbouring chunk windows along every axis, and checks that they line up: the shared border
+    has the same values in both windows, and both windows together are the same as one window covering both
+    :param grid: grid function of the noise
+    :param starts: world coordinates of the first window corner, for every axis
+    :return: largest change between neighbouring values across the border, relative to the largest change
+             within the windows
+    """
+
+    ratio = 0.0
+    for axis in range(starts.size):
+        def window(start: int, size: int) -> np.ndarray:
+            return grid([
+                np.arange(start, start + size) if other == axis else np.arange(begin, begin + CHUNK_SIZE)
+                for other, begin in enumerate(starts.tolist())])
+
+        # first window includes the border of the second one
+        first = window(int(starts[axis]), CHUNK_SIZE + 1)
+        second = window(int(starts[axis]) + CHUNK_SIZE, CHUNK_SIZE)
+        both = window(int(starts[axis]), 2 * CHUNK_SIZE)
+        border = np.take(first, [CHUNK_SIZE], axis=axis)
+        assert np.array_equal(border, np.take(second, [0], axis=axis)), f"border along axis {axis} doesn't line up"
+        assert np.array_equal(np.concatenate([np.delete(first, CHUNK_SIZE, axis=axis), second], axis=axis), both), \
+            f"windows along axis {axis} differ from a window covering both"
+
+        # the noise is as smooth across the border as it is within the windows
+        changes = np.abs(np.diff(both, axis=axis))
+        across = np.take(changes, [CHUNK_SIZE - 1], axis=axis).max()
+        ratio = max(ratio, across / max(np.delete(changes, CHUNK_SIZE - 1, axis=axis).max(), 1e-12))
+    return ratio
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Times the noise functions, and checks that chunk borders line up")
+    parser.add_argument("--seed", type=int, default=0, help="noise seed")
+    parser.add_argument("--windows", type=int, default=20, help="amount of random chunk window pairs checked")
+    parser.add_argument("--size", type=int, default=WORLD_SIZE, help="size of the 2D throughput grid")
+    parser.add_argument("--depth", type=int, default=64, help="height of the 3D throughput grid")
+    args = parser.parse_args()
+
+    random = np.random.default_rng(args.seed)
+    for name, (dimensions, grid) in make_noises(args.seed).items():
+        # windows at random places, including negative coordinates and places off the lattice
+        ratio = 0.0
+        for _ in range(args.windows):
+            ratio = max(ratio, check_borders(grid, random.integers(-4 * WORLD_SIZE, 4 * WORLD_SIZE, dimensions)))
+        assert ratio < 2, f"{name} noise jumps at chunk borders"
+
+        # throughput on a region sized grid
+        axes = [np.arange(args.size)] * 2 if dimensions == 2 else [np.arange(args.depth)] + [np.arange(args.size)] * 2
+        start = time.perf_counter()
+        values = grid(axes)
+        seconds = time.perf_counter() - start
+        print(f"{name}: {values.size / seconds / 1e6:.1f}M samples/s; borders of {args.windows * dimensions} "
+              f"chunk pairs line up, largest change across them is {ratio:.2f}x the largest within")
+
+
+if __name__ == '__main__':
+    main()
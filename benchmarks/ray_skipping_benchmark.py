@@ -0,0 +1,118 @@
+"""
+Empty space skipping benchmark file
+Run from the repository root: python -m benchmarks.ray_skipping_benchmark
+"""
+
+
+import os
+import time
+import argparse
+import tempfile
+import numpy as np
+from source.world import World, WorldGen, Ray, VoxelLookup
+from source.occupancy import OccupancyPyramid
+from source.options import *
+from source.exceptions import *
+
+
+def make_rays(random: np.random.Generator, amount: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Makes rays starting above the ground, like rays of a camera flying over the landscape.
+    Every tenth ray goes along an axis, so that rays parallel to some axes are covered too
+    :param random: random generator
+    :param amount: amount of rays
+    :return: arrays of ray origins and normalized directions with shape (N, 3)
+    """
+
+    origins = random.uniform((0, 0, WORLD_CENTER), (WORLD_SIZE, WORLD_SIZE, WORLD_SIZE), [amount, 3])
+    directions = random.normal(size=[amount, 3])
+    axes = np.arange(0, amount, 10)
+    directions[axes] = 0
+    directions[axes, random.integers(0, 3, axes.size)] = random.choice([-1, 1], axes.size)
+    return origins, directions / np.linalg.norm(directions, axis=1, keepdims=True)
+
+
+def check_occupancy(world: World, name: str):
+    """
+    Compares the occupancy pyramid of the world with one built from scratch
+    :param world: world with an occupancy pyramid
+    :param name: what was done to the world, for the messages
+    """
+
+    fresh = OccupancyPyramid(world)
+    for level, (kept, built) in enumerate(zip(world.occupancy.levels, fresh.levels)):
+        assert np.array_equal(kept, built), \
+            f"occupancy level {level} after {name} has {np.count_nonzero(kept)} occupied bricks, " \
+            f"a fresh build has {np.count_nonzero(built)}"
+    print(f"occupancy after {name} matches a fresh build; {np.count_nonzero(fresh.levels[0])} occupied fine bricks")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Casts rays with and without the occupancy pyramid, and compares their hits and steps")
+    parser.add_argument("--world", default=f"{SAVES_DIR}/debug.cubw", help="world save to cast rays in")
+    parser.add_argument("--seed", type=int, default=0, help="seed of generated world and rays")
+    parser.add_argument("--rays", type=int, default=1000, help="amount of rays cast one by one")
+    parser.add_argument("--batch", type=int, default=20000, help="amount of rays cast at once")
+    args = parser.parse_args()
+
+    world: World = World()
+    try:
+        world.load(args.world)
+        world.load_chunks()
+    except (WorldGenSizeError, WorldSaveError, FileNotFoundError):
+        world = WorldGen.generate_landscape(WORLD_SIZE // 2, 32, seed=args.seed)
+    world.build_occupancy()
+    random = np.random.default_rng(args.seed)
+
+    # pyramid is rebuilt when the whole world is replaced; rays below rely on it
+    voxels = world.get_voxels()
+    world.set_voxels(WorldGen.generate_landscape(WORLD_SIZE // 2, 32, seed=args.seed + 1).get_voxels())
+    world.set_voxels(voxels)
+    check_occupancy(world, "set_voxels")
+    with tempfile.TemporaryDirectory() as directory:
+        world.save(os.path.join(directory, "world.cubw"))
+        world.set_voxels(np.zeros_like(voxels))
+        world.load(os.path.join(directory, "world.cubw"))
+        check_occupancy(world, "load")
+        world.load_chunks()
+
+    # one by one; the block by block traversal is the reference, skipping must end every ray, hit or missed,
+    # at exactly the same block and length
+    origins, directions = make_rays(random, args.rays)
+    steps, seconds = {False: 0, True: 0}, {False: 0.0, True: 0.0}
+    hits = 0
+    for origin, direction in zip(origins.tolist(), directions.tolist()):
+        rays = {}
+        for skipping in (False, True):
+            start = time.perf_counter()
+            rays[skipping] = Ray(origin, direction).cast(world, skipping=skipping)
+            seconds[skipping] += time.perf_counter() - start
+            steps[skipping] += rays[skipping].steps
+        flat, skipped = rays[False], rays[True]
+        assert (flat.block, flat.integer_position, flat.length, flat.float_position) == (
+            skipped.block, skipped.integer_position, skipped.length, skipped.float_position), \
+            f"ray {origin} {direction} ended differently with skipping"
+        hits += flat.block > 0
+    print(f"{args.rays} rays, {hits} hits; same results with and without skipping")
+    print(f"steps per ray: {steps[False] / args.rays:.1f} block by block, {steps[True] / args.rays:.1f} skipping; "
+          f"{steps[False] / steps[True]:.1f}x fewer")
+    print(f"cast: {args.rays / seconds[False]:.0f} rays/s block by block, {args.rays / seconds[True]:.0f} rays/s "
+          f"skipping")
+
+    # all at once
+    origins, directions = make_rays(random, args.batch)
+    lookup = VoxelLookup(world)
+    results, seconds = {}, {}
+    for skipping in (False, True):
+        start = time.perf_counter()
+        results[skipping] = Ray.cast_many(world, origins, directions, lookup=lookup, skipping=skipping)
+        seconds[skipping] = time.perf_counter() - start
+    for flat, skipped, name in zip(results[False], results[True], ("blocks", "positions", "float positions", "lengths")):
+        assert np.array_equal(flat, skipped), f"rays cast at once ended at different {name} with skipping"
+    print(f"cast_many: {args.batch / seconds[False]:.0f} rays/s block by block, "
+          f"{args.batch / seconds[True]:.0f} rays/s skipping; same results")
+
+
+if __name__ == '__main__':
+    main()
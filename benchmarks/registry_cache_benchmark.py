@@ -0,0 +1,91 @@
+"""
+Block registry startup benchmark file
+Run from the repository root: python -m benchmarks.registry_cache_benchmark
+"""
+
+
+import os
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+from source.blocks import BlockRegistry
+from source.options import *
+
+
+def start(cache_filename: str) -> tuple[BlockRegistry, float]:
+    """
+    Loads a new block registry, like the game does on start
+    :param cache_filename: registry cache filename
+    :return: loaded registry, and seconds it took
+    """
+
+    registry = BlockRegistry(cache_filename)
+    begin = time.perf_counter()
+    registry.load()
+    return registry, time.perf_counter() - begin
+
+
+def same(registry: BlockRegistry, other: BlockRegistry) -> bool:
+    """
+    Compares blocks and textures of two registries
+    """
+
+    return (
+        registry.named == other.named and np.array_equal(registry.faces, other.faces) and
+        np.array_equal(registry.atlas.layers, other.atlas.layers) and registry.atlas.names == other.atlas.names)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Times block registry loads without and with the cache, and checks that the cache is rebuilt "
+                    "when the assets change")
+    parser.add_argument("--repeats", type=int, default=5, help="amount of starts of each kind; the fastest is shown")
+    args = parser.parse_args()
+
+    # assets are copied, so that they can be changed without touching the real ones
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as directory:
+        shutil.copytree(TEXTURE_DIR, os.path.join(directory, TEXTURE_DIR))
+        os.chdir(directory)
+        files = BlockRegistry.asset_files()
+
+        # cold start; assets are decoded, packed and written to the cache
+        cold_seconds = []
+        for _ in range(args.repeats):
+            if os.path.exists(BLOCK_CACHE):
+                os.remove(BLOCK_CACHE)
+            cold, seconds = start(BLOCK_CACHE)
+            assert cold.mmap is None, "cold start read a cache"
+            cold_seconds.append(seconds)
+
+        # cached start; cache is mapped
+        cached_seconds = []
+        for _ in range(args.repeats):
+            cached, seconds = start(BLOCK_CACHE)
+            assert cached.mmap is not None, "cached start didn't read the cache"
+            assert same(cached, cold), "cached registry differs from the one built from the assets"
+            cached_seconds.append(seconds)
+        print(f"{len(files)} asset files; cache is {os.path.getsize(BLOCK_CACHE) / 1024:.1f} KiB")
+        print(f"first cold start, importing Pillow, {cold_seconds[0] * 1e3:.1f}ms")
+        print(f"cold start {min(cold_seconds) * 1e3:.1f}ms, cached start {min(cached_seconds) * 1e3:.1f}ms; "
+              f"{min(cold_seconds) / min(cached_seconds):.1f}x faster")
+
+        # changed texture; the cache must be rebuilt with the new texture
+        from PIL import Image
+        texture = next(file for file in files if file.endswith(".png"))
+        with Image.open(texture) as image:
+            image = image.convert("RGBA")
+        image.putpixel((0, 0), tuple(255 - channel for channel in image.getpixel((0, 0))[:3]) + (255,))
+        image.save(texture)
+
+        changed, seconds = start(BLOCK_CACHE)
+        assert changed.mmap is None, "cache wasn't rebuilt after an asset changed"
+        assert not np.array_equal(changed.atlas.layers, cold.atlas.layers), "rebuilt registry has the old texture"
+        reloaded, _ = start(BLOCK_CACHE)
+        assert reloaded.mmap is not None and same(reloaded, changed), "rebuilt cache doesn't match the changed assets"
+        print(f"changed '{texture}'; cache rebuilt in {seconds * 1e3:.1f}ms and read back on the next start")
+
+
+if __name__ == '__main__':
+    main()
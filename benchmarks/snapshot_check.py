@@ -0,0 +1,99 @@
+"""
+World snapshot and undo check file
+Run from the repository root: python -m benchmarks.snapshot_check
+"""
+
+
+import os
+import time
+import argparse
+import tempfile
+import numpy as np
+from source.world import World, WorldGen
+from source.regions import RegionStreamer
+from source.snapshots import WorldHistory
+from source.options import *
+from source.exceptions import *
+
+
+def edit(world: World, random: np.random.Generator, blocks: int):
+    """
+    Changes the world with every kind of edit: single blocks, batches, boxes and replacements
+    :param world: world to change
+    :param random: random generator
+    :param blocks: amount of single blocks and of batched blocks set
+    """
+
+    for position in random.integers(0, WORLD_SIZE, [blocks, 3]).tolist():
+        world.set(tuple(position), int(random.integers(0, 6)))
+    world.set_many(random.integers(0, WORLD_SIZE, [blocks, 3]), "oak_planks")
+    corner = random.integers(0, WORLD_SIZE - 64, 3)
+    world.fill_box(tuple(corner.tolist()), tuple((corner + random.integers(1, 64, 3)).tolist()), "dirt_block")
+    world.replace("grass_block", "oak_leaves")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Checks that snapshots keep the world as it was when they were taken, and that undo restores it")
+    parser.add_argument("--world", default=f"{SAVES_DIR}/debug.cubw", help="world save to edit")
+    parser.add_argument("--seed", type=int, default=0, help="seed of generated world and edits")
+    parser.add_argument("--steps", type=int, default=5, help="amount of edits undone")
+    parser.add_argument("--blocks", type=int, default=2000, help="amount of blocks set by every edit")
+    args = parser.parse_args()
+
+    world: World = World()
+    try:
+        world.load(args.world)
+        world.load_chunks()
+    except (WorldGenSizeError, WorldSaveError, FileNotFoundError):
+        world = WorldGen.generate_landscape(WORLD_SIZE // 2, 32, seed=args.seed)
+    random = np.random.default_rng(args.seed)
+
+    # snapshot keeps the blocks it was taken with, in memory and when saved, while the world changes after it
+    before = world.get_voxels()
+    start = time.perf_counter()
+    snapshot = world.snapshot()
+    seconds = time.perf_counter() - start
+    edit(world, random, args.blocks)
+    assert not np.array_equal(world.get_voxels(), before), "edits didn't change the world"
+    assert np.array_equal(snapshot.get_voxels(), before), "snapshot changed with the world"
+    with tempfile.TemporaryDirectory() as directory:
+        snapshot.save(os.path.join(directory, "snapshot.cubw"))
+        saved = World()
+        saved.load(os.path.join(directory, "snapshot.cubw"))
+        assert np.array_equal(saved.get_voxels(), before), "saved snapshot differs from the world it was taken of"
+    print(f"snapshot taken in {seconds * 1e3:.2f}ms; kept the world after edits, and saved it unchanged")
+
+    # every undo brings back the world as it was before the edit
+    history = WorldHistory(limit=2 ** 40)
+    states = [world.get_voxels()]
+    for _ in range(args.steps):
+        history.record([world])
+        edit(world, random, args.blocks)
+        states.append(world.get_voxels())
+    print(f"{args.steps} edits; history keeps {history.nbytes / 1024 ** 2:.2f} MiB, "
+          f"the world {world.nbytes / 1024 ** 2:.2f} MiB")
+    for state in reversed(states[:-1]):
+        assert history.undo(), "nothing to undo"
+        assert np.array_equal(world.get_voxels(), state), "undo didn't restore the world"
+    assert not history.undo(), "history has more steps than edits"
+    assert np.array_equal(snapshot.get_voxels(), before), "snapshot changed after undo"
+    print(f"{args.steps} undos restored the world exactly")
+
+    # streamed world; undo restores the region and the window
+    with tempfile.TemporaryDirectory() as directory:
+        regions = RegionStreamer(directory, seed=args.seed, autosave_interval=0)
+        regions.update((WORLD_CENTER, WORLD_CENTER, WORLD_SIZE), wait=True)
+        region = regions.regions[(0, 0)]
+        region_before, window_before = region.get_voxels(), regions.window.get_voxels()
+        coords = random.integers(0, WORLD_SIZE, [args.blocks, 3])
+        assert regions.set_many(coords, "oak_planks"), "edit didn't change the region"
+        assert regions.undo(), "nothing to undo"
+        assert np.array_equal(region.get_voxels(), region_before), "undo didn't restore the region"
+        assert np.array_equal(regions.window.get_voxels(), window_before), "undo didn't restore the window"
+        regions.close()
+    print("undo restored the streamed region and its window")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""
+World save file check file
+Run from the repository root: python -m benchmarks.storage_check
+"""
+
+
+import os
+import time
+import argparse
+import tempfile
+import numpy as np
+from source.world import World, WorldGen
+from source.storage import *
+from source.options import *
+from source.exceptions import *
+
+
+def loaded(world: World) -> int:
+    """
+    Counts chunks read from the save file
+    :param world: world loaded from a save file
+    :return: amount of chunks that are no longer None
+    """
+
+    return sum(chunk is not None for chunk in world.chunks)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compares save file size with a dense numpy save, and checks that chunks are read when asked for")
+    parser.add_argument("--world", default=f"{SAVES_DIR}/debug.cubw", help="world save to compare with")
+    parser.add_argument("--seed", type=int, default=0, help="seed of generated world and positions")
+    parser.add_argument("--reads", type=int, default=20, help="amount of chunks read from a loaded world")
+    args = parser.parse_args()
+
+    world: World = World()
+    try:
+        world.load(args.world)
+        world.load_chunks()
+    except (WorldGenSizeError, WorldSaveError, FileNotFoundError):
+        world = WorldGen.generate_landscape(WORLD_SIZE // 2, 32, seed=args.seed)
+    dense = world.get_voxels()
+
+    with tempfile.TemporaryDirectory() as directory:
+        # size of the saves; the dense save is the old format, a raw numpy array
+        filenames = {
+            "numpy": os.path.join(directory, "world.npy"),
+            "zlib": os.path.join(directory, "world_zlib.cubw"),
+            "lzma": os.path.join(directory, "world_lzma.cubw")}
+        start = time.perf_counter()
+        np.save(filenames["numpy"], dense)
+        seconds = {"numpy": time.perf_counter() - start}
+        for name, codec in (("zlib", CODEC_ZLIB), ("lzma", CODEC_LZMA)):
+            start = time.perf_counter()
+            world.save(filenames[name], codec)
+            seconds[name] = time.perf_counter() - start
+        sizes = {name: os.path.getsize(filename) for name, filename in filenames.items()}
+        for name in ("zlib", "lzma"):
+            assert sizes[name] * 10 < sizes["numpy"], \
+                f"{name} save of {sizes[name]} bytes isn't 10x smaller than the numpy save of {sizes['numpy']} bytes"
+        print("; ".join(
+            f"{name} {sizes[name] / 1024:.0f} KiB, saved in {seconds[name] * 1e3:.0f}ms, "
+            f"{sizes['numpy'] / sizes[name]:.0f}x smaller" for name in ("zlib", "lzma")) +
+            f"; numpy {sizes['numpy'] / 1024:.0f} KiB, saved in {seconds['numpy'] * 1e3:.0f}ms")
+
+        # loading reads only the header and the chunk index; every save gives back the same blocks
+        for name, filename in filenames.items():
+            start = time.perf_counter()
+            lazy = World()
+            lazy.load(filename)
+            load_seconds = time.perf_counter() - start
+            if name != "numpy":
+                assert loaded(lazy) == 0, f"loading the {name} save read {loaded(lazy)} chunks"
+            start = time.perf_counter()
+            lazy.load_chunks()
+            read_seconds = time.perf_counter() - start
+            assert np.array_equal(lazy.get_voxels(), dense), f"{name} save loaded different blocks"
+            print(f"{name}: loaded in {load_seconds * 1e3:.1f}ms, all chunks read in {read_seconds * 1e3:.1f}ms; "
+                  f"same blocks")
+
+        # chunks whose blocks are asked for are the only ones read from the file by 'SaveFile.read_chunk'
+        random = np.random.default_rng(args.seed)
+        lazy = World()
+        lazy.load(filenames["zlib"])
+        asked = set()
+        start = time.perf_counter()
+        for chunk_index in random.choice(WORLD_CHUNKS ** 3, args.reads, replace=False).tolist():
+            chunk_y, chunk_x = divmod(chunk_index, WORLD_CHUNKS)
+            chunk_z, chunk_y = divmod(chunk_y, WORLD_CHUNKS)
+            position = (chunk_x * CHUNK_SIZE + 3, chunk_y * CHUNK_SIZE + 5, chunk_z * CHUNK_SIZE + 7)
+            block = lazy.get(position)
+            assert block == dense[(position[2] * WORLD_SIZE + position[1]) * WORLD_SIZE + position[0]], \
+                f"block at {position} differs"
+            asked.add(chunk_index)
+        seconds = time.perf_counter() - start
+        assert {chunk_index for chunk_index, chunk in enumerate(lazy.chunks) if chunk is not None} == asked, \
+            "chunks that weren't asked for were read"
+        print(f"{args.reads} blocks of a loaded world read {loaded(lazy)} of {len(lazy.chunks)} chunks, "
+              f"{seconds / args.reads * 1e3:.2f}ms per block")
+
+        # saving a loaded world copies the chunks that weren't read as they are, without decompressing them
+        copy = os.path.join(directory, "copy.cubw")
+        lazy.save(copy)
+        assert loaded(lazy) == args.reads, f"saving read {loaded(lazy) - args.reads} more chunks"
+        with open(copy, "rb") as file, open(filenames["zlib"], "rb") as original:
+            assert file.read() == original.read(), "save of a loaded world differs from the file it was loaded from"
+        print("saving the loaded world read no more chunks, and gave the same file")
+        lazy.close_source()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+World sync benchmark file
+Run from the repository root: python -m benchmarks.sync_benchmark
+"""
+
+
+import time
+import asyncio
+import argparse
+import numpy as np
+from source.world import World, WorldGen
+from source.sync import WorldSyncServer, WorldSyncClient
+from source.options import *
+from source.exceptions import *
+
+
+async def benchmark(world: World, args: argparse.Namespace):
+    """
+    Serves the world to local viewers, edits it, and reports the sync costs
+    :param world: world to serve
+    :param args: command line arguments
+    """
+
+    server = WorldSyncServer(world)
+    await server.start(path=args.unix)
+    address = {"path": args.unix} if args.unix else {"port": server.address[1]}
+
+    # viewers subscribe to the whole world
+    start = time.perf_counter()
+    clients = [WorldSyncClient() for _ in range(args.clients)]
+    tasks = []
+    for client in clients:
+        await client.connect(**address)
+        await client.subscribe()
+        tasks.append(asyncio.create_task(client.run()))
+    for client in clients:
+        await client.synced.wait()
+    subscribed = server.sent_bytes
+    print(f"{args.clients} viewers subscribed in {time.perf_counter() - start:.2f}s; "
+          f"{subscribed / args.clients / 1024:.0f} KiB per viewer")
+
+    # single block edits spread over time
+    random = np.random.default_rng(args.seed)
+    coords = random.integers(0, WORLD_SIZE, [args.edits, 3])
+    values = random.integers(1, 6, args.edits)
+    for number in range(args.edits):
+        world.set(tuple(coords[number].tolist()), int(values[number]))
+        if number % args.batch == args.batch - 1:
+            await asyncio.sleep(args.batch / args.rate)
+
+    # wait for the viewers to catch up
+    while server.changes.since is not None or any(
+            viewer.since is not None or viewer.writer.transport.get_write_buffer_size()
+            for viewer in server.viewers):
+        await asyncio.sleep(SYNC_INTERVAL)
+    await asyncio.sleep(SYNC_INTERVAL * 4)
+
+    latencies = np.concatenate([client.latencies for client in clients]) * 1e3
+    voxels = world.get_voxels()
+    matching = sum(np.array_equal(client.world.get_voxels(), voxels) for client in clients)
+    print(f"{args.edits} edits; {(server.sent_bytes - subscribed) / args.clients / args.edits:.2f} bytes per edit "
+          f"per viewer")
+    print(f"latency {latencies.mean():.1f}ms mean, {np.percentile(latencies, 99):.1f}ms p99")
+    print(f"{matching} of {args.clients} viewers match the world")
+
+    for client in clients:
+        await client.close()
+    await asyncio.gather(*tasks)
+    await server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shares the world with local viewers and reports the sync costs")
+    parser.add_argument("--world", default=f"{SAVES_DIR}/debug.cubw", help="world save to share")
+    parser.add_argument("--seed", type=int, default=0, help="seed of generated world and edits")
+    parser.add_argument("--clients", type=int, default=8, help="amount of viewers")
+    parser.add_argument("--edits", type=int, default=10000, help="amount of single block edits")
+    parser.add_argument("--rate", type=float, default=5000, help="edits per second")
+    parser.add_argument("--batch", type=int, default=50, help="edits made at once")
+    parser.add_argument("--unix", default=None, help="unix socket path; localhost TCP when not given")
+    args = parser.parse_args()
+
+    world: World = World()
+    try:
+        world.load(args.world)
+        world.load_chunks()
+    except (WorldGenSizeError, WorldSaveError, FileNotFoundError):
+        world = WorldGen.generate_landscape(WORLD_SIZE // 2, 32, seed=args.seed)
+
+    asyncio.run(benchmark(world, args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,213 @@
+"""
+Block tick check file
+Run from the repository root: python -m benchmarks.tick_check
+"""
+
+
+import time
+import argparse
+import tempfile
+import numpy as np
+from source.regions import RegionStreamer
+from source.ticks import BlockTicker
+from source.blocks import *
+from source.options import *
+
+
+# changes made by the rules
+RULES: tuple[str, ...] = (
+    "grass covered by an opaque block became dirt",
+    "dirt next to grass became grass",
+    "leaves without logs decayed")
+
+def box_coords(minimum: tuple[int, int, int], maximum: tuple[int, int, int]) -> np.ndarray:
+    """
+    Positions of a box, in ZYX order
+    :param minimum: min box corner
+    :param maximum: max box corner, exclusive
+    :return: array of world block coordinates (N, 3)
+    """
+
+    zs, ys, xs = np.meshgrid(*(np.arange(minimum[axis], maximum[axis]) for axis in (2, 1, 0)), indexing="ij")
+    return np.stack([xs.ravel(), ys.ravel(), zs.ravel()], axis=1)
+
+
+def read_box(regions: RegionStreamer, minimum: tuple[int, int, int], maximum: tuple[int, int, int]) -> np.ndarray:
+    """
+    Reads blocks of a box
+    :param regions: streamed world
+    :param minimum: min box corner
+    :param maximum: max box corner, exclusive
+    :return: ZYX array of block ids
+    """
+
+    shape = tuple(maximum[axis] - minimum[axis] for axis in (2, 1, 0))
+    return regions.get_many(box_coords(minimum, maximum)).reshape(shape)
+
+
+def around(blocks: np.ndarray, reach: int, value: int) -> np.ndarray:
+    """
+    Finds blocks with a block of the value within the reach, along every axis
+    :param blocks: ZYX array of block ids, with a margin of 'reach' blocks
+    :param reach: reach in blocks
+    :param value: block id looked for
+    :return: ZYX boolean array without the margin
+    """
+
+    found = np.zeros([size - 2 * reach for size in blocks.shape], dtype=np.bool_)
+    span = range(2 * reach + 1)
+    for z in span:
+        for y in span:
+            for x in span:
+                found |= blocks[z: z + found.shape[0], y: y + found.shape[1], x: x + found.shape[2]] == value
+    return found
+
+
+def check_rules(before: np.ndarray, after: np.ndarray, ticker: BlockTicker, tick: int) -> dict[str, int]:
+    """
+    Checks that every block changed by a tick was changed by one of the rules, as they read the blocks before it
+    :param before: ZYX array of blocks before the tick, with a margin of 'LEAVES_RANGE' blocks
+    :param after: ZYX array of blocks after the tick, with the same margin
+    :param ticker: block ticker
+    :param tick: tick number, for the messages
+    :return: amount of changes made by every rule
+    """
+
+    reach = LEAVES_RANGE
+    inner = (slice(reach, -reach),) * 3
+    old, new = before[inner], after[inner]
+    changed = old != new
+    if not changed.any():
+        return dict.fromkeys(RULES, 0)
+    above = before[reach + 1: before.shape[0] - reach + 1, reach: -reach, reach: -reach]
+    covered = ticker.opaque[np.maximum(above, 0)]
+
+    rules = dict(zip(RULES, (
+        (old == ticker.grass) & (new == ticker.dirt) & covered,
+        (old == ticker.dirt) & (new == ticker.grass) & ~covered & (above > -1) & around(before[
+            reach - 1: before.shape[0] - reach + 1,
+            reach - 1: before.shape[1] - reach + 1,
+            reach - 1: before.shape[2] - reach + 1], 1, ticker.grass),
+        (old == ticker.leaves) & (new == 0) & ~around(before, reach, ticker.logs) & ~around(before, reach, -1))))
+    explained = np.zeros_like(changed)
+    for rule in rules.values():
+        explained |= rule
+    assert not np.any(changed & ~explained), \
+        f"tick {tick} changed {np.count_nonzero(changed & ~explained)} blocks no rule changes"
+    return {name: int(np.count_nonzero(rule)) for name, rule in rules.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Runs block tick rules on a small scene of the streamed world, and checks their results")
+    parser.add_argument("--seed", type=int, default=0, help="seed of generated world and random ticks")
+    parser.add_argument("--ticks", type=int, default=2000, help="amount of ticks the rules run for")
+    args = parser.parse_args()
+
+    named = Blocks.named
+    with tempfile.TemporaryDirectory() as directory:
+        regions = RegionStreamer(directory, seed=args.seed, autosave_interval=0)
+        regions.update((WORLD_SIZE / 2, WORLD_SIZE / 2, WORLD_SIZE / 2), wait=True)
+        ticker = BlockTicker(regions, seed=args.seed)
+
+        # planks fall in this check; terrain blocks don't fall, and none fall by default. Results of the rules
+        # are checked here, not their time; the budget is checked at the end
+        ticker.budget = float("inf")
+        ticker.falling[named["oak_planks"]] = True
+        ticker.updated[named["oak_planks"]] = True
+
+        # scene is built in the air above the terrain, in the window; every position is notified once
+        pending = len(ticker.pending)
+        regions.set((8, 8, 240), "oak_planks")
+        assert len(ticker.pending) - pending == 7, "a changed block must schedule itself and its 6 neighbours"
+        pending = len(ticker.pending)
+        regions.set((8, 8, 240), "dirt_block")
+        ticker.notify(np.array([(8, 8, 240)]))
+        assert len(ticker.pending) == pending, "positions already waiting for an update must not be scheduled again"
+        regions.set_many(box_coords((20, 8, 240), (23, 11, 243)), "dirt_block")
+        assert len(ticker.pending) - pending == 27 + 6 * 9, "neighbours shared by changed blocks must be scheduled once"
+        print("changed blocks and their neighbours are scheduled once: 7 positions for a block, 81 for a 3x3x3 box")
+
+        # covered grass filling halves of two chunks, so that random ticks hit it often; chunks of a single kind of
+        # block get no random ticks
+        regions.set_many(box_coords((96, 96, 200), (112, 112, 216)), "grass_block")
+
+        # dirt layers between see-through layers, with a strip of grass along one side
+        regions.set_many(box_coords((128, 96, 200), (144, 112, 216)), "debug_alpha")
+        for z in range(200, 216, 2):
+            regions.set_many(box_coords((128, 96, z), (144, 112, z + 1)), "dirt_block")
+            regions.set_many(box_coords((128, 96, z), (129, 112, z + 1)), "grass_block")
+
+        # leaves around a log, and leaves without one
+        regions.set_many(box_coords((98, 138, 198), (103, 143, 203)), "oak_leaves")
+        regions.set((100, 140, 200), "oak_logs")
+        regions.set_many(box_coords((139, 139, 199), (142, 142, 202)), "oak_leaves")
+
+        # planks falling on a log; the lowest one moves one block down every 'FALL_DELAY' ticks
+        regions.set((120, 200, 220), "oak_logs")
+        regions.set_many([(120, 200, 230), (120, 200, 231), (120, 200, 232)], "oak_planks")
+        start_tick = ticker.tick
+
+        # blocks the rules change, with a margin of blocks they read
+        minimum, maximum = (96 - LEAVES_RANGE, 96 - LEAVES_RANGE, 196), (144 + LEAVES_RANGE, 144 + LEAVES_RANGE, 220)
+        before = read_box(regions, minimum, maximum)
+        counts = dict.fromkeys(RULES, 0)
+        seconds = 0.0
+        for tick in range(1, args.ticks + 1):
+            begin = time.perf_counter()
+            ticker.step()
+            seconds += time.perf_counter() - begin
+            after = read_box(regions, minimum, maximum)
+            for name, count in check_rules(before, after, ticker, tick).items():
+                counts[name] += count
+            before = after
+
+            # lowest plank falls at the first update, then every 'FALL_DELAY' ticks until it lands on the log
+            lowest = 230 - min(1 + (ticker.tick - start_tick - 1) // FALL_DELAY, 9)
+            column = regions.get_many([(120, 200, z) for z in range(220, 233)])
+            assert column[lowest - 220] == named["oak_planks"] and np.all(column[1: lowest - 220] == 0), \
+                f"lowest falling plank isn't at height {lowest} at tick {tick}"
+        for name, count in counts.items():
+            assert count > 0, f"no {name} in {args.ticks} ticks"
+            print(f"{name}: {count} blocks")
+
+        # leaves near the log are kept; the rest decayed. Top grass layer sees the sky, it is never covered
+        leaves = read_box(regions, (98, 138, 198), (103, 143, 203))
+        leaves[2, 2, 2] = ticker.leaves
+        assert np.all(leaves == ticker.leaves), "leaves near a log decayed"
+        assert np.all(read_box(regions, (139, 139, 199), (142, 142, 202)) == 0), "leaves without a log didn't decay"
+        assert np.all(read_box(regions, (96, 96, 215), (112, 112, 216)) == ticker.grass), "uncovered grass decayed"
+        column = regions.get_many([(120, 200, z) for z in range(220, 233)])
+        assert column.tolist() == [named["oak_logs"]] + [named["oak_planks"]] * 3 + [0] * 9, \
+            f"falling planks ended up as {column.tolist()}"
+        print(f"{args.ticks} ticks: every change follows a rule; {len(counts)} rules applied, falling planks landed; "
+              f"{seconds / args.ticks * 1e3:.2f}ms per tick")
+
+        # updates over the budget wait for the next ticks; a budget of 0 stands for random ticks taking all of it.
+        # At least one batch is still applied every tick. New ticker has no updates scheduled before these
+        ticker = BlockTicker(regions, budget=0.0, seed=args.seed)
+        keys = BlockTicker.pack(box_coords((40, 40, 244), (40 + 10 * TICK_BATCH // 64, 104, 245)))
+        ticker.schedule(BlockTicker.unpack(keys))
+        for step in range(1, 11):
+            ticker.step()
+            left = len(ticker.pending.intersection(keys.tolist()))
+            assert left == keys.size - step * TICK_BATCH, f"{keys.size - left} updates done after {step} ticks"
+        print(f"{keys.size} updates with no time budget: one batch of {TICK_BATCH} per tick, done in 10 ticks")
+
+        # with the budget, updates that take longer than it are spread over ticks
+        ticker.budget = TICK_BUDGET
+        keys = BlockTicker.pack(box_coords((40, 40, 246), (104, 104, 250)))
+        ticker.schedule(BlockTicker.unpack(keys))
+        ticks = 0
+        begin = time.perf_counter()
+        while ticker.pending.intersection(keys.tolist()):
+            ticker.step()
+            ticks += 1
+        seconds = time.perf_counter() - begin
+        print(f"{keys.size} updates with a budget of {TICK_BUDGET * 1e3:.0f}ms: {ticks} ticks, "
+              f"{seconds / ticks * 1e3:.1f}ms per tick")
+        regions.close()
+
+
+if __name__ == '__main__':
+    main()
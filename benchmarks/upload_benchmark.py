@@ -0,0 +1,104 @@
+"""
+World upload benchmark file
+Run from the repository root: python -m benchmarks.upload_benchmark
+"""
+
+
+import argparse
+import tempfile
+import numpy as np
+from source.world import World, WorldGen
+from source.regions import RegionStreamer
+from source.uploads import WorldUploader
+from source.options import *
+from source.exceptions import *
+
+
+class HostBuffer:
+    """
+    Buffer in memory standing in for a GPU buffer
+    """
+
+    def __init__(self, data: np.ndarray):
+        """
+        :param data: initial content
+        """
+
+        self.data: np.ndarray = np.array(data, dtype=np.uint8)
+
+    def write(self, data: np.ndarray, offset: int = 0):
+        """
+        Writes data at the offset, in bytes
+        """
+
+        data = np.frombuffer(np.ascontiguousarray(data).tobytes(), dtype=np.uint8)
+        self.data[offset:offset + data.size] = data
+
+
+def upload(uploader: WorldUploader) -> tuple[int, int, int]:
+    """
+    Uploads until nothing is left, and checks that the buffer matches the world
+    :param uploader: world uploader
+    :return: bytes written, writes and frames it took
+    """
+
+    total_bytes, writes, frames = 0, 0, 0
+    while True:
+        written = uploader.upload()
+        if not written and not uploader.pending:
+            break
+        total_bytes += written
+        writes += uploader.frame_writes
+        frames += 1
+    assert np.array_equal(uploader.buffer.data, uploader.world.get_chunk_major()), \
+        "uploaded buffer differs from the world"
+    return total_bytes, writes, frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures bytes uploaded to the GPU after edits of the world")
+    parser.add_argument("--world", default=f"{SAVES_DIR}/debug.cubw", help="world save to edit")
+    parser.add_argument("--seed", type=int, default=0, help="seed of generated world")
+    args = parser.parse_args()
+
+    world: World = World()
+    try:
+        world.load(args.world)
+        world.load_chunks()
+    except (WorldGenSizeError, WorldSaveError, FileNotFoundError):
+        world = WorldGen.generate_landscape(WORLD_SIZE // 2, 32, seed=args.seed)
+    uploader = WorldUploader(world, HostBuffer(world.get_chunk_major()))
+    world.pop_dirty_ranges()
+
+    # edits; uploads must be proportional to the chunks they touch
+    edits = {
+        "single block": lambda: world.set((WORLD_CENTER, WORLD_CENTER, WORLD_CENTER), "oak_planks"),
+        "box of 40x30x20 blocks": lambda: world.fill_box((100, 100, 100), (140, 130, 120), "oak_planks"),
+    }
+    for name, edit in edits.items():
+        edit()
+        dirty = len(world.dirty_chunks)
+        total_bytes, writes, frames = upload(uploader)
+        assert total_bytes == dirty * CHUNK_VOLUME, f"{name} uploaded {total_bytes} bytes for {dirty} chunks"
+        print(f"{name}: {dirty} chunks, {total_bytes / 1024:.0f} KiB in {writes} writes over {frames} frames")
+
+    # window moves; only the newly exposed slabs are uploaded
+    with tempfile.TemporaryDirectory() as directory:
+        regions = RegionStreamer(directory, seed=args.seed, autosave_interval=0)
+        position = [WORLD_SIZE / 2, WORLD_SIZE / 2, WORLD_SIZE / 2]
+        regions.update(tuple(position), wait=True)
+        uploader = WorldUploader(regions.window, HostBuffer(regions.window.get_chunk_major()))
+        regions.window.pop_dirty_ranges()
+        for name, axis, step in (("X", 0, WINDOW_STEP), ("Y", 1, WINDOW_STEP), ("X", 0, -WINDOW_STEP)):
+            position[axis] += step
+            regions.update(tuple(position), wait=True)
+            total_bytes, writes, frames = upload(uploader)
+            slab = abs(step) * WORLD_SIZE * WORLD_SIZE
+            assert total_bytes == slab, f"window move along {name} uploaded {total_bytes} bytes, the slab is {slab}"
+            print(f"window move of {step} blocks along {name}: {total_bytes / 1024 ** 2:.1f} MiB in {writes} writes "
+                  f"over {frames} frames; the exposed slab is {slab / 1024 ** 2:.1f} MiB")
+        regions.close()
+
+
+if __name__ == '__main__':
+    main()
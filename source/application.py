@@ -6,12 +6,18 @@ Application class
 import os
 import arcade
 import arcade.gl
-from PIL import Image, ImageOps
+from pyglet import gl
 from pyglet.event import EVENT_HANDLE_STATE
 from source.world import *
 from source.classes import *
 from source.options import *
 from source.textures import *
+from source.uploads import *
+from source.regions import *
+from source.ticks import *
+from source.profiler import *
+from source.scaling import *
+from source.screenshots import *
 from source.exceptions import *
 
 
@@ -37,17 +43,48 @@ class Application(arcade.Window):
 
         # shader related things
         self.buffer: arcade.context.Framebuffer | None = None
-        self.screenshot_buffer: arcade.context.Framebuffer | None = None
         self.quad: arcade.context.Geometry | None = None
 
         self.chunk_render_shader: arcade.context.Program | None = None
         self.sky_render_shader: arcade.context.Program | None = None
+        self.upscale_shader: arcade.context.Program | None = None
+        self.mesh_render_shader: arcade.context.Program | None = None
+
+        # chunks are traced at a fraction of the window resolution into the scaled buffer, which is then upscaled
+        self.render_scale: RenderScale = RenderScale()
+        self.scaled_buffer: arcade.context.Framebuffer | None = None
+
+        # checkerboard shadows; tiles of alternating parity trace shadows every frame
+        self.checkerboard_shadows: bool = CHECKERBOARD_SHADOWS
+        self.shadow_parity: int = 0
+
+        # shadow cache; last frame's and this frame's shadows of the first hits, and the pose they were seen from.
+        # Epoch changes with the world, which invalidates the cached shadows
+        self.shadow_cache: bool = SHADOW_CACHE
+        self.shadow_buffers: list[arcade.context.Buffer] = []
+        self.shadow_resolution: tuple[int, int] | None = None
+        self.shadow_pose: tuple[tuple[float, float, float], tuple[float, float], float] | None = None
+        self.shadow_epoch: int = 0
+
+        # sun lightmap; shadows are looked up in it instead of being traced, which makes the shadow cache unneeded
+        self.sun_lightmap: bool = SUN_LIGHTMAP
+
+        # mesh rendering; world mesh is made when first needed, its quads are expanded into triangles by the shader
+        self.mesh_rendering: bool = MESH_RENDERING
+        self.mesh_buffer: arcade.context.Buffer | None = None
+        self.mesh_geometry: arcade.context.Geometry = self.ctx.geometry()
+        self.mesh_quads: int = 0
+
+        # last value of every uniform of every program; only changed values are sent
+        self.uniform_cache: dict[tuple[int, str], object] = {}
         self.load_shaders()
 
         # texture related
-        self.texture_manager: TextureManager = TextureManager()
+        self.texture_manager: TextureManager = TextureManager(self.ctx)
         self.texture_manager.load_textures()
-        self.texture_manager.generate_raw_texture_mapping()
+
+        # sky gradient colors as integers
+        self.sky_gradient: tuple[int, ...] = tuple(int(color, 16) for color in SKY_GRADIENT)
 
         # make graphs
         arcade.enable_timings()
@@ -58,29 +95,64 @@ class Application(arcade.Window):
         graph.position = 100, self.height - 60
         self.perf_graph_list.append(graph)
 
+        # stage timings; graphs are shown while the profiler is enabled
+        self.profiler: Profiler = Profiler()
+        self.profiler_graph_list = arcade.SpriteList()
+        for index, stage in enumerate(PROFILER_GRAPHS):
+            graph = arcade.PerfGraph(200, 120, graph_data=stage)
+            graph.position = 100 + (index + 1) * 210, self.height - 60
+            self.profiler_graph_list.append(graph)
+
         # player
         self.player: Player = Player(Vec3(WORLD_CENTER, WORLD_CENTER, WORLD_CENTER), Vec2(0, 90))
 
+        # screenshot in progress
+        self.screenshot: TiledScreenshot | None = None
+        self.screenshot_player: Player | None = None
+
         # player movement
         self.keys: set[int] = set()
         self.set_mouse_visible(False)
         self.set_exclusive_mouse()
 
-        # world
-        debug_world_name = f"{SAVES_DIR}/debug.npy"
-        self.world: World = World()
-        try:
-            self.world.load(debug_world_name)
-            print("Successfully loaded the save file!")
-        except (WorldGenSizeError, FileNotFoundError):
-            print("Unable to load save file; generating new one instead...")
-            self.world: World = WorldGen.generate_landscape(WORLD_SIZE // 2, 32)
-            self.world.save(debug_world_name)
-
-        self.world.set((WORLD_CENTER, WORLD_CENTER, WORLD_CENTER + 4), "debug_alpha")
-        self.world.set((WORLD_CENTER+1, WORLD_CENTER, WORLD_CENTER + 4), "debug_alpha")
-
-        self.world_buffer = self.ctx.buffer(data=self.world.voxels, usage="static")
+        # world; old single world save becomes the region at the origin
+        self.regions: RegionStreamer = RegionStreamer()
+        origin_region_name = self.regions.region_filename((0, 0))
+        for old_world_name in (f"{SAVES_DIR}/debug.cubw", f"{SAVES_DIR}/debug.npy"):
+            if os.path.isfile(origin_region_name) or not os.path.isfile(old_world_name):
+                continue
+            try:
+                print("Migrating old save file...")
+                old_world = World()
+                old_world.load(old_world_name)
+                old_world.save(origin_region_name)
+            except (WorldGenSizeError, WorldSaveError):
+                print("Unable to migrate old save file")
+
+        # regions around the player are loaded before the first frame
+        self.regions.update(self.player.pos, wait=True)
+        self.world: World = self.regions.window
+
+        # player starts above the terrain
+        surface = self.regions.surface(WORLD_CENTER, WORLD_CENTER)
+        self.player.pos = Vec3(WORLD_CENTER, WORLD_CENTER, max(WORLD_CENTER, surface + 2))
+
+        self.regions.set_many(
+            [(WORLD_CENTER, WORLD_CENTER, WORLD_CENTER + 4), (WORLD_CENTER + 1, WORLD_CENTER, WORLD_CENTER + 4)],
+            "debug_alpha")
+
+        # block updates run at their own fixed rate
+        self.ticker: BlockTicker = BlockTicker(self.regions)
+
+        # whole world is written once, later only the modified parts are written
+        self.world_buffer = self.ctx.buffer(data=self.world.get_chunk_major(), usage="dynamic")
+        self.occupancy_buffer = self.ctx.buffer(data=self.world.occupancy.pack(), usage="dynamic")
+        self.world.lightmap.update(wait=True)
+        self.lightmap_buffer = self.ctx.buffer(data=self.world.lightmap.light, usage="dynamic")
+        self.world.dirty_chunks.clear()
+        self.world.lightmap.pop_changed_ranges()
+        self.world_uploader: WorldUploader = WorldUploader(
+            self.world, self.world_buffer, self.occupancy_buffer, self.lightmap_buffer)
 
     def load_shaders(self):
         """
@@ -96,94 +168,351 @@ class Application(arcade.Window):
             color_attachments=[self.ctx.texture(window_size, components=4)],
             depth_attachment=self.ctx.depth_texture(window_size))
 
-        self.screenshot_buffer = self.ctx.framebuffer(
-            color_attachments=[self.ctx.texture(SCREENSHOT_RESOLUTION, components=3)])
-
         # load shaders
+        # limits are taken from options, so the shader always matches the world and the block registry
         self.chunk_render_shader = self.ctx.load_program(
             vertex_shader=f"{SHADER_DIR}/vert.glsl",
-            fragment_shader=f"{SHADER_DIR}/main.glsl")
+            fragment_shader=f"{SHADER_DIR}/main.glsl",
+            defines={
+                "CHUNK_SIZE": str(WORLD_SIZE),
+                "INDEX_MASK": str(MAX_BLOCKS - 1),
+                "MAX_BLOCKS": str(MAX_BLOCKS),
+                "BLOCK_FACES": str(len(BLOCK_FACES)),
+                "STORAGE_CHUNK_BITS": str(CHUNK_BITS)})
 
         self.sky_render_shader = self.ctx.load_program(
             vertex_shader=f"{SHADER_DIR}/vert.glsl",
             fragment_shader=f"{SHADER_DIR}/sky.glsl")
 
-    # noinspection PyTypeChecker
+        self.upscale_shader = self.ctx.load_program(
+            vertex_shader=f"{SHADER_DIR}/vert.glsl",
+            fragment_shader=f"{SHADER_DIR}/upscale.glsl")
+
+        self.mesh_render_shader = self.ctx.load_program(
+            vertex_shader=f"{SHADER_DIR}/mesh_vert.glsl",
+            fragment_shader=f"{SHADER_DIR}/mesh.glsl",
+            defines={"CHUNK_SIZE": str(WORLD_SIZE)})
+
+        # new programs start with default uniform values
+        self.uniform_cache.clear()
+
     def take_screenshot(self):
         """
-        Takes a high resolution screenshot
+        Starts taking a high resolution screenshot. It is rendered in tiles over the next frames,
+        and stored in 'SAVES_DIR' once done
+        """
+
+        # one screenshot at a time
+        if self.screenshot is not None:
+            return
+
+        # camera is frozen for the whole screenshot
+        self.screenshot_player = Player(self.player.pos, self.player.rot)
+        self.screenshot_player.fov = self.player.fov
+        self.screenshot = TiledScreenshot(self.ctx, SCREENSHOT_RESOLUTION, f"{SAVES_DIR}/capture.png")
+
+    # noinspection PyTypeChecker
+    def render_screenshot_tile(self, tile: tuple[int, int, int, int]):
+        """
+        Renders a tile of the screenshot
+        :param tile: tile x, y, width and height
         """
 
         # set resolution related uniforms
-        self.chunk_render_shader.set_uniform_array_safe("u_resolution", (*SCREENSHOT_RESOLUTION, 1.0))
-        self.sky_render_shader.set_uniform_array_safe("u_resolution", (*SCREENSHOT_RESOLUTION, 1.0))
+        for shader in (self.chunk_render_shader, self.sky_render_shader):
+            self.set_uniform(shader, "u_resolution", (*SCREENSHOT_RESOLUTION, 1.0))
+            self.set_uniform(shader, "u_fragOffset", tile[:2])
 
-        # render image to screenshot buffer
-        with self.screenshot_buffer.activate():
-            self.render_pass()
+        self.render_pass(self.screenshot_player)
 
-        # write buffer to image and store it in 'SAVES_DIR'
-        img = Image.frombytes("RGB", SCREENSHOT_RESOLUTION, self.screenshot_buffer.read())
-        ImageOps.flip(img).save(f"{SAVES_DIR}/capture.png")
+    def set_uniform(self, program: arcade.gl.Program, name: str, value):
+        """
+        Sets a uniform, if the program uses it. Values equal to the last set ones aren't sent again
+        :param program: shader program
+        :param name: uniform name
+        :param value: number, or sequence of numbers
+        """
+
+        value = value if isinstance(value, (int, float)) else tuple(value)
+        key = id(program), name
+        if self.uniform_cache.get(key) == value:
+            return
+        self.uniform_cache[key] = value
+
+        if isinstance(value, tuple):
+            program.set_uniform_array_safe(name, value)
+        else:
+            program.set_uniform_safe(name, value)
+        self.profiler.count("uniforms")
 
     # noinspection PyTypeChecker
-    def render_pass(self):
+    def render_pass(self, player: Player | None = None, resolution: tuple[int, int] | None = None):
         """
         Render pass without any buffer changes
+        :param player: player to render the view of; current player by default
+        :param resolution: resolution to trace the chunks at, which are then upscaled to the window;
+        by default they are traced straight into the active framebuffer, with every pixel tracing shadows
         """
 
+        player = self.player if player is None else player
+
         # clear buffer
         self.clear()
 
         # set uniforms that remain the same for on_draw call
         # for chunk renderer
-        self.chunk_render_shader.set_uniform_safe("u_playerFov", self.player.fov)
-        self.chunk_render_shader.set_uniform_array_safe("u_playerPosition", self.player.pos)
-        self.chunk_render_shader.set_uniform_array_safe("u_playerDirection", self.player.rot)
-        self.chunk_render_shader.set_uniform_array_safe("u_worldSun", self.world.sun)
-        self.chunk_render_shader.set_uniform_array_safe("u_textureMapping", self.texture_manager.raw_texture_mapping)
+        self.set_uniform(self.chunk_render_shader, "u_playerFov", player.fov)
+        self.set_uniform(
+            self.chunk_render_shader,
+            "u_playerPosition",
+            (player.pos[0] - self.regions.origin[0], player.pos[1] - self.regions.origin[1], player.pos[2]))
+        self.set_uniform(self.chunk_render_shader, "u_windowOffset", self.regions.offset)
+        self.set_uniform(self.chunk_render_shader, "u_playerDirection", player.rot)
+        self.set_uniform(self.chunk_render_shader, "u_worldSun", self.world.sun)
+        bounds = self.world.heightmap.bounds
+        self.set_uniform(self.chunk_render_shader, "u_boundsMin", bounds[0])
+        self.set_uniform(self.chunk_render_shader, "u_boundsMax", bounds[1])
 
         # for sky renderer
-        self.sky_render_shader.set_uniform_array_safe("u_worldSun", self.world.sun)
-        self.sky_render_shader.set_uniform_array_safe(
-            "u_skyGradient",
-            [int(x, 16) for x in ["9BC8DC", "8CBED4", "77ACC5", "689CBA", "5788AE"]])
-        self.sky_render_shader.set_uniform_array_safe("u_playerDirection", self.player.rot)
+        self.set_uniform(self.sky_render_shader, "u_worldSun", self.world.sun)
+        self.set_uniform(self.sky_render_shader, "u_skyGradient", self.sky_gradient)
+        self.set_uniform(self.sky_render_shader, "u_playerDirection", player.rot)
 
         # bind texture array
-        self.chunk_render_shader.set_uniform_safe("u_textureArray", 0)
+        self.set_uniform(self.chunk_render_shader, "u_textureArray", 0)
         self.texture_manager.texture_array.use(0)
 
-        # bind storage buffer with chunk data
+        # bind storage buffers with chunk data, occupancy pyramid, texture mapping and sun lightmap
         self.world_buffer.bind_to_storage_buffer(binding=0)
+        self.occupancy_buffer.bind_to_storage_buffer(binding=1)
+        self.texture_manager.texture_mapping.bind_to_storage_buffer(binding=2)
+        self.lightmap_buffer.bind_to_storage_buffer(binding=5)
 
         # turn on blending
         self.ctx.enable(self.ctx.BLEND)
 
         # render image to quad
-        self.quad.render(self.sky_render_shader)
-        self.quad.render(self.chunk_render_shader)
+        with self.profiler.stage("sky", gpu=True):
+            self.quad.render(self.sky_render_shader)
+        with self.profiler.stage("chunks", gpu=True):
+            if resolution is None:
+                self.set_uniform(self.chunk_render_shader, "u_checkerboard", -1)
+                self.set_uniform(self.chunk_render_shader, "u_shadowCache", 0)
+                self.set_uniform(self.chunk_render_shader, "u_sunLightmap", 0)
+                self.quad.render(self.chunk_render_shader)
+            elif self.mesh_rendering:
+                self.render_mesh(player)
+            else:
+                self.render_scaled_chunks(resolution)
+
+    # noinspection PyTypeChecker
+    def render_mesh(self, player: Player):
+        """
+        Rasterizes the world mesh over the sky in the active framebuffer, at the window resolution
+        :param player: player to render the view of
+        """
+
+        if self.mesh_quads == 0:
+            return
+
+        shader = self.mesh_render_shader
+        self.set_uniform(shader, "u_resolution", (*self.get_size(), 1.0))
+        self.set_uniform(shader, "u_playerFov", player.fov)
+        self.set_uniform(
+            shader, "u_playerPosition",
+            (player.pos[0] - self.regions.origin[0], player.pos[1] - self.regions.origin[1], player.pos[2]))
+        self.set_uniform(shader, "u_playerDirection", player.rot)
+        self.set_uniform(shader, "u_windowOffset", self.regions.offset)
+        self.set_uniform(shader, "u_worldSun", self.world.sun)
+        self.set_uniform(shader, "u_textureArray", 0)
+        self.mesh_buffer.bind_to_storage_buffer(binding=6)
+
+        # sky doesn't write depth, so the depth cleared with the framebuffer is still there;
+        # faces turned away from the camera are never seen
+        self.ctx.enable(self.ctx.DEPTH_TEST, self.ctx.CULL_FACE)
+        self.mesh_geometry.render(shader, mode=self.ctx.TRIANGLES, vertices=self.mesh_quads * 6)
+        self.ctx.disable(self.ctx.DEPTH_TEST, self.ctx.CULL_FACE)
+
+    def upload_mesh(self):
+        """
+        Meshes changed chunks, within the per frame budget, and writes the quads when they changed
+        """
+
+        mesh = self.world.mesh
+        if mesh is None:
+            mesh = self.world.build_mesh(self.regions.offset)
+        mesh.update(MESH_CHUNK_BUDGET)
+        self.profiler.count("meshed chunks", mesh.meshed_chunks)
+        self.profiler.count("meshed faces", mesh.meshed_faces)
+        self.profiler.count("meshed quads", mesh.meshed_quads)
+        if not mesh.dirty:
+            return
+
+        # buffer grows with some room to spare, so that small changes don't reallocate it
+        quads = mesh.pack()
+        self.mesh_quads = quads.shape[0]
+        if self.mesh_buffer is None or self.mesh_buffer.size < quads.nbytes:
+            if self.mesh_buffer is not None:
+                self.mesh_buffer.delete()
+            self.mesh_buffer = self.ctx.buffer(reserve=max(quads.nbytes * 5 // 4, 16), usage="dynamic")
+        if quads.nbytes:
+            self.mesh_buffer.write(quads)
+
+    # noinspection PyTypeChecker
+    def render_scaled_chunks(self, resolution: tuple[int, int]):
+        """
+        Traces the chunks at given resolution, and upscales them over the sky in the active framebuffer.
+        GPU time of the pass drives the render scale
+        :param resolution: resolution to trace the chunks at
+        """
+
+        begin = self.render_scale.begin()
+
+        # shadows come from the sun lightmap when it is on; otherwise shadows of the first hits come from
+        # the shadow cache, when it or checkerboard shadows are on
+        shadow_cache = self.shadow_cache and not self.sun_lightmap
+        checkerboard_shadows = self.checkerboard_shadows and not self.sun_lightmap
+        if shadow_cache or checkerboard_shadows:
+            self.bind_shadow_cache(resolution)
+        else:
+            self.shadow_pose = None
+        self.shadow_parity ^= 1
+        self.set_uniform(
+            self.chunk_render_shader, "u_checkerboard", self.shadow_parity if checkerboard_shadows else -1)
+        self.set_uniform(self.chunk_render_shader, "u_shadowCache", int(shadow_cache))
+        self.set_uniform(self.chunk_render_shader, "u_sunLightmap", int(self.sun_lightmap))
+
+        # at full resolution the chunks are traced straight into the active framebuffer
+        if resolution == tuple(self.get_size()):
+            self.quad.render(self.chunk_render_shader)
+            self.render_scale.end(begin)
+            return
+
+        if self.scaled_buffer is None or self.scaled_buffer.size != resolution:
+            if self.scaled_buffer is not None:
+                self.scaled_buffer.delete()
+            self.scaled_buffer = self.ctx.framebuffer(color_attachments=[self.ctx.texture(resolution, components=4)])
+
+        # traced colors and their alpha are written as they are, and blended when upscaled
+        self.ctx.disable(self.ctx.BLEND)
+        with self.scaled_buffer.activate():
+            self.quad.render(self.chunk_render_shader)
+        self.ctx.enable(self.ctx.BLEND)
+
+        # upscaled colors are premultiplied by alpha
+        self.set_uniform(self.upscale_shader, "u_image", 1)
+        self.set_uniform(
+            self.upscale_shader, "u_scale",
+            (resolution[0] / self.get_size()[0], resolution[1] / self.get_size()[1]))
+        self.scaled_buffer.color_attachments[0].use(1)
+        self.ctx.blend_func = self.ctx.ONE, self.ctx.ONE_MINUS_SRC_ALPHA
+        self.quad.render(self.upscale_shader)
+        self.ctx.blend_func = self.ctx.BLEND_DEFAULT
+
+        self.render_scale.end(begin)
+
+    # noinspection PyTypeChecker
+    def bind_shadow_cache(self, resolution: tuple[int, int]):
+        """
+        Swaps shadow cache buffers, and binds them together with the last frame's pose.
+        Cache has a 16 byte entry for every traced pixel, and is emptied when the resolution changes
+        :param resolution: resolution the chunks are traced at
+        """
+
+        if self.shadow_resolution != resolution:
+            for buffer in self.shadow_buffers:
+                buffer.delete()
+            self.shadow_buffers = [
+                self.ctx.buffer(data=bytes(resolution[0] * resolution[1] * 16)) for _ in range(2)]
+            self.shadow_resolution = resolution
+            self.shadow_pose = None
+
+        # last frame's entries are read, this frame's are written; writes of the last frame have to be visible
+        self.shadow_buffers.reverse()
+        self.shadow_buffers[0].bind_to_storage_buffer(binding=3)
+        self.shadow_buffers[1].bind_to_storage_buffer(binding=4)
+        gl.glMemoryBarrier(gl.GL_SHADER_STORAGE_BARRIER_BIT)
+
+        # without the last pose, entries are left from an earlier frame, and are invalidated
+        pose = tuple(self.player.pos), tuple(self.player.rot), self.player.fov
+        if self.shadow_pose is None:
+            self.shadow_epoch = (self.shadow_epoch + 1) % 2 ** 10
+        position, direction, fov = self.shadow_pose or pose
+        origin = self.regions.origin
+        self.set_uniform(self.chunk_render_shader, "u_windowOrigin", (origin[0], origin[1], 0))
+        self.set_uniform(
+            self.chunk_render_shader, "u_previousPosition",
+            (position[0] - origin[0], position[1] - origin[1], position[2]))
+        self.set_uniform(self.chunk_render_shader, "u_previousDirection", direction)
+        self.set_uniform(self.chunk_render_shader, "u_previousFov", fov)
+        self.set_uniform(self.chunk_render_shader, "u_shadowEpoch", self.shadow_epoch)
+        self.shadow_pose = pose
 
     # noinspection PyTypeChecker
     def on_draw(self):
         # use main screen buffer
         self.buffer.activate()  # context manager doesn't work here for some reason? But works without it
 
-        # set resolution related uniforms
-        self.chunk_render_shader.set_uniform_array_safe("u_resolution", (*self.size, 1.0))
-        self.sky_render_shader.set_uniform_array_safe("u_resolution", (*SCREENSHOT_RESOLUTION, 1.0))
+        # write world changes
+        with self.profiler.stage("upload"):
+            uploaded = self.world_uploader.upload()
+            self.profiler.count("uploaded bytes", uploaded)
+
+        # changed world may cast different shadows
+        if uploaded:
+            self.shadow_epoch = (self.shadow_epoch + 1) % 2 ** 10
+
+        # mesh changed chunks
+        if self.mesh_rendering:
+            with self.profiler.stage("meshing"):
+                self.upload_mesh()
+
+        # render next tiles of the screenshot in progress
+        if self.screenshot is not None:
+            with self.profiler.stage("screenshot"):
+                self.screenshot.step(self.render_screenshot_tile)
+            if self.screenshot.finished:
+                self.screenshot = None
+
+        # set resolution related uniforms; chunks are traced at the scaled resolution
+        resolution = self.render_scale.resolution(self.get_size())
+        self.set_uniform(self.chunk_render_shader, "u_resolution", (*resolution, 1.0))
+        self.set_uniform(self.sky_render_shader, "u_resolution", (*SCREENSHOT_RESOLUTION, 1.0))
+        self.set_uniform(self.chunk_render_shader, "u_fragOffset", (0, 0))
+        self.set_uniform(self.sky_render_shader, "u_fragOffset", (0, 0))
 
         # make a render pass
-        self.render_pass()
+        self.render_pass(resolution=resolution)
+        self.profiler.count("render scale %", round(self.render_scale.scale * 100))
 
         # draw performance graphs
         self.perf_graph_list.draw()
+        if self.profiler.enabled:
+            self.profiler_graph_list.draw()
+        self.profiler.next_frame()
 
     def on_key_press(self, symbol: int, modifiers: int) -> EVENT_HANDLE_STATE:
         self.keys.add(symbol)
 
         if symbol == arcade.key.F12:
             self.take_screenshot()
+        if symbol == arcade.key.F3:
+            self.profiler.enabled = not self.profiler.enabled
+        if symbol == arcade.key.F4:
+            self.profiler.export_chrome_trace(f"{SAVES_DIR}/profile.json")
+            self.profiler.export_csv(f"{SAVES_DIR}/profile.csv")
+        if symbol == arcade.key.F5:
+            self.render_scale.cycle_mode()
+        if symbol == arcade.key.F6:
+            self.checkerboard_shadows = not self.checkerboard_shadows
+        if symbol == arcade.key.F7:
+            self.shadow_cache = not self.shadow_cache
+        if symbol == arcade.key.F8:
+            self.sun_lightmap = not self.sun_lightmap
+        if symbol == arcade.key.F9:
+            self.mesh_rendering = not self.mesh_rendering
+        if symbol == arcade.key.Z and modifiers & arcade.key.MOD_CTRL:
+            self.regions.undo()
 
     def on_key_release(self, symbol: int, modifiers: int) -> EVENT_HANDLE_STATE:
         self.keys.discard(symbol)
@@ -209,4 +538,23 @@ class Application(arcade.Window):
         if arcade.key.LSHIFT in self.keys or arcade.key.RSHIFT in self.keys:
             self.player.move(Vec3(0, 0, -delta_time * self.player.movement_speed))
         if arcade.key.ESCAPE in self.keys:
-            arcade.exit()
+            self.on_close()
+            return
+
+        # stream regions around the player
+        with self.profiler.stage("update"):
+            self.regions.update(self.player.pos)
+
+        # update blocks
+        with self.profiler.stage("ticks"):
+            self.ticker.advance()
+        self.profiler.count("ticks", self.ticker.ticked)
+        self.profiler.count("random ticks", self.ticker.random_ticks)
+        self.profiler.count("block updates", self.ticker.processed_updates)
+        self.profiler.count("ticked blocks", self.ticker.changed_blocks)
+        self.profiler.count("deferred updates", self.ticker.deferred_updates)
+
+    def on_close(self):
+        # modified regions are saved before exiting
+        self.regions.close()
+        super().on_close()
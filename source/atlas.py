@@ -0,0 +1,72 @@
+"""
+Block texture atlas
+"""
+
+
+import os
+import numpy as np
+from source.options import *
+from source.exceptions import *
+
+
+class TextureAtlas:
+    """
+    All textures packed into layers of the same size.
+    Layer rows go from bottom to top, like in GL textures
+    """
+
+    def __init__(self, layers: np.ndarray | None = None, names: dict[str, dict[str, int]] | None = None):
+        """
+        :param layers: texture layers with shape (layers, size, size, 4)
+        :param names: texture layer for every texture name, grouped by category
+        """
+
+        self.layers: np.ndarray | None = layers
+        self.names: dict[str, dict[str, int]] = {} if names is None else names
+
+    @property
+    def size(self) -> int:
+        """
+        Size of texture layers
+        """
+
+        return self.layers.shape[1]
+
+    def build(self, files: list[str]):
+        """
+        Decodes, validates and packs textures; files are packed in the given order
+        :param files: texture image files within 'TEXTURE_DIR'
+        """
+
+        # pillow is only needed when the registry cache is rebuilt
+        from PIL import Image
+
+        images: list[np.ndarray] = []
+        self.names = {}
+        for filepath in files:
+            texture_path = filepath[len(TEXTURE_DIR) + 1:].split("/")
+
+            # decode image; flipped so that rows go from bottom to top
+            try:
+                with Image.open(filepath) as image:
+                    images.append(np.flipud(np.asarray(image.convert("RGBA"))))
+            except OSError as e:
+                raise TextureLoadError(f"Unable to decode texture '{filepath}'") from e
+            self.names.setdefault(texture_path[0], {})[os.path.splitext(texture_path[1])[0]] = len(images) - 1
+
+        # all layers must have the same size
+        if not images:
+            raise TextureLoadError(f"No textures in '{TEXTURE_DIR}'")
+        size = images[0].shape[0]
+        for filepath, image in zip(files, images):
+            if image.shape[:2] != (size, size):
+                raise TextureLoadError(f"Texture '{filepath}' is {image.shape[1]}x{image.shape[0]}; expected {size}x{size}")
+        self.layers = np.stack(images)
+
+    def transparent_layers(self) -> np.ndarray:
+        """
+        Finds layers with any not fully opaque texels
+        :return: boolean array with value for each layer
+        """
+
+        return np.any(self.layers[..., 3] < 255, axis=(1, 2))
@@ -1,47 +1,280 @@
 """
-Block lookup table
+Block registry
 """
 
 
 import os
 import json
 import glob
+import mmap
+import struct
+import hashlib
+import threading
+import numpy as np
+from source.atlas import *
 from source.options import *
+from source.exceptions import *
 
 
-class Blocks:
+# cache file starts with a header, which is followed by registry json, face table and texture layers
+BLOCK_CACHE_MAGIC: bytes = b"CUBB"
+BLOCK_CACHE_VERSION: int = 1
+BLOCK_CACHE_HEADER = struct.Struct("<4sH32sHHIII")  # magic, version, hash, blocks, faces, texture size, layers, json
+
+
+class BlockRegistry:
     """
-    Some lookups for blocks
+    Block names and ids, dense lookup tables indexed by block id, and block textures.
+    Assets are scanned once, when the registry is first used. The result is cached in a file,
+    which is rebuilt when the content of the assets changes
     """
 
-    # name to id
-    named: dict[str, int] = {}
+    def __init__(self, cache_filename: str = BLOCK_CACHE):
+        """
+        :param cache_filename: registry cache filename
+        """
+
+        self.cache_filename: str = cache_filename
+        self.loaded: bool = False
+        self.lock: threading.Lock = threading.Lock()
+
+        # name to id; id to name
+        self._named: dict[str, int] = {}
+        self._numbered: dict[int, str] = {}
+
+        # lookup tables indexed by block id
+        self._solid: np.ndarray = np.zeros(MAX_BLOCKS, dtype=np.bool_)
+        self._transparent: np.ndarray = np.zeros(MAX_BLOCKS, dtype=np.bool_)
+        self._opacity: np.ndarray = np.zeros(MAX_BLOCKS, dtype=np.float32)
+        self._faces: np.ndarray = np.zeros([MAX_BLOCKS, len(BLOCK_FACES)], dtype=np.uint32)
+
+        self._atlas: TextureAtlas | None = None
+
+        # mapped cache file the texture layers are read from
+        self.mmap: mmap.mmap | None = None
+
+    @property
+    def named(self) -> dict[str, int]:
+        """
+        Block id for every block name
+        """
+
+        self.load()
+        return self._named
+
+    @property
+    def numbered(self) -> dict[int, str]:
+        """
+        Block name for every block id
+        """
+
+        self.load()
+        return self._numbered
+
+    @property
+    def solid(self) -> np.ndarray:
+        """
+        Whether block with given id is a registered non air block
+        """
+
+        self.load()
+        return self._solid
+
+    @property
+    def transparent(self) -> np.ndarray:
+        """
+        Whether block with given id has any see through texels
+        """
+
+        self.load()
+        return self._transparent
+
+    @property
+    def opacity(self) -> np.ndarray:
+        """
+        Average alpha of the face textures of block with given id, from 0 to 1; 0 for air and unregistered blocks
+        """
+
+        self.load()
+        return self._opacity
+
+    @property
+    def faces(self) -> np.ndarray:
+        """
+        Texture layer of every block face with shape (MAX_BLOCKS, faces), faces are in 'BLOCK_FACES' order
+        """
+
+        self.load()
+        return self._faces
+
+    @property
+    def atlas(self) -> TextureAtlas:
+        """
+        Block textures
+        """
+
+        self.load()
+        return self._atlas
+
+    @staticmethod
+    def asset_files() -> list[str]:
+        """
+        Lists asset files; the order defines texture layers
+        """
+
+        return [
+            file.replace("\\", "/")
+            for file in glob.glob(TEXTURE_DIR + "/**/*", recursive=True)
+            if not os.path.isdir(file)]
+
+    @staticmethod
+    def content_hash(files: list[str]) -> bytes:
+        """
+        Hashes names and content of asset files
+        :param files: asset files
+        :return: sha256 digest
+        """
+
+        digest = hashlib.sha256(BLOCK_CACHE_VERSION.to_bytes(2, "little"))
+        for file in files:
+            with open(file, "rb") as f:
+                content = f.read()
+            digest.update(f"{file}:{len(content)}\n".encode("utf-8"))
+            digest.update(content)
+        return digest.digest()
+
+    def load(self):
+        """
+        Loads the registry from the cache file, or scans the assets and updates the cache.
+        Does nothing when the registry is already loaded
+        """
+
+        if self.loaded:
+            return
+
+        # registry may be first used by several threads at once
+        with self.lock:
+            if self.loaded:
+                return
+
+            files = self.asset_files()
+            content_hash = self.content_hash(files)
+            if not self.read_cache(self.cache_filename, content_hash):
+                self.build(files)
+                try:
+                    self.write_cache(self.cache_filename, content_hash)
+                except OSError:
+                    pass  # cache is optional
+            self.loaded = True
+
+    def build(self, files: list[str]):
+        """
+        Builds the registry from asset files
+        :param files: asset files
+        """
+
+        configs = [file for file in files if os.path.splitext(file)[1] == ".json"]
+        self._atlas = TextureAtlas()
+        self._atlas.build([file for file in files if os.path.splitext(file)[1] != ".json"])
+        self.mmap = None
+
+        self._named, self._numbered = {}, {}
+        self._faces = np.zeros([MAX_BLOCKS, len(BLOCK_FACES)], dtype=np.uint32)
+        for config in configs:
+            with open(config, "r", encoding="ascii") as f:
+                config_data = json.load(f)
+            if not 0 <= config_data["id"] < MAX_BLOCKS:
+                raise TextureLoadError(f"Block config '{config}' has id {config_data['id']} out of range")
+            try:
+                self._faces[config_data["id"]] = [
+                    self._atlas.names["blocks"][config_data["texture"][face]] for face in BLOCK_FACES]
+            except KeyError as e:
+                raise TextureLoadError(f"Block config '{config}' refers to missing texture {e}") from e
+            self._named[config_data["name"]] = config_data["id"]
+            self._numbered[config_data["id"]] = config_data["name"]
+
+        self.make_tables()
+
+    def make_tables(self):
+        """
+        Makes block lookup tables from the registered blocks and face textures
+        """
+
+        self._solid = np.zeros(MAX_BLOCKS, dtype=np.bool_)
+        self._solid[list(self._numbered)] = True
+        self._solid[0] = False
+
+        self._transparent = np.any(self._atlas.transparent_layers()[self._faces], axis=1) & self._solid
+
+        layer_alpha = self._atlas.layers[..., 3].mean(axis=(1, 2)) / 255
+        self._opacity = (layer_alpha[self._faces].mean(axis=1) * self._solid).astype(np.float32)
+
+    def write_cache(self, filename: str, content_hash: bytes):
+        """
+        Writes the registry to a cache file
+        :param filename: cache filename
+        :param content_hash: hash of the assets the registry was built from
+        """
+
+        registry = json.dumps({
+            "blocks": sorted(self._numbered.items()),
+            "textures": self._atlas.names}).encode("utf-8")
+        registry += b" " * (-len(registry) % 4)
 
-    # id to name
-    numbered: dict[int, str] = {}
+        os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+        temp_filename = f"{filename}.tmp"
+        with open(temp_filename, "wb") as file:
+            file.write(BLOCK_CACHE_HEADER.pack(
+                BLOCK_CACHE_MAGIC, BLOCK_CACHE_VERSION, content_hash, MAX_BLOCKS, len(BLOCK_FACES),
+                self._atlas.size, self._atlas.layers.shape[0], len(registry)))
+            file.write(registry)
+            file.write(self._faces.astype("<u4").tobytes())
+            file.write(np.ascontiguousarray(self._atlas.layers).tobytes())
+        os.replace(temp_filename, filename)
 
-    @classmethod
-    def initialize(cls):
+    def read_cache(self, filename: str, content_hash: bytes) -> bool:
         """
-        Initializes blocks
+        Reads the registry from a cache file; texture layers are mapped from the file
+        :param filename: cache filename
+        :param content_hash: hash of the assets the cache must be built from
+        :return: True when the cache was read; False when it is missing or out of date
         """
 
-        # iterate over blocks
-        for file in glob.glob(f"{TEXTURE_DIR}/blocks/**/*", recursive=True):
-            # skip directories
-            if os.path.isdir(file):
-                continue
+        try:
+            # copy on write mapping; GL uploads need a writable buffer, while the file is never written
+            with open(filename, "rb") as file:
+                cache = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY)
+        except (OSError, ValueError):
+            return False
 
-            # skip all non-json files
-            if os.path.splitext(file)[1] != ".json":
-                continue
+        try:
+            magic, version, cache_hash, blocks, faces, size, layers, registry_length = \
+                BLOCK_CACHE_HEADER.unpack_from(cache)
+            faces_start = BLOCK_CACHE_HEADER.size + registry_length
+            layers_start = faces_start + blocks * faces * 4
+            if (magic, version, cache_hash, blocks, faces) != \
+                    (BLOCK_CACHE_MAGIC, BLOCK_CACHE_VERSION, content_hash, MAX_BLOCKS, len(BLOCK_FACES)) or \
+                    len(cache) != layers_start + layers * size * size * 4:
+                raise ValueError("Outdated cache")
+            registry = json.loads(cache[BLOCK_CACHE_HEADER.size: faces_start])
 
-            # process the block configs
-            with open(file, "r", encoding="ascii") as f:
-                config = json.load(f)
+            # malformed registry is rebuilt like an outdated one
+            numbered = {block_id: name for block_id, name in registry["blocks"]}
+            named = {name: block_id for block_id, name in registry["blocks"]}
+            textures = dict(registry["textures"])
+        except (struct.error, ValueError, KeyError, TypeError):
+            cache.close()
+            return False
 
-            cls.named[config["name"]] = config["id"]
-            cls.numbered[config["id"]] = config["name"]
+        self.mmap = cache
+        self._numbered = numbered
+        self._named = named
+        self._faces = np.frombuffer(cache, dtype="<u4", count=blocks * faces, offset=faces_start).reshape([blocks, faces])
+        self._atlas = TextureAtlas(
+            np.frombuffer(cache, dtype=np.uint8, offset=layers_start).reshape([layers, size, size, 4]), textures)
+        self.make_tables()
+        return True
 
 
-Blocks.initialize()
+# block registry; loaded on first use
+Blocks: BlockRegistry = BlockRegistry()
@@ -0,0 +1,78 @@
+"""
+Log of world changes
+"""
+
+
+import time
+import numpy as np
+from source.options import *
+
+
+class ChangeLog:
+    """
+    Blocks and chunks changed since the last 'flush' call. Block changes are coalesced; only the last value of every
+    block is kept. Blocks are keyed by 'chunk_index * CHUNK_VOLUME + local index'. Chunks changed as a whole,
+    by box fills, replaces and loads, are kept as chunk indices, and replace block changes within them
+    """
+
+    def __init__(self):
+        # changed block values; changed chunks
+        self.blocks: dict[int, int] = {}
+        self.chunks: set[int] = set()
+
+        # time of the oldest change since the last 'flush' call, None when there were no changes
+        self.since: float | None = None
+
+    def record_block(self, chunk_index: int, index: int, value: int):
+        """
+        Records a changed block
+        :param chunk_index: chunk index
+        :param index: local block index
+        :param value: new block id
+        """
+
+        if self.since is None:
+            self.since = time.monotonic()
+        self.blocks[chunk_index * CHUNK_VOLUME + index] = value
+
+    def record_blocks(self, chunk_index: int, indices: np.ndarray, values: np.ndarray):
+        """
+        Records changed blocks of a chunk
+        :param chunk_index: chunk index
+        :param indices: array of local block indices
+        :param values: array of new block ids
+        """
+
+        if self.since is None:
+            self.since = time.monotonic()
+        self.blocks.update(zip((indices + chunk_index * CHUNK_VOLUME).tolist(), values.tolist()))
+
+    def record_chunk(self, chunk_index: int):
+        """
+        Records a chunk changed as a whole
+        :param chunk_index: chunk index
+        """
+
+        if self.since is None:
+            self.since = time.monotonic()
+        self.chunks.add(chunk_index)
+
+    def flush(self) -> tuple[np.ndarray, np.ndarray, list[int], float | None]:
+        """
+        Takes the changes out of the log
+        :return: sorted array of changed block keys, array of their values, sorted list of changed chunks,
+                 and time of the oldest change
+        """
+
+        keys = np.fromiter(self.blocks.keys(), dtype=np.int64, count=len(self.blocks))
+        values = np.fromiter(self.blocks.values(), dtype=np.uint8, count=len(self.blocks))
+        chunks = sorted(self.chunks)
+        since = self.since
+        self.blocks, self.chunks, self.since = {}, set(), None
+
+        # blocks of whole changed chunks are sent with their chunk
+        if chunks:
+            kept = ~np.isin(keys // CHUNK_VOLUME, chunks)
+            keys, values = keys[kept], values[kept]
+        order = np.argsort(keys)
+        return keys[order], values[order], chunks, since
@@ -0,0 +1,184 @@
+"""
+Chunk storage
+"""
+
+
+import numpy as np
+from source.options import *
+
+
+# shifts used to (un)pack palette indices; key is amount of bits per index
+PACKING_SHIFTS: dict[int, np.ndarray] = {
+    bits: np.arange(0, 8, bits, dtype=np.uint8) for bits in (1, 2, 4, 8)}
+
+
+class Chunk:
+    """
+    Cube of 'CHUNK_SIZE' blocks that contains more than one block type.
+    Stores a palette of block ids and bit packed palette indices.
+    Chunks filled with a single block are stored by the world as a plain int instead.
+    """
+
+    __slots__ = ("palette", "lookup", "bits", "data")
+
+    def __init__(self, palette: list[int], bits: int, data: bytearray):
+        # palette index to block id
+        self.palette: list[int] = palette
+
+        # block id to palette index
+        self.lookup: dict[int, int] = {value: index for index, value in enumerate(palette)}
+
+        # bits per palette index; one of 1, 2, 4 or 8
+        self.bits: int = bits
+
+        # packed palette indices
+        self.data: bytearray = data
+
+    @classmethod
+    def split(cls, value: int, position: int, new_value: int) -> "Chunk":
+        """
+        Makes a chunk out of a single block chunk with one block changed.
+        :param value: block id of the single block chunk
+        :param position: local index of the changed block
+        :param new_value: new block id at given position
+        :return: new chunk
+        """
+
+        chunk = cls([value, new_value], 1, bytearray(CHUNK_VOLUME // 8))
+        chunk.data[position >> 3] = 1 << (position & 7)
+        return chunk
+
+    @classmethod
+    def from_array(cls, voxels: np.ndarray) -> "int | Chunk":
+        """
+        Packs the chunk.
+        :param voxels: flat array of 'CHUNK_VOLUME' block ids in local ZYX order
+        :return: block id when chunk is made of a single block, chunk otherwise
+        """
+
+        counts = np.bincount(voxels, minlength=256)
+        palette = np.flatnonzero(counts)
+        if palette.size == 1:
+            return int(palette[0])
+
+        lookup = np.zeros(256, dtype=np.uint8)
+        lookup[palette] = np.arange(palette.size)
+        bits = cls.bits_for(palette.size)
+        return cls(palette.tolist(), bits, cls.pack(lookup[voxels], bits))
+
+    @staticmethod
+    def bits_for(size: int) -> int:
+        """
+        Returns amount of bits per index for palette of given size
+        """
+
+        if size <= 2:
+            return 1
+        if size <= 4:
+            return 2
+        if size <= 16:
+            return 4
+        return 8
+
+    @staticmethod
+    def pack(indices: np.ndarray, bits: int) -> bytearray:
+        """
+        Packs palette indices.
+        :param indices: flat array of palette indices
+        :param bits: bits per index
+        :return: packed indices
+        """
+
+        shifted = indices.astype(np.uint8).reshape(-1, 8 // bits) << PACKING_SHIFTS[bits]
+        return bytearray(np.bitwise_or.reduce(shifted, axis=1).tobytes())
+
+    def unpack(self) -> np.ndarray:
+        """
+        Unpacks palette indices.
+        :return: flat array of palette indices
+        """
+
+        data = np.frombuffer(self.data, dtype=np.uint8)
+        return ((data[:, None] >> PACKING_SHIFTS[self.bits]) & ((1 << self.bits) - 1)).reshape(-1)
+
+    def to_array(self) -> np.ndarray:
+        """
+        Unpacks the chunk.
+        :return: flat array of 'CHUNK_VOLUME' block ids in local ZYX order
+        """
+
+        return np.array(self.palette, dtype=np.uint8)[self.unpack()]
+
+    def compact(self) -> "int | Chunk":
+        """
+        Repacks the chunk, dropping unused palette entries.
+        :return: block id when chunk is made of a single block, compacted chunk otherwise
+        """
+
+        return Chunk.from_array(self.to_array())
+
+    def copy(self) -> "Chunk":
+        """
+        Copies the chunk; changes to the copy don't affect the original.
+        :return: copied chunk
+        """
+
+        return Chunk(list(self.palette), self.bits, bytearray(self.data))
+
+    def get(self, index: int) -> int:
+        """
+        Gets block at given local index.
+        :param index: local block index
+        :return: block id
+        """
+
+        bits = self.bits
+        per_byte = 8 // bits
+        return self.palette[(self.data[index // per_byte] >> ((index % per_byte) * bits)) & ((1 << bits) - 1)]
+
+    def get_many(self, indices: np.ndarray) -> np.ndarray:
+        """
+        Gets blocks at given local indices without unpacking the whole chunk.
+        :param indices: array of local block indices
+        :return: array of block ids
+        """
+
+        bits = self.bits
+        per_byte = 8 // bits
+        data = np.frombuffer(self.data, dtype=np.uint8)
+        shifts = ((indices % per_byte) * bits).astype(np.uint8)
+        palette_indices = (data[indices // per_byte] >> shifts) & ((1 << bits) - 1)
+        return np.array(self.palette, dtype=np.uint8)[palette_indices]
+
+    def set(self, index: int, value: int) -> None:
+        """
+        Sets block at given local index.
+        :param index: local block index
+        :param value: block id
+        """
+
+        palette_index = self.lookup.get(value)
+        if palette_index is None:
+            palette_index = len(self.palette)
+            self.palette.append(value)
+            self.lookup[value] = palette_index
+
+            # palette has outgrown the index size
+            if palette_index >= 1 << self.bits:
+                indices = self.unpack()
+                self.bits = self.bits_for(len(self.palette))
+                self.data = self.pack(indices, self.bits)
+
+        bits = self.bits
+        per_byte = 8 // bits
+        shift = (index % per_byte) * bits
+        byte = index // per_byte
+        self.data[byte] = (self.data[byte] & ~(((1 << bits) - 1) << shift)) | (palette_index << shift)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Approximate amount of memory used by the chunk data
+        """
+
+        return len(self.data) + len(self.palette)
@@ -13,3 +13,21 @@ class WorldGenSizeError(GameException):
     """
     Error relating to incorrect world size
     """
+
+
+class WorldSaveError(GameException):
+    """
+    Error relating to unreadable or incompatible save files
+    """
+
+
+class TextureLoadError(GameException):
+    """
+    Error relating to missing or invalid texture assets
+    """
+
+
+class WorldSyncError(GameException):
+    """
+    Error relating to malformed world sync messages
+    """
@@ -0,0 +1,175 @@
+"""
+Column heights and bounds of the world
+"""
+
+
+import numpy as np
+from source.blocks import *
+from source.options import *
+
+
+class HeightMap:
+    """
+    Height of the top and the bottom solid block of every block column, and the box around all solid blocks.
+    Single block changes update their column right away, unless they remove its top or bottom block;
+    such columns and changed chunks are scanned again by the next 'update' call.
+    Heights have the same layout as the world, including its wrapping offset when the world is a window;
+    the box is in unwrapped coordinates
+    """
+
+    def __init__(self, world, offset: tuple[int, int, int] = (0, 0, 0)):
+        """
+        :param world: world to measure
+        :param offset: offset of the world origin within the wrapped world
+        """
+
+        self.world = world
+        self.offset: tuple[int, int, int] = offset
+
+        # YX height above the top solid block, 0 for empty columns; height of the bottom one, 'WORLD_SIZE' for empty
+        self.top: np.ndarray = np.zeros([WORLD_SIZE, WORLD_SIZE], dtype=np.int16)
+        self.bottom: np.ndarray = np.full([WORLD_SIZE, WORLD_SIZE], WORLD_SIZE, dtype=np.int16)
+
+        # chunk columns and block columns to scan again; box around solid blocks, None when it has to be recomputed
+        self.pending_chunks: set[int] = set()
+        self.pending_columns: set[tuple[int, int]] = set()
+        self._bounds: tuple[tuple[int, int, int], tuple[int, int, int]] | None = None
+
+        self.build()
+
+    @property
+    def bounds(self) -> tuple[tuple[int, int, int], tuple[int, int, int]]:
+        """
+        Min and max (exclusive) corner of the box around all solid blocks, in unwrapped coordinates.
+        Both corners are zero when there are no solid blocks
+        """
+
+        self.update()
+        if self._bounds is None:
+            top = self.unwrap(self.top)
+            filled = top > 0
+            if not filled.any():
+                self._bounds = (0, 0, 0), (0, 0, 0)
+            else:
+                rows, columns = np.flatnonzero(filled.any(axis=1)), np.flatnonzero(filled.any(axis=0))
+                self._bounds = (
+                    (int(columns[0]), int(rows[0]), int(self.bottom[self.top > 0].min())),
+                    (int(columns[-1]) + 1, int(rows[-1]) + 1, int(top.max())))
+        return self._bounds
+
+    def build(self):
+        """
+        Scans all columns
+        """
+
+        self.pending_chunks.update(range(WORLD_CHUNKS ** 2))
+        self.update()
+
+    def move(self, offset: tuple[int, int, int]):
+        """
+        Changes the wrapping offset of the world; heights stay, the box moves
+        :param offset: new offset of the world origin
+        """
+
+        self.offset = offset
+        self._bounds = None
+
+    def mark_chunk(self, chunk_index: int):
+        """
+        Marks the chunk as changed; its block columns are scanned by the next 'update' call
+        :param chunk_index: chunk index
+        """
+
+        self.pending_chunks.add(chunk_index % WORLD_CHUNKS ** 2)
+
+    def update_block(self, position: tuple[int, int, int], value: int):
+        """
+        Updates the column of a changed block
+        :param position: block position
+        :param value: new block id
+        """
+
+        x, y, z = position
+        if Blocks.solid[value]:
+            if z + 1 > self.top[y, x] or z < self.bottom[y, x]:
+                self.top[y, x] = max(self.top[y, x], z + 1)
+                self.bottom[y, x] = min(self.bottom[y, x], z)
+                self._bounds = None
+        elif z + 1 == self.top[y, x] or z == self.bottom[y, x]:
+            self.pending_columns.add((x, y))
+
+    def update(self):
+        """
+        Scans changed chunk columns and block columns
+        """
+
+        for chunk_column in sorted(self.pending_chunks):
+            self.scan_chunk_column(chunk_column)
+        self.pending_chunks.clear()
+
+        if self.pending_columns:
+            xs, ys = np.array(sorted(self.pending_columns), dtype=np.int64).T
+            self.pending_columns.clear()
+            zs = np.arange(WORLD_SIZE)
+            coords = np.stack(np.broadcast_arrays(xs[:, None], ys[:, None], zs[None, :]), axis=2)
+            solid = Blocks.solid[self.world.get_many(coords.reshape(-1, 3))].reshape(xs.size, WORLD_SIZE)
+            self.top[ys, xs], self.bottom[ys, xs] = self.heights(solid)
+            self._bounds = None
+
+    def scan_chunk_column(self, chunk_column: int):
+        """
+        Scans block columns of a chunk column; chunks of a single kind of block aren't unpacked
+        :param chunk_column: index of the chunk column, 'y * WORLD_CHUNKS + x'
+        """
+
+        solid = np.empty([WORLD_SIZE, CHUNK_SIZE, CHUNK_SIZE], dtype=np.bool_)
+        for chunk_z in range(WORLD_CHUNKS):
+            chunk_index = chunk_z * WORLD_CHUNKS ** 2 + chunk_column
+            chunk = self.world.get_chunk(chunk_index)
+            layers = slice(chunk_z * CHUNK_SIZE, (chunk_z + 1) * CHUNK_SIZE)
+            if isinstance(chunk, int):
+                solid[layers] = Blocks.solid[chunk]
+            else:
+                solid[layers] = Blocks.solid[self.world.get_chunk_array(chunk_index)]
+
+        chunk_y, chunk_x = divmod(chunk_column, WORLD_CHUNKS)
+        rows = slice(chunk_y * CHUNK_SIZE, (chunk_y + 1) * CHUNK_SIZE)
+        columns = slice(chunk_x * CHUNK_SIZE, (chunk_x + 1) * CHUNK_SIZE)
+        top, bottom = self.heights(solid.reshape(WORLD_SIZE, -1).T)
+        self.top[rows, columns] = top.reshape(CHUNK_SIZE, CHUNK_SIZE)
+        self.bottom[rows, columns] = bottom.reshape(CHUNK_SIZE, CHUNK_SIZE)
+        self._bounds = None
+
+    @staticmethod
+    def heights(solid: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Finds top and bottom heights of block columns
+        :param solid: bool array of whether blocks are solid with shape (columns, WORLD_SIZE), bottom to top
+        :return: arrays of top and bottom heights
+        """
+
+        filled = solid.any(axis=1)
+        top = np.where(filled, WORLD_SIZE - np.argmax(solid[:, ::-1], axis=1), 0)
+        bottom = np.where(filled, np.argmax(solid, axis=1), WORLD_SIZE)
+        return top, bottom
+
+    def height(self, x: int, y: int) -> int:
+        """
+        Gets height above the top solid block of a column
+        :param x: column x, in the world layout
+        :param y: column y, in the world layout
+        :return: z of the lowest block with only non solid blocks above; 0 for empty columns
+        """
+
+        if self.pending_chunks or self.pending_columns:
+            self.update()
+        return int(self.top[y, x])
+
+    def unwrap(self, grid: np.ndarray) -> np.ndarray:
+        """
+        Moves the world origin of a YX grid in the world layout to the grid origin
+        :param grid: YX array
+        :return: unwrapped YX array
+        """
+
+        return np.roll(grid, (-self.offset[1], -self.offset[0]), axis=(0, 1))
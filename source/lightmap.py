@@ -0,0 +1,228 @@
+"""
+Precomputed sun visibility
+"""
+
+
+import math
+import numpy as np
+from concurrent.futures import Executor, Future
+from source.blocks import *
+from source.options import *
+
+
+class SunLightmap:
+    """
+    Amount of sunlight that passes through every block of the world, from 0 to 255.
+    Light goes down along the sun direction, and every block it passes lets through '1 - opacity' of it.
+    World is swept along sheared columns; each column follows one sun ray, stepping a layer at a time,
+    so every block belongs to exactly one column, and a changed block only affects the columns passing through it.
+    Lightmap has the same layout as the world, including its wrapping offset when the world is a window.
+    With an executor, whole sweeps run on it from a snapshot of the world, and are swapped in when they are done
+    """
+
+    def __init__(
+            self,
+            world,
+            sun: tuple[float, float, float],
+            offset: tuple[int, int, int] = (0, 0, 0),
+            executor: Executor | None = None):
+        """
+        :param world: world to light
+        :param sun: sun direction; has to point downwards
+        :param offset: offset of the world origin within the wrapped world
+        :param executor: executor whole sweeps run on after the first one; they run on the calling thread without it
+        """
+
+        self.world = world
+        self.offset: tuple[int, int, int] = offset
+        self.executor: Executor | None = executor
+
+        # horizontal shift of the sun ray per layer, and integer column shift of every layer
+        step = (-sun[0] / sun[2], -sun[1] / sun[2])
+        self.shifts: np.ndarray = np.array([
+            [math.floor(z * step[axis] + 0.5) for z in range(WORLD_SIZE)] for axis in range(2)], dtype=np.int64)
+        self.shifts -= self.shifts.min(axis=1, keepdims=True)
+
+        # ZYX light of every block, in the world layout
+        self.light: np.ndarray = np.zeros([WORLD_SIZE] * 3, dtype=np.uint8)
+
+        # chunks changed since the last 'update' call; changed ranges of the flat lightmap waiting for upload
+        self.pending: set[int] = set()
+        self.changed: list[tuple[int, int]] = []
+
+        # whole sweep running on the executor
+        self.sweeping: Future | None = None
+
+        self.build()
+
+    def build(self):
+        """
+        Sweeps the whole world, top to bottom, on the calling thread
+        """
+
+        self.pending.clear()
+        self.light, changed = self.sweep(self.world, self.offset)
+        self.changed.extend(changed)
+
+    def rebuild(self):
+        """
+        Sweeps the whole world again. With an executor, the sweep runs on it from a snapshot of the world;
+        until an 'update' call swaps the result in, the old lightmap is kept, and changed chunks wait for the swap
+        """
+
+        if self.executor is None:
+            self.build()
+            return
+
+        # the snapshot has all the changes made so far; only later changes have to be swept after the swap
+        self.pending.clear()
+        self.sweeping = self.executor.submit(self.sweep, self.world.snapshot(), self.offset)
+
+    def sweep(self, world, offset: tuple[int, int, int]) -> tuple[np.ndarray, list[tuple[int, int]]]:
+        """
+        Sweeps the whole world, top to bottom. Only reads the world and the current lightmap, so it can run
+        on another thread when given a snapshot of the world
+        :param world: world, or its snapshot
+        :param offset: offset of the world origin within the wrapped world
+        :return: new lightmap, and its ranges that differ from the current lightmap
+        """
+
+        opacity = Blocks.opacity
+        voxels = np.roll(world.get_voxels().reshape([WORLD_SIZE] * 3), (-offset[1], -offset[0]), axis=(1, 2))
+
+        # light left in every column; columns outside the world are never blocked
+        carry = np.ones(self.columns_shape(), dtype=np.float32)
+        light = np.empty([WORLD_SIZE] * 3, dtype=np.uint8)
+        for z in range(WORLD_SIZE - 1, -1, -1):
+            layer = carry[
+                self.shifts[1, z]: self.shifts[1, z] + WORLD_SIZE,
+                self.shifts[0, z]: self.shifts[0, z] + WORLD_SIZE]
+            layer *= 1 - opacity[voxels[z]]
+            light[z] = layer * 255 + 0.5
+
+        light = np.roll(light, (offset[1], offset[0]), axis=(1, 2))
+        return light, self.ranges(np.flatnonzero(light != self.light))
+
+    def move(self, offset: tuple[int, int, int]):
+        """
+        Changes the wrapping offset of the world, which moves the columns; the lightmap is swept again,
+        on the executor when there is one
+        :param offset: new offset of the world origin
+        """
+
+        self.offset = offset
+        self.rebuild()
+
+    def mark_chunk(self, chunk_index: int):
+        """
+        Marks the chunk as changed; columns passing through it are swept by the next 'update' call
+        :param chunk_index: chunk index
+        """
+
+        self.pending.add(chunk_index)
+
+    def update(self, wait: bool = False):
+        """
+        Swaps in the finished whole sweep, and sweeps columns passing through changed chunks.
+        Does nothing while a whole sweep is still running
+        :param wait: wait for the running whole sweep to finish, and for the one started when too many chunks changed
+        """
+
+        if self.sweeping is not None:
+            if not wait and not self.sweeping.done():
+                return
+            self.light, changed = self.sweeping.result()
+            self.sweeping = None
+            self.changed.extend(changed)
+
+        if not self.pending:
+            return
+
+        # chunk positions within the unwrapped world
+        chunks = np.array(sorted(self.pending), dtype=np.int64)
+        self.pending.clear()
+        chunk_y, chunk_x = np.divmod(chunks, WORLD_CHUNKS)
+        chunk_z, chunk_y = np.divmod(chunk_y, WORLD_CHUNKS)
+        chunk_x = (chunk_x - self.offset[0] // CHUNK_SIZE) % WORLD_CHUNKS
+        chunk_y = (chunk_y - self.offset[1] // CHUNK_SIZE) % WORLD_CHUNKS
+
+        # columns passing through the chunks; column of a block is its position plus the shift of its layer
+        columns = np.zeros(self.columns_shape(), dtype=np.bool_)
+        for x, y, z in zip(chunk_x.tolist(), chunk_y.tolist(), chunk_z.tolist()):
+            shifts = self.shifts[:, z * CHUNK_SIZE: (z + 1) * CHUNK_SIZE]
+            low, high = shifts.min(axis=1), shifts.max(axis=1)
+            columns[
+                y * CHUNK_SIZE + low[1]: (y + 1) * CHUNK_SIZE + high[1],
+                x * CHUNK_SIZE + low[0]: (x + 1) * CHUNK_SIZE + high[0]] = True
+
+        # gathering blocks one by one is slower than sweeping the whole world, once there are many columns
+        if np.count_nonzero(columns) > columns.size // 32:
+            self.rebuild()
+            if wait:
+                self.update(wait)
+            return
+        column_y, column_x = np.nonzero(columns)
+
+        # blocks of every column, top to bottom
+        zs = np.arange(WORLD_SIZE - 1, -1, -1)
+        xs = column_x[None, :] - self.shifts[0, zs][:, None]
+        ys = column_y[None, :] - self.shifts[1, zs][:, None]
+        zs = np.broadcast_to(zs[:, None], xs.shape)
+        inside = (xs > -1) & (xs < WORLD_SIZE) & (ys > -1) & (ys < WORLD_SIZE)
+        xs, ys, zs = xs[inside], ys[inside], zs[inside]
+
+        wrapped = np.stack([(xs + self.offset[0]) % WORLD_SIZE, (ys + self.offset[1]) % WORLD_SIZE, zs], axis=1)
+        passed = np.ones(inside.shape, dtype=np.float32)
+        passed[inside] = 1 - Blocks.opacity[self.world.get_many(wrapped)]
+        light = (np.cumprod(passed, axis=0)[inside] * 255 + 0.5).astype(np.uint8)
+
+        # only blocks whose light changed are written
+        indices = (wrapped[:, 2] * WORLD_SIZE + wrapped[:, 1]) * WORLD_SIZE + wrapped[:, 0]
+        flat = self.light.reshape(-1)
+        changed = light != flat[indices]
+        indices, light = indices[changed], light[changed]
+        flat[indices] = light
+        self.changed.extend(self.ranges(np.sort(indices)))
+
+    def columns_shape(self) -> tuple[int, int]:
+        """
+        Shape of the YX grid of columns
+        """
+
+        return WORLD_SIZE + int(self.shifts[1].max()), WORLD_SIZE + int(self.shifts[0].max())
+
+    @staticmethod
+    def ranges(changed: np.ndarray) -> list[tuple[int, int]]:
+        """
+        Makes ranges of the flat lightmap out of changed blocks
+        :param changed: sorted indices of changed blocks
+        :return: list of start and end indices, in bytes
+        """
+
+        if changed.size == 0:
+            return []
+
+        # nearby changes are merged into one range; the gap is cheaper to upload than another write
+        breaks = np.flatnonzero(np.diff(changed) > 64) + 1
+        starts = changed[np.concatenate([[0], breaks])]
+        ends = changed[np.concatenate([breaks - 1, [changed.size - 1]])] + 1
+        return list(zip(starts.tolist(), ends.tolist()))
+
+    def pop_changed_ranges(self) -> list[tuple[int, int]]:
+        """
+        Takes ranges of the flat lightmap changed since the last call
+        :return: list of start and end indices, in bytes
+        """
+
+        changed, self.changed = self.changed, []
+        return changed
+
+    def get_linear(self, start: int, end: int) -> np.ndarray:
+        """
+        Gets part of the flat lightmap
+        :param start: start index
+        :param end: end index, exclusive
+        :return: uint8 array
+        """
+
+        return self.light.reshape(-1)[start:end]
@@ -0,0 +1,262 @@
+"""
+Greedy meshing of the world
+"""
+
+
+import time
+import numpy as np
+from source.blocks import *
+from source.options import *
+
+
+class WorldMesh:
+    """
+    Visible block faces of every chunk, merged into quads.
+    Face is visible when its block is solid and the block in front of it isn't opaque. Faces of a chunk layer
+    are merged along rows first, then rows of the same start, length and texture are merged together.
+    Chunks are meshed in batches, with all the chunks, faces and layers compared at once.
+    Changed chunks are remembered, and meshed again by the next 'update' call.
+    Quads use the world layout, including its wrapping offset when the world is a window, so that moving the window
+    only changes faces at its edges. Every quad is two integers:
+    'x | y << 8 | z << 16 | face << 24' of its lowest block, and 'width - 1 | height - 1 << 8 | layer << 16'
+    """
+
+    def __init__(self, world, offset: tuple[int, int, int] = (0, 0, 0)):
+        """
+        :param world: world to mesh
+        :param offset: offset of the world origin within the wrapped world
+        """
+
+        self.world = world
+        self.offset: tuple[int, int, int] = offset
+
+        # quads of every chunk; chunks without visible faces are left out
+        self.quads: dict[int, np.ndarray] = {}
+
+        # chunks changed since the last 'update' call; whether quads changed since the last 'pack' call
+        self.pending: set[int] = set(range(WORLD_CHUNKS ** 3))
+        self.dirty: bool = True
+
+        # counters of the last 'update' call
+        self.meshed_chunks: int = 0
+        self.meshed_faces: int = 0
+        self.meshed_quads: int = 0
+        self.meshed_seconds: float = 0.0
+
+    def mark_chunk(self, chunk_index: int):
+        """
+        Marks the chunk as changed; it and its neighbours, whose faces may be covered by it,
+        are meshed by the next 'update' call
+        :param chunk_index: chunk index
+        """
+
+        # window wraps along X and Y, so neighbours do too
+        chunk_y, chunk_x = divmod(chunk_index, WORLD_CHUNKS)
+        chunk_z, chunk_y = divmod(chunk_y, WORLD_CHUNKS)
+        for x, y, z in (
+                (chunk_x, chunk_y, chunk_z),
+                (chunk_x - 1, chunk_y, chunk_z), (chunk_x + 1, chunk_y, chunk_z),
+                (chunk_x, chunk_y - 1, chunk_z), (chunk_x, chunk_y + 1, chunk_z),
+                (chunk_x, chunk_y, chunk_z - 1), (chunk_x, chunk_y, chunk_z + 1)):
+            if -1 < z < WORLD_CHUNKS:
+                self.pending.add((z * WORLD_CHUNKS + y % WORLD_CHUNKS) * WORLD_CHUNKS + x % WORLD_CHUNKS)
+
+    def move(self, offset: tuple[int, int, int]):
+        """
+        Changes the wrapping offset of the world. Chunks at the old and the new window edges gain or lose
+        their neighbours, and are meshed again
+        :param offset: new offset of the world origin
+        """
+
+        for edge_offset in (self.offset, offset):
+            for axis in range(2):
+                for edge in (0, WORLD_CHUNKS - 1):
+                    shift = (edge + edge_offset[axis] // CHUNK_SIZE) % WORLD_CHUNKS
+                    column = np.arange(WORLD_CHUNKS)
+                    positions = [column[:, None, None], column[None, :, None], column[None, None, :]]
+                    positions[2 - axis] = np.array(shift).reshape(1, 1, 1)
+                    indices = (positions[0] * WORLD_CHUNKS + positions[1]) * WORLD_CHUNKS + positions[2]
+                    self.pending.update(indices.reshape(-1).tolist())
+        self.offset = offset
+
+    def update(self, limit: int | None = None) -> int:
+        """
+        Meshes changed chunks
+        :param limit: max amount of chunks to mesh; the rest is left for later calls
+        :return: amount of meshed chunks
+        """
+
+        if not self.pending:
+            self.meshed_chunks = self.meshed_faces = self.meshed_quads = 0
+            self.meshed_seconds = 0.0
+            return 0
+
+        chunk_indices = sorted(self.pending)
+        if limit is not None:
+            chunk_indices = chunk_indices[:limit]
+        self.pending.difference_update(chunk_indices)
+
+        start = time.perf_counter()
+        quads, faces = self.mesh_chunks(chunk_indices)
+        for chunk_index, chunk_quads in zip(chunk_indices, quads):
+            if chunk_quads.shape[0] > 0:
+                self.quads[chunk_index] = chunk_quads
+            else:
+                self.quads.pop(chunk_index, None)
+        self.dirty = True
+
+        self.meshed_chunks = len(chunk_indices)
+        self.meshed_faces = int(faces.sum())
+        self.meshed_quads = sum(chunk_quads.shape[0] for chunk_quads in quads)
+        self.meshed_seconds = time.perf_counter() - start
+        return self.meshed_chunks
+
+    def pack(self) -> np.ndarray:
+        """
+        Concatenates quads of all chunks, in the layout used by the mesh shader
+        :return: uint32 array with shape (quads, 2)
+        """
+
+        self.dirty = False
+        if not self.quads:
+            return np.zeros([0, 2], dtype=np.uint32)
+        return np.concatenate(list(self.quads.values()))
+
+    def padded_chunks(self, chunk_indices: list[int]) -> np.ndarray:
+        """
+        Gets blocks of the chunks, padded with faces of their neighbours. Neighbours outside the window,
+        and edges and corners of the padding, are air
+        :param chunk_indices: chunk indices
+        :return: ZYX array with shape (chunks, CHUNK_SIZE + 2, CHUNK_SIZE + 2, CHUNK_SIZE + 2)
+        """
+
+        padded = np.zeros([len(chunk_indices)] + [CHUNK_SIZE + 2] * 3, dtype=np.uint8)
+        inner = slice(1, CHUNK_SIZE + 1)
+        offset = [self.offset[axis] // CHUNK_SIZE for axis in range(3)]
+
+        # padding faces; ZYX slice of the padding and of the neighbour along every axis and direction
+        sides = []
+        for axis in range(3):
+            for step, target, source in ((-1, 0, CHUNK_SIZE - 1), (1, CHUNK_SIZE + 1, 0)):
+                padding = [inner, inner, inner]
+                padding[2 - axis] = target
+                neighbour = [slice(None)] * 3
+                neighbour[2 - axis] = source
+                sides.append((axis, step, tuple(padding), tuple(neighbour)))
+
+        # every chunk is unpacked once, even when it neighbours several meshed chunks
+        arrays = {}
+        for number, chunk_index in enumerate(chunk_indices):
+            if chunk_index not in arrays:
+                arrays[chunk_index] = self.world.get_chunk_array(chunk_index)
+            padded[number, inner, inner, inner] = arrays[chunk_index]
+
+            chunk_y, chunk_x = divmod(chunk_index, WORLD_CHUNKS)
+            chunk_z, chunk_y = divmod(chunk_y, WORLD_CHUNKS)
+            wrapped = (chunk_x, chunk_y, chunk_z)
+            for axis, step, padding, neighbour in sides:
+                # neighbours are found in the unwrapped window
+                position = (wrapped[axis] - offset[axis]) % WORLD_CHUNKS + step
+                if not -1 < position < WORLD_CHUNKS:
+                    continue
+                position = list(wrapped)
+                position[axis] = (position[axis] + step) % WORLD_CHUNKS
+                neighbour_index = (position[2] * WORLD_CHUNKS + position[1]) * WORLD_CHUNKS + position[0]
+                chunk = self.world.get_chunk(neighbour_index)
+                if isinstance(chunk, int):
+                    padded[(number, *padding)] = chunk
+                    continue
+                if neighbour_index not in arrays:
+                    arrays[neighbour_index] = self.world.get_chunk_array(neighbour_index)
+                padded[(number, *padding)] = arrays[neighbour_index][neighbour]
+        return padded
+
+    def mesh_chunks(self, chunk_indices: list[int]) -> tuple[list[np.ndarray], np.ndarray]:
+        """
+        Meshes chunks
+        :param chunk_indices: chunk indices
+        :return: quads of every chunk, and amount of visible faces of every chunk before merging
+        """
+
+        count = len(chunk_indices)
+        quads = [np.zeros([0, 2], dtype=np.uint32) for _ in range(count)]
+        faces = np.zeros(count, dtype=np.int64)
+
+        # chunks of a single kind of block can only have faces when it is solid
+        meshed = []
+        for number, chunk_index in enumerate(chunk_indices):
+            chunk = self.world.get_chunk(chunk_index)
+            if not isinstance(chunk, int) or Blocks.solid[chunk]:
+                meshed.append(number)
+        if not meshed:
+            return quads, faces
+
+        padded = self.padded_chunks([chunk_indices[number] for number in meshed])
+        solid = Blocks.solid
+        opaque = solid & ~Blocks.transparent
+        layers = Blocks.faces.astype(np.int64)
+        inner = slice(1, CHUNK_SIZE + 1)
+        blocks = padded[:, inner, inner, inner]
+
+        chunk_quads, chunk_faces = [], []
+        for face in range(len(BLOCK_FACES)):
+            axis, step = face // 2, 1 - face % 2 * 2
+
+            # block in front of every face
+            front = [inner, inner, inner]
+            front[2 - axis] = slice(1 + step, CHUNK_SIZE + 1 + step)
+            visible = solid[blocks] & ~opaque[padded[(slice(None), *front)]]
+
+            # face key is its texture layer + 1, 0 when there is no face; axes are (chunk, layer, row, column),
+            # columns go along the next axis after the normal, rows along the one after it
+            keys = np.where(visible, layers[blocks, face] + 1, 0)
+            u_axis, v_axis = (axis + 1) % 3, (axis + 2) % 3
+            keys = keys.transpose(0, 3 - axis, 3 - v_axis, 3 - u_axis)
+            chunk_faces.append(np.count_nonzero(keys, axis=(1, 2, 3)))
+
+            # merge faces along rows into runs
+            before = np.pad(keys, ((0, 0), (0, 0), (0, 0), (1, 0)))[..., :-1]
+            after = np.pad(keys, ((0, 0), (0, 0), (0, 0), (0, 1)))[..., 1:]
+            starts = np.nonzero((keys != 0) & (keys != before))
+            ends = np.nonzero((keys != 0) & (keys != after))
+            run_chunk, run_layer, run_row, run_column = starts
+            run_width = ends[3] - run_column + 1
+            run_key = keys[starts]
+
+            # merge runs of neighbouring rows with the same start, width and texture
+            order = np.lexsort((run_row, run_key, run_width, run_column, run_layer, run_chunk))
+            run_chunk, run_layer, run_row, run_column, run_width, run_key = (
+                values[order] for values in (run_chunk, run_layer, run_row, run_column, run_width, run_key))
+            same = np.ones(order.size, dtype=np.bool_)
+            same[0:1] = False
+            for values in (run_chunk, run_layer, run_column, run_width, run_key):
+                same[1:] &= values[1:] == values[:-1]
+            same[1:] &= run_row[1:] == run_row[:-1] + 1
+            first = np.flatnonzero(~same)
+            height = np.diff(np.append(first, order.size))
+
+            # quads; position of the lowest block
+            position = [None] * 3
+            position[axis] = run_layer[first]
+            position[u_axis] = run_column[first]
+            position[v_axis] = run_row[first]
+            chunk_quads.append((
+                run_chunk[first],
+                position[0] | position[1] << 8 | position[2] << 16 | face << 24,
+                (run_width[first] - 1) | (height - 1) << 8 | (run_key[first] - 1) << 16))
+
+        # group quads of every chunk, and move them to the chunk position
+        quad_chunk = np.concatenate([values[0] for values in chunk_quads])
+        quad_position = np.concatenate([values[1] for values in chunk_quads])
+        quad_size = np.concatenate([values[2] for values in chunk_quads])
+        order = np.argsort(quad_chunk, kind="stable")
+        quad_chunk, quad_position, quad_size = quad_chunk[order], quad_position[order], quad_size[order]
+        bounds = np.searchsorted(quad_chunk, np.arange(len(meshed) + 1))
+        faces[meshed] = np.sum(chunk_faces, axis=0)
+        for meshed_number, number in enumerate(meshed):
+            chunk_y, chunk_x = divmod(chunk_indices[number], WORLD_CHUNKS)
+            chunk_z, chunk_y = divmod(chunk_y, WORLD_CHUNKS)
+            origin = (chunk_x | chunk_y << 8 | chunk_z << 16) * CHUNK_SIZE
+            part = slice(bounds[meshed_number], bounds[meshed_number + 1])
+            quads[number] = np.stack([quad_position[part] + origin, quad_size[part]], axis=1).astype(np.uint32)
+        return quads, faces
@@ -0,0 +1,222 @@
+"""
+Coherent noise
+"""
+
+
+import itertools
+import numpy as np
+from collections.abc import Callable
+
+
+# gradients of perlin noise; key is amount of dimensions
+PERLIN_GRADIENTS: dict[int, np.ndarray] = {
+    dimensions: np.array([
+        vector for vector in itertools.product((-1, 0, 1), repeat=dimensions) if any(vector)
+    ], dtype=np.float64) / np.sqrt(dimensions)
+    for dimensions in (1, 2, 3)}
+
+
+class Noise:
+    """
+    Noise functions of any amount of dimensions. Every value depends only on the seed and the coordinates,
+    so any window of the noise can be evaluated on its own, and neighbouring windows line up.
+    Coordinates are arrays, which are broadcast together; separate axes, like 'xs[None, :]' and 'ys[:, None]',
+    evaluate the noise on a grid
+    """
+
+    @staticmethod
+    def hash_integers(seed: int, *coords: np.ndarray | int) -> np.ndarray:
+        """
+        Makes random integers that depend only on the seed and integer coordinates
+        :param seed: random seed
+        :param coords: integer coordinates; arrays are broadcast together
+        :return: array of random uint64 integers
+        """
+
+        state = np.full(np.broadcast_shapes(*[np.shape(coord) for coord in coords]), seed, dtype=np.int64).view(np.uint64)
+        for coord in coords:
+            # splitmix64 of the state mixed with the coordinate
+            state = state ^ np.asarray(coord, dtype=np.int64).view(np.uint64)
+            state = state + np.uint64(0x9E3779B97F4A7C15)
+            state = (state ^ (state >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+            state = (state ^ (state >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+            state = state ^ (state >> np.uint64(31))
+        return state
+
+    @staticmethod
+    def hash_random(seed: int, *coords: np.ndarray | int) -> np.ndarray:
+        """
+        Makes random numbers that depend only on the seed and integer coordinates
+        :param seed: random seed
+        :param coords: integer coordinates; arrays are broadcast together
+        :return: array of random numbers in [0, 1)
+        """
+
+        return Noise.to_random(Noise.hash_integers(seed, *coords))
+
+    @staticmethod
+    def to_random(integers: np.ndarray) -> np.ndarray:
+        """
+        Turns random uint64 integers into random numbers
+        :param integers: array of random integers
+        :return: array of random numbers in [0, 1)
+        """
+
+        return (integers >> np.uint64(11)).astype(np.float64) * 2.0 ** -53
+
+    @staticmethod
+    def lattice(coords: tuple[np.ndarray, ...], period: int) -> tuple[list[np.ndarray], list[np.ndarray]]:
+        """
+        Finds lattice cells the coordinates are in
+        :param coords: coordinates
+        :param period: distance between lattice points
+        :return: lattice cells and positions within them in [0, 1), for every axis
+        """
+
+        cells = [np.floor_divide(coord, period).astype(np.int64) for coord in coords]
+        local = [(coord - cell * period) / period for coord, cell in zip(coords, cells)]
+        return cells, local
+
+    @staticmethod
+    def corners(
+            seed: int,
+            salt: int,
+            cells: list[np.ndarray],
+            function: Callable[[np.ndarray], np.ndarray]) -> list[np.ndarray]:
+        """
+        Computes values of cell corners from hashes of the lattice points.
+        Lattice points around the cells are hashed once and looked up for every corner,
+        unless there are more of them than there are cells
+        :param seed: random seed
+        :param salt: value that makes noises of the same seed different
+        :param cells: lattice cells for every axis
+        :param function: makes values out of uint64 hashes
+        :return: values of '2 ** axes' corners; first axis changes the fastest
+        """
+
+        offsets = Noise.corner_offsets(len(cells))
+        low = [int(cell.min()) for cell in cells]
+        shape = [int(cell.max()) - minimum + 2 for cell, minimum in zip(cells, low)]
+        if np.prod(shape) > np.prod(np.broadcast_shapes(*[cell.shape for cell in cells])):
+            return [
+                function(Noise.hash_integers(seed, salt, *[cell + offset for cell, offset in zip(cells, corner)]))
+                for corner in offsets]
+
+        table = function(Noise.hash_integers(seed, salt, *[
+            np.arange(minimum, minimum + size).reshape([size if other == axis else 1 for other in range(len(cells))])
+            for axis, (minimum, size) in enumerate(zip(low, shape))]))
+        indices = [cell - minimum for cell, minimum in zip(cells, low)]
+        return [table[tuple(index + offset for index, offset in zip(indices, corner))] for corner in offsets]
+
+    @staticmethod
+    def interpolate(corners: list[np.ndarray], weights: list[np.ndarray]) -> np.ndarray:
+        """
+        Interpolates values of cell corners, one axis after another
+        :param corners: values of '2 ** axes' corners; first axis changes the fastest
+        :param weights: interpolation weights for every axis
+        :return: interpolated values
+        """
+
+        for weight in weights:
+            corners = [low * (1 - weight) + high * weight for low, high in zip(corners[::2], corners[1::2])]
+        return corners[0]
+
+    @staticmethod
+    def value(seed: int, period: int, *coords: np.ndarray, salt: int = 0) -> np.ndarray:
+        """
+        Random values placed every 'period' units, smoothly interpolated
+        :param seed: random seed
+        :param period: distance between random values
+        :param coords: coordinates of every axis
+        :param salt: value that makes noises of the same seed different
+        :return: array of noise values in [0, 1)
+        """
+
+        cells, local = Noise.lattice(coords, period)
+        corners = Noise.corners(seed, salt, cells, Noise.to_random)
+        return Noise.interpolate(corners, [t * t * (3 - 2 * t) for t in local])
+
+    @staticmethod
+    def perlin(seed: int, period: int, *coords: np.ndarray, salt: int = 0) -> np.ndarray:
+        """
+        Gradient noise with random gradients placed every 'period' units
+        :param seed: random seed
+        :param period: distance between gradients
+        :param coords: coordinates of 1 to 3 axes
+        :param salt: value that makes noises of the same seed different
+        :return: array of noise values in [-1, 1]; zero at the lattice points
+        """
+
+        gradients = PERLIN_GRADIENTS[len(coords)]
+        cells, local = Noise.lattice(coords, period)
+        corners = []
+        for offsets, gradient in zip(
+                Noise.corner_offsets(len(coords)),
+                Noise.corners(seed, salt, cells, lambda hashes: hashes % np.uint64(gradients.shape[0]))):
+            # dot product of the corner gradient and the offset from the corner
+            dot = 0
+            for axis, offset in enumerate(offsets):
+                dot = dot + gradients[:, axis][gradient] * (local[axis] - offset)
+            corners.append(dot)
+
+        # result is scaled so that it reaches 1 with gradients pointing towards the cell center
+        scale = 2 / np.sqrt(len(coords))
+        return Noise.interpolate(corners, [t * t * t * (t * (t * 6 - 15) + 10) for t in local]) * scale
+
+    @staticmethod
+    def fractal(
+            noise: Callable[..., np.ndarray],
+            seed: int,
+            octaves: list[tuple[int, float]],
+            *coords: np.ndarray,
+            salt: int = 0) -> np.ndarray:
+        """
+        Sum of several octaves of noise; every octave uses its own salt
+        :param noise: noise function, like 'Noise.value' or 'Noise.perlin'
+        :param seed: random seed
+        :param octaves: period and influence of every octave
+        :param coords: coordinates of every axis
+        :param salt: value that makes noises of the same seed different
+        :return: array of noise values
+        """
+
+        total = 0
+        for period, influence in octaves:
+            total = total + noise(seed, period, *coords, salt=salt + period) * influence
+        return total
+
+    @staticmethod
+    def sparse_grid(noise: Callable[..., np.ndarray], step: int, *axes: np.ndarray) -> np.ndarray:
+        """
+        Evaluates noise on a grid only every 'step' units, and linearly interpolates in between.
+        Evaluated points are multiples of 'step', so grids of neighbouring windows line up
+        :param noise: noise function taking coordinates of every axis, like 'lambda *c: Noise.perlin(seed, 16, *c)'
+        :param step: distance between evaluated points
+        :param axes: 1D integer coordinates of every axis
+        :return: grid of noise values with shape of axis sizes
+        """
+
+        # coarse grid that covers all the coordinates
+        cells = [np.floor_divide(axis, step) for axis in axes]
+        coarse = [np.arange(int(cell.min()), int(cell.max()) + 2) for cell in cells]
+        grid = noise(*[
+            (points * step).reshape([points.size if other == index else 1 for other in range(len(axes))])
+            for index, points in enumerate(coarse)])
+
+        # interpolate one axis after another; always in the same order, so that the values don't depend on the window
+        for index in reversed(range(len(axes))):
+            shape = [axes[index].size if other == index else 1 for other in range(len(axes))]
+            low = cells[index] - coarse[index][0]
+            weight = ((axes[index] - cells[index] * step) / step).reshape(shape)
+            grid = np.take(grid, low, axis=index) * (1 - weight) + np.take(grid, low + 1, axis=index) * weight
+        return grid
+
+    @staticmethod
+    def corner_offsets(dimensions: int) -> list[tuple[int, ...]]:
+        """
+        Lists offsets of lattice cell corners; first axis changes the fastest
+        :param dimensions: amount of axes
+        :return: list of corner offsets
+        """
+
+        return [offsets[::-1] for offsets in itertools.product((0, 1), repeat=dimensions)]
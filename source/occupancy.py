@@ -0,0 +1,350 @@
+"""
+Occupancy pyramid for empty space skipping
+"""
+
+
+import math
+import numpy as np
+from source.options import *
+
+
+# diagonal of the world; rays are never longer than that
+CUBE_DIAG: float = math.sqrt(3 * WORLD_SIZE ** 2)
+
+
+class OccupancyPyramid:
+    """
+    Set of coarse occupancy grids. Each level stores one bool per brick of '2 ** bits' blocks,
+    True when brick contains at least one non-air block
+    """
+
+    def __init__(self, world):
+        """
+        :param world: world to build the pyramid for
+        """
+
+        self.world = world
+
+        # bricks are cubes of '2 ** bits' blocks, from the finest to the coarsest
+        self.bits: tuple[int, ...] = OCCUPANCY_BRICK_BITS
+
+        # per level ZYX bool arrays
+        self.levels: list[np.ndarray] = []
+
+        # whether the pyramid changed since last 'pack' call
+        self.dirty: bool = True
+
+        self.build()
+
+    def build(self) -> None:
+        """
+        Builds all levels from scratch
+        """
+
+        voxels = self.world.get_voxels().reshape(WORLD_SIZE, WORLD_SIZE, WORLD_SIZE)
+        self.levels = [self.reduce(voxels != 0, 2 ** self.bits[0])]
+        self.build_coarse()
+
+    def build_coarse(self) -> None:
+        """
+        Rebuilds all levels from the finest one
+        """
+
+        del self.levels[1:]
+        for level in range(1, len(self.bits)):
+            self.levels.append(self.reduce(self.levels[-1], 2 ** (self.bits[level] - self.bits[level - 1])))
+        self.dirty = True
+
+    @staticmethod
+    def reduce(grid: np.ndarray, factor: int) -> np.ndarray:
+        """
+        Makes a coarser grid, where each cell is True if any of 'factor ** 3' cells of the original grid is True.
+        :param grid: ZYX bool array
+        :param factor: reduction factor
+        :return: reduced grid
+        """
+
+        size = np.array(grid.shape) // factor
+        return grid.reshape(size[0], factor, size[1], factor, size[2], factor).any(axis=(1, 3, 5))
+
+    def update(self, position: tuple[int, int, int], value: int) -> None:
+        """
+        Updates the pyramid after a single block was set.
+        :param position: block position
+        :param value: new block id
+        """
+
+        if value != 0:
+            for level, bits in enumerate(self.bits):
+                brick = (position[2] >> bits, position[1] >> bits, position[0] >> bits)
+                if self.levels[level][brick]:
+                    break
+                self.levels[level][brick] = True
+                self.dirty = True
+        else:
+            self.update_box(position, (position[0] + 1, position[1] + 1, position[2] + 1))
+
+    def update_box(
+            self,
+            minimum: tuple[int, int, int],
+            maximum: tuple[int, int, int],
+            voxels: np.ndarray | None = None) -> None:
+        """
+        Recomputes bricks intersecting the box.
+        :param minimum: min box corner
+        :param maximum: max box corner, exclusive
+        :param voxels: ZYX blocks of the box when they are already known; box must be aligned to the finest bricks
+        """
+
+        # align the box to the finest bricks, and recompute them from the world
+        size = 2 ** self.bits[0]
+        low = np.asarray(minimum) // size
+        high = -(-np.asarray(maximum) // size)
+        if voxels is None:
+            voxels = self.world.get_box(low * size, high * size)
+        self.levels[0][low[2]:high[2], low[1]:high[1], low[0]:high[0]] = self.reduce(voxels != 0, size)
+
+        # coarser levels are recomputed from finer ones
+        for level in range(1, len(self.bits)):
+            factor = 2 ** (self.bits[level] - self.bits[level - 1])
+            low //= factor
+            high = -(-high // factor)
+            self.levels[level][low[2]:high[2], low[1]:high[1], low[0]:high[0]] = self.reduce(
+                self.levels[level - 1][
+                    low[2] * factor:high[2] * factor,
+                    low[1] * factor:high[1] * factor,
+                    low[0] * factor:high[0] * factor],
+                factor)
+        self.dirty = True
+
+    def pack(self) -> np.ndarray:
+        """
+        Packs the pyramid for the shader; all levels are bit packed (ZYX order, least significant bit first)
+        one after another, each level is padded to 32 bits.
+        :return: uint32 array
+        """
+
+        words = []
+        for grid in self.levels:
+            packed = np.packbits(grid.reshape(-1), bitorder="little")
+            words.append(np.pad(packed, (0, -packed.size % 4)).view("<u4"))
+        self.dirty = False
+        return np.concatenate(words)
+
+    def empty_brick(self, position: list[int]) -> int:
+        """
+        Finds the largest empty brick containing the position.
+        Out of bounds positions are always in an empty brick of the coarsest level.
+        :param position: block position
+        :return: bits of the brick size, 0 when block is in a non-empty finest brick
+        """
+
+        if not ((-1 < position[0] < WORLD_SIZE) and (-1 < position[1] < WORLD_SIZE) and (-1 < position[2] < WORLD_SIZE)):
+            return self.bits[-1]
+        for level in range(len(self.bits) - 1, -1, -1):
+            bits = self.bits[level]
+            if not self.levels[level][position[2] >> bits, position[1] >> bits, position[0] >> bits]:
+                return bits
+        return 0
+
+    @staticmethod
+    def skip_brick(
+            bits: int,
+            ipos: list[int],
+            istep: list[int],
+            ustep: list[float],
+            first: list[float],
+            count: list[int],
+            alen: list[float]) -> float:
+        """
+        Advances DDA state to the first block outside the brick, landing at exactly the same block and state
+        as stepping block by block would. Arguments are modified in place.
+        DDA steps are ordered by axial length, on ties Z goes before Y and Y before X.
+        :param bits: bits of the brick size
+        :param ipos: integer position
+        :param istep: integer step
+        :param ustep: unit step size
+        :param first: length for each axis at the start
+        :param count: steps made along each axis
+        :param alen: length for each axis
+        :return: ray length at the brick exit
+        """
+
+        # steps left along each axis until the brick is left
+        steps = [
+            ((ipos[axis] >> bits) + 1 << bits) - ipos[axis] if istep[axis] > 0
+            else ipos[axis] - (ipos[axis] >> bits << bits) + 1
+            for axis in range(3)]
+
+        # axial length of the exiting step along each axis; the first one in DDA order leaves the brick
+        exits = [
+            first[axis] + (count[axis] + steps[axis] - 1) * ustep[axis] if ustep[axis] != math.inf else math.inf
+            for axis in range(3)]
+        if exits[0] < exits[1] and exits[0] < exits[2]:
+            axis = 0
+        elif exits[1] < exits[2]:
+            axis = 1
+        else:
+            axis = 2
+        dist = exits[axis]
+
+        # count steps along other axes that come before the exiting step
+        for other in range(3):
+            if other == axis:
+                taken = steps[axis]
+            else:
+                def before(step: int) -> bool:
+                    length = first[other] + step * ustep[other]
+                    return length < dist or (length == dist and other > axis)
+
+                step = count[other]
+                if ustep[other] != math.inf:
+                    step = max(step, math.ceil((dist - first[other]) / ustep[other]))
+                while step > count[other] and not before(step - 1):
+                    step -= 1
+                while before(step):
+                    step += 1
+                taken = step - count[other]
+
+            if taken:
+                ipos[other] += taken * istep[other]
+                count[other] += taken
+                alen[other] = first[other] + count[other] * ustep[other]
+        return dist
+
+    @staticmethod
+    def advance_to(
+            limit: float,
+            ipos: list[int],
+            istep: list[int],
+            ustep: list[float],
+            first: list[float],
+            count: list[int],
+            alen: list[float]) -> None:
+        """
+        Makes all DDA steps not longer than the limit at once. Used instead of 'skip_brick' when the brick exit
+        is past the max ray length, so the ray ends where stepping block by block would. Arguments are modified
+        in place, same as by 'skip_brick'.
+        :param limit: max step length
+        """
+
+        for axis in range(3):
+            if ustep[axis] == math.inf:
+                continue
+
+            # first step longer than the limit
+            step = max(count[axis], math.floor((limit - first[axis]) / ustep[axis]) + 1)
+            while step > count[axis] and first[axis] + (step - 1) * ustep[axis] > limit:
+                step -= 1
+            while first[axis] + step * ustep[axis] <= limit:
+                step += 1
+
+            ipos[axis] += (step - count[axis]) * istep[axis]
+            count[axis] = step
+            alen[axis] = first[axis] + step * ustep[axis]
+
+    def empty_bricks(self, positions: np.ndarray) -> np.ndarray:
+        """
+        Vectorized 'empty_brick'.
+        :param positions: array of block positions with shape (N, 3)
+        :return: array of N brick size bits, 0 for blocks in non-empty finest bricks
+        """
+
+        inside = np.all((positions > -1) & (positions < WORLD_SIZE), axis=1)
+        result = np.where(inside, 0, self.bits[-1])
+        pending = np.flatnonzero(inside)
+        for level in range(len(self.bits) - 1, -1, -1):
+            bricks = positions[pending] >> self.bits[level]
+            empty = ~self.levels[level][bricks[:, 2], bricks[:, 1], bricks[:, 0]]
+            result[pending[empty]] = self.bits[level]
+            pending = pending[~empty]
+        return result
+
+    @staticmethod
+    def skip_bricks(
+            bits: np.ndarray,
+            ipos: np.ndarray,
+            istep: np.ndarray,
+            ustep: np.ndarray,
+            first: np.ndarray,
+            count: np.ndarray,
+            alen: np.ndarray) -> np.ndarray:
+        """
+        Vectorized 'skip_brick'; all arguments but 'bits' are arrays of shape (N, 3) and are modified in place.
+        :param bits: array of N brick size bits
+        :return: array of N ray lengths at the brick exits
+        """
+
+        rows = np.arange(bits.size)
+        bits = bits[:, None]
+
+        # steps left along each axis until the brick is left
+        brick_start = ipos >> bits << bits
+        steps = np.where(istep > 0, brick_start + (1 << bits) - ipos, ipos - brick_start + 1)
+
+        # axial length of the exiting step along each axis; the first one in DDA order leaves the brick
+        parallel = np.isinf(ustep)
+        with np.errstate(invalid="ignore"):
+            exits = np.where(parallel, np.inf, first + (count + steps - 1) * ustep)
+        exit_axis = np.where(
+            (exits[:, 0] < exits[:, 1]) & (exits[:, 0] < exits[:, 2]), 0,
+            np.where(exits[:, 1] < exits[:, 2], 1, 2))
+        dist = exits[rows, exit_axis]
+
+        # count steps along other axes that come before the exiting step
+        taken = np.zeros_like(steps)
+        taken[rows, exit_axis] = steps[rows, exit_axis]
+        for axis in range(3):
+            other = np.flatnonzero((exit_axis != axis) & ~parallel[:, axis])
+            if other.size == 0:
+                continue
+            axis_first, axis_step, axis_count = first[other, axis], ustep[other, axis], count[other, axis]
+            exit_length, later = dist[other], axis > exit_axis[other]
+
+            def before(step: np.ndarray) -> np.ndarray:
+                length = axis_first + step * axis_step
+                return (length < exit_length) | ((length == exit_length) & later)
+
+            step = np.maximum(axis_count, np.ceil((exit_length - axis_first) / axis_step).astype(np.int64))
+            while np.any(fix := (step > axis_count) & ~before(step - 1)):
+                step[fix] -= 1
+            while np.any(fix := before(step)):
+                step[fix] += 1
+            taken[other, axis] = step - axis_count
+
+        ipos += taken * istep
+        count += taken
+        with np.errstate(invalid="ignore"):
+            np.copyto(alen, first + count * ustep, where=taken != 0)
+        return dist
+
+    @staticmethod
+    def advance_to_many(
+            limit: float,
+            ipos: np.ndarray,
+            istep: np.ndarray,
+            ustep: np.ndarray,
+            first: np.ndarray,
+            count: np.ndarray,
+            alen: np.ndarray) -> None:
+        """
+        Vectorized 'advance_to'; all arguments but 'limit' are arrays of shape (N, 3) and are modified in place.
+        :param limit: max step length
+        """
+
+        for axis in range(3):
+            rows = np.flatnonzero(~np.isinf(ustep[:, axis]))
+            if rows.size == 0:
+                continue
+            axis_first, axis_step, axis_count = first[rows, axis], ustep[rows, axis], count[rows, axis]
+
+            # first step longer than the limit
+            step = np.maximum(axis_count, np.floor((limit - axis_first) / axis_step).astype(np.int64) + 1)
+            while np.any(fix := (step > axis_count) & (axis_first + (step - 1) * axis_step > limit)):
+                step[fix] -= 1
+            while np.any(fix := axis_first + step * axis_step <= limit):
+                step[fix] += 1
+
+            ipos[rows, axis] += (step - axis_count) * istep[rows, axis]
+            count[rows, axis] = step
+            alen[rows, axis] = axis_first + step * axis_step
@@ -3,9 +3,6 @@ Configuration file
 """
 
 
-import os
-
-
 # Misc window
 GAME_TITLE = "Pythagonal"
 
@@ -14,16 +11,90 @@ ASSETS_DIR: str = "assets"
 SHADER_DIR: str = f"{ASSETS_DIR}/shaders"
 TEXTURE_DIR: str = f"{ASSETS_DIR}/textures"
 
-SAVES_DIR: str = "saves"  # not guaranteed to be created
-if not os.path.isdir(SAVES_DIR):
-    os.makedirs(SAVES_DIR)
+CACHE_DIR: str = "cache"  # created when the first cache file is written
+BLOCK_CACHE: str = f"{CACHE_DIR}/blocks.bin"
+
+SAVES_DIR: str = "saves"  # created when the first file is saved
+REGIONS_DIR: str = f"{SAVES_DIR}/regions"
 
 # World related
 WORLD_SIZE: int = 256
 WORLD_LAYER: int = WORLD_SIZE ** 2
 WORLD_CENTER: int = WORLD_SIZE // 2
 
+# Region related; unbounded world is made of regions of 'WORLD_SIZE' blocks along X and Y
+REGION_VIEW_DISTANCE: int = 192  # regions within this distance from the camera are kept loaded
+REGION_WORKERS: int = 2  # background threads loading, generating and saving regions
+WINDOW_STEP: int = 64  # rendered window follows the camera in these steps; multiple of the coarsest occupancy brick
+
+# Saving related; modified regions are snapshotted and saved in the background, edits are undone with Ctrl+Z
+AUTOSAVE_INTERVAL: float = 60.0  # seconds between autosaves; 0 disables autosaving
+UNDO_MEMORY: int = 64 * 1024 ** 2  # max bytes of block data kept only by the undo history
+
+# World generation related; noise octaves are given as period and influence
+GENERATION_JOB_ROWS: int = 2  # rows of chunk columns generated by one generation job
+TERRAIN_OCTAVES: tuple[tuple[int, float], ...] = ((2, 0.05), (4, 0.05), (8, 0.2), (16, 0.2), (32, 0.5))
+CAVE_OCTAVES: tuple[tuple[int, float], ...] = ((32, 0.75), (16, 0.25))
+CAVE_THRESHOLD: float = 0.2  # caves are carved where 3D noise is above this value
+CAVE_DEPTH: int = 48  # caves reach this far below sea level
+CAVE_STEP: int = 4  # cave noise is evaluated every 'CAVE_STEP' blocks, and interpolated in between
+
+# World sync related; remote viewers subscribe to chunks, then receive batches of changed blocks
+SYNC_INTERVAL: float = 1 / 60  # seconds between batches of changed blocks
+SYNC_HIGH_WATER: int = 1024 ** 2  # bytes buffered for a viewer, above which its changes are merged until it catches up
+
+# Block tick related; blocks are updated at a fixed rate, independent of the frame rate
+TICK_RATE: int = 20  # ticks per second
+TICK_BUDGET: float = 0.01  # max seconds spent on scheduled updates per tick; the rest wait for the next tick
+TICK_CATCHUP: int = 4  # max ticks run per frame; ticks of longer frames are dropped
+TICK_BATCH: int = 512  # max scheduled updates applied at once
+RANDOM_TICKS: int = 16  # random blocks updated per chunk every second
+FALL_DELAY: int = 2  # ticks it takes a falling block to move one block down
+LEAVES_RANGE: int = 2  # leaves decay without logs within this many blocks
+FALLING_BLOCKS: tuple[str, ...] = ()  # blocks falling through air, like sand; terrain blocks would collapse caves
+
+# Block related; world stores block ids in single bytes
+MAX_BLOCKS: int = 256
+BLOCK_FACES: tuple[str, ...] = ("X+", "X-", "Y+", "Y-", "Z+", "Z-")  # order of block faces in lookup tables
+
+# Chunk related; world is stored in cubes of 'CHUNK_SIZE' blocks
+CHUNK_BITS: int = 4
+CHUNK_SIZE: int = 2 ** CHUNK_BITS
+CHUNK_MASK: int = CHUNK_SIZE - 1
+CHUNK_VOLUME: int = CHUNK_SIZE ** 3
+WORLD_CHUNKS: int = WORLD_SIZE // CHUNK_SIZE  # chunks per world side
+OCCUPANCY_BRICK_BITS: tuple[int, ...] = (2, 4, 6)  # occupancy bricks of 4, 16 and 64 blocks
+WORLD_UPLOAD_BUDGET: int = 4 * 1024 ** 2  # max bytes of world data uploaded to GPU per frame
+
 # Window related
 WINDOW_RESOLUTION: tuple[int, int] = (16 * 90, 9 * 90)
 SCREENSHOT_RESOLUTION: tuple[int, int] = (3840, 2160)
+SCREENSHOT_TILE: int = 512  # screenshots are rendered in tiles of this size
+SCREENSHOT_FRAME_BUDGET: float = 0.008  # max GPU time per frame spent on screenshot tiles, in seconds
 WINDOW_FRAMERATE: int = 60
+
+# Profiling related; toggled with F3, exported to 'SAVES_DIR' with F4
+PROFILER_ENABLED: bool = False
+PROFILER_FRAMES: int = 600  # frames kept in the profiler ring buffer
+PROFILER_GRAPH_HISTORY: int = 100  # timings averaged by the profiler graphs
+PROFILER_GRAPHS: tuple[str, ...] = ("cpu update", "cpu upload", "gpu sky", "gpu chunks")  # shown stage timings
+
+# Rendering related
+SKY_GRADIENT: tuple[str, ...] = ("9BC8DC", "8CBED4", "77ACC5", "689CBA", "5788AE")  # sky gradient colors
+RENDER_LAYERS: int = 10  # max amount of blocks a single ray passes through
+RENDER_TILE: int = 64  # size of image tiles rendered by the CPU renderer
+
+# Render scale related; mode is cycled with F5; checkerboard shadows, shadow cache and sun lightmap are toggled
+# with F6, F7 and F8
+RENDER_SCALE_MODE: str = "adaptive"  # 'fixed' or 'adaptive'
+RENDER_SCALE: float = 1.0  # fraction of the window resolution the chunks are traced at in 'fixed' mode
+RENDER_SCALE_MIN: float = 0.5  # lowest scale of 'adaptive' mode
+RENDER_SCALE_STEP: float = 0.05  # scale changes by multiples of this value
+RENDER_SCALE_BUDGET: float = 0.8  # fraction of the frame time tracing the chunks may take in 'adaptive' mode
+CHECKERBOARD_SHADOWS: bool = False  # trace shadows of half the pixels per frame, the rest reuse the last ones
+SHADOW_CACHE: bool = True  # reuse shadows of surfaces seen in the last frame, instead of tracing them again
+SUN_LIGHTMAP: bool = True  # look shadows up in the precomputed sun lightmap, instead of tracing them
+
+# Mesh rendering related; chunks are rasterized from greedy meshes instead of being traced, toggled with F9
+MESH_RENDERING: bool = False
+MESH_CHUNK_BUDGET: int = 512  # max chunks meshed per frame
@@ -0,0 +1,315 @@
+"""
+Frame time instrumentation
+"""
+
+
+import os
+import csv
+import json
+import time
+import ctypes
+import arcade
+from pyglet import gl
+from collections import deque
+from contextlib import nullcontext
+from source.options import *
+
+
+# stage returned when profiler is disabled; entering it does nothing
+DISABLED_STAGE = nullcontext()
+
+
+class GPUTimer:
+    """
+    Measures GPU time between two points of the command stream with timestamp queries.
+    Results are read once they are available, so nothing waits for the GPU.
+    Unlike time elapsed queries, timestamps can be nested
+    """
+
+    def __init__(self):
+        # measurements waiting for query results; unused query objects
+        self.pending: list[tuple[int, int, object]] = []
+        self.free_queries: list[int] = []
+
+    def timestamp(self) -> int:
+        """
+        Records GPU timestamp once the commands issued so far are done
+        :return: query object
+        """
+
+        if self.free_queries:
+            query = self.free_queries.pop()
+        else:
+            query = gl.GLuint()
+            gl.glGenQueries(1, ctypes.byref(query))
+            query = query.value
+        gl.glQueryCounter(query, gl.GL_TIMESTAMP)
+        return query
+
+    def measure(self, begin: int, tag: object):
+        """
+        Finishes a measurement
+        :param begin: query made by 'timestamp' at the start
+        :param tag: value returned together with the result
+        """
+
+        self.pending.append((begin, self.timestamp(), tag))
+
+    def collect(self) -> list[tuple[object, int, float]]:
+        """
+        Reads results of measurements that are ready, without waiting for the rest
+        :return: list of measurement tag, GPU timestamp of its start in nanoseconds and its duration in seconds
+        """
+
+        available = gl.GLint()
+        results, pending = [], []
+        for begin, end, tag in self.pending:
+            gl.glGetQueryObjectiv(end, gl.GL_QUERY_RESULT_AVAILABLE, ctypes.byref(available))
+            if not available.value:
+                pending.append((begin, end, tag))
+                continue
+
+            times = []
+            for query in (begin, end):
+                result = gl.GLuint64()
+                gl.glGetQueryObjectui64v(query, gl.GL_QUERY_RESULT, ctypes.byref(result))
+                times.append(result.value)
+                self.free_queries.append(query)
+            results.append((tag, times[0], (times[1] - times[0]) / 1e9))
+        self.pending = pending
+        return results
+
+    def release(self):
+        """
+        Frees GL objects
+        """
+
+        queries = self.free_queries + [query for begin, end, _ in self.pending for query in (begin, end)]
+        if queries:
+            gl.glDeleteQueries(len(queries), (gl.GLuint * len(queries))(*queries))
+        self.free_queries.clear()
+        self.pending.clear()
+
+
+class ProfilerStage:
+    """
+    Measures CPU time, and optionally GPU time, of the code within a 'with' block
+    """
+
+    __slots__ = ("profiler", "name", "gpu", "record")
+
+    def __init__(self, profiler: "Profiler", name: str, gpu: bool):
+        self.profiler: Profiler = profiler
+        self.name: str = name
+        self.gpu: bool = gpu
+        self.record: dict | None = None
+
+    def __enter__(self):
+        self.record = {"name": self.name, "start": time.perf_counter(), "cpu": 0.0, "gpu": None}
+        if self.gpu:
+            self.record["query"] = self.profiler.timestamp()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        record = self.record
+        record["cpu"] = time.perf_counter() - record["start"]
+        if self.gpu:
+            self.profiler.timer.measure(record.pop("query"), record)
+        self.profiler.frame["stages"].append(record)
+
+
+class Profiler:
+    """
+    Per frame CPU and GPU timings of named stages, and per frame counters.
+    Frames are kept in a ring buffer, and can be exported as Chrome trace JSON or CSV.
+    GPU stages are measured with timestamp queries, which are read a few frames later, so that nothing waits for the GPU.
+    When disabled, stages and counters do nothing
+    """
+
+    def __init__(self, enabled: bool = PROFILER_ENABLED, frames: int = PROFILER_FRAMES):
+        """
+        :param enabled: whether to measure anything
+        :param frames: amount of frames kept in the ring buffer
+        """
+
+        self.enabled: bool = enabled
+
+        # finished frames; frame in progress
+        self.frames: deque[dict] = deque(maxlen=frames)
+        self.frame: dict = self.new_frame(0)
+
+        # GPU stages are measured by the timer
+        self.timer: GPUTimer = GPUTimer()
+
+        # GPU timestamps are converted to CPU time using a pair of timestamps taken at the same moment
+        self.origin: float = time.perf_counter()
+        self.gpu_origin: int | None = None
+
+    @staticmethod
+    def new_frame(number: int) -> dict:
+        """
+        Makes a frame record
+        :param number: frame number
+        :return: frame record
+        """
+
+        return {"frame": number, "start": time.perf_counter(), "duration": 0.0, "stages": [], "counters": {}}
+
+    def stage(self, name: str, gpu: bool = False) -> ProfilerStage | nullcontext:
+        """
+        Makes a stage to measure a 'with' block with
+        :param name: stage name
+        :param gpu: whether to also measure GPU time of the commands issued within the block
+        :return: context manager
+        """
+
+        if not self.enabled:
+            return DISABLED_STAGE
+        return ProfilerStage(self, name, gpu)
+
+    def count(self, name: str, value: int = 1):
+        """
+        Adds to a counter of the current frame
+        :param name: counter name
+        :param value: value to add
+        """
+
+        if not self.enabled:
+            return
+        counters = self.frame["counters"]
+        counters[name] = counters.get(name, 0) + value
+
+    def timestamp(self) -> int:
+        """
+        Records GPU timestamp once the commands issued so far are done
+        :return: query object
+        """
+
+        if self.gpu_origin is None:
+            now = gl.GLint64()
+            gl.glGetInteger64v(gl.GL_TIMESTAMP, ctypes.byref(now))
+            self.gpu_origin = now.value
+            self.origin = time.perf_counter()
+        return self.timer.timestamp()
+
+    def next_frame(self):
+        """
+        Finishes the current frame and starts the next one. Should be called once per frame.
+        Also collects GPU timings of earlier frames that are ready
+        """
+
+        if not self.enabled:
+            return
+
+        self.frame["duration"] = time.perf_counter() - self.frame["start"]
+        self.frames.append(self.frame)
+        self.feed_graphs(self.frame, "cpu")
+        self.frame = self.new_frame(self.frame["frame"] + 1)
+        self.collect()
+
+    def collect(self):
+        """
+        Reads results of GPU queries that are ready, without waiting for the rest
+        """
+
+        for record, start, duration in self.timer.collect():
+            record["gpu_start"] = self.origin + (start - self.gpu_origin) / 1e9
+            record["gpu"] = duration
+            self.feed_graph(f"gpu {record['name']}", duration)
+
+    def feed_graphs(self, frame: dict, kind: str):
+        """
+        Adds stage timings of a frame to the graphable timings
+        :param frame: frame record
+        :param kind: 'cpu' or 'gpu'
+        """
+
+        totals = {}
+        for record in frame["stages"]:
+            totals[record["name"]] = totals.get(record["name"], 0.0) + record[kind]
+        for name, seconds in totals.items():
+            self.feed_graph(f"{kind} {name}", seconds)
+
+    @staticmethod
+    def feed_graph(name: str, seconds: float):
+        """
+        Adds a timing to arcade timings, which 'arcade.PerfGraph' can show by name
+        :param name: timing name
+        :param seconds: measured time
+        """
+
+        if not arcade.timings_enabled():
+            return
+        timings = arcade.get_timings()
+        if name not in timings:
+            timings[name] = deque(maxlen=PROFILER_GRAPH_HISTORY)
+        timings[name].append(seconds)
+
+    def export_chrome_trace(self, filename: str):
+        """
+        Writes frames in the ring buffer as Chrome trace JSON; can be opened in 'chrome://tracing' or Perfetto
+        :param filename: trace filename
+        """
+
+        events = []
+        for frame in self.frames:
+            start = (frame["start"] - self.origin) * 1e6
+            events.append({
+                "name": f"frame {frame['frame']}", "cat": "frame", "ph": "X",
+                "ts": start, "dur": frame["duration"] * 1e6, "pid": 0, "tid": 0})
+            events.append({"name": "counters", "ph": "C", "ts": start, "pid": 0, "args": frame["counters"]})
+            for record in frame["stages"]:
+                events.append({
+                    "name": record["name"], "cat": "cpu", "ph": "X",
+                    "ts": (record["start"] - self.origin) * 1e6, "dur": record["cpu"] * 1e6, "pid": 0, "tid": 0})
+                if record["gpu"] is not None:
+                    events.append({
+                        "name": record["name"], "cat": "gpu", "ph": "X",
+                        "ts": (record["gpu_start"] - self.origin) * 1e6, "dur": record["gpu"] * 1e6, "pid": 0, "tid": 1})
+
+        os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+        with open(filename, "w", encoding="utf-8") as file:
+            json.dump({
+                "traceEvents": [
+                    {"name": "thread_name", "ph": "M", "pid": 0, "tid": 0, "args": {"name": "CPU"}},
+                    {"name": "thread_name", "ph": "M", "pid": 0, "tid": 1, "args": {"name": "GPU"}},
+                    *events],
+                "displayTimeUnit": "ms"}, file)
+
+    def export_csv(self, filename: str):
+        """
+        Writes frames in the ring buffer as CSV; one row per frame with total time of every stage in milliseconds,
+        and every counter
+        :param filename: CSV filename
+        """
+
+        stages, counters = {}, {}
+        for frame in self.frames:
+            for record in frame["stages"]:
+                stages[f"cpu {record['name']}"] = None
+                if record["gpu"] is not None:
+                    stages[f"gpu {record['name']}"] = None
+            counters.update(dict.fromkeys(frame["counters"]))
+
+        os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+        with open(filename, "w", encoding="utf-8", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(["frame", "start ms", "frame ms", *[f"{stage} ms" for stage in stages], *counters])
+            for frame in self.frames:
+                totals = dict.fromkeys(stages, 0.0)
+                for record in frame["stages"]:
+                    totals[f"cpu {record['name']}"] += record["cpu"] * 1e3
+                    if record["gpu"] is not None:
+                        totals[f"gpu {record['name']}"] += record["gpu"] * 1e3
+                writer.writerow([
+                    frame["frame"],
+                    f"{(frame['start'] - self.origin) * 1e3:.3f}",
+                    f"{frame['duration'] * 1e3:.3f}",
+                    *[f"{total:.3f}" for total in totals.values()],
+                    *[frame["counters"].get(counter, 0) for counter in counters]])
+
+    def release(self):
+        """
+        Frees GL objects
+        """
+
+        self.timer.release()
@@ -0,0 +1,455 @@
+"""
+Streaming world made of regions
+"""
+
+
+import os
+import math
+import time
+import numpy as np
+from concurrent.futures import Future, ThreadPoolExecutor
+from source.world import *
+from source.options import *
+
+
+class RegionStreamer:
+    """
+    Effectively unbounded world made of regions of 'WORLD_SIZE' blocks along X and Y.
+    Regions around the camera are loaded or generated on background threads, far away regions are saved and dropped.
+    Renderer sees 'window'; a world sized toroidal window over the regions, which follows the camera
+    in steps of 'WINDOW_STEP' blocks. When it moves, only the newly exposed slabs are copied into it and uploaded.
+    Modified regions are autosaved from snapshots, so they stay editable while being written
+    """
+
+    def __init__(
+            self,
+            directory: str = REGIONS_DIR,
+            seed: int = 0,
+            view_distance: int = REGION_VIEW_DISTANCE,
+            workers: int = REGION_WORKERS,
+            autosave_interval: float = AUTOSAVE_INTERVAL):
+        """
+        :param directory: directory with region save files
+        :param seed: seed of generated regions
+        :param view_distance: distance along X and Y within which regions are kept loaded
+        :param workers: amount of background threads loading and saving regions
+        :param autosave_interval: seconds between autosaves of modified regions; 0 disables autosaving
+        """
+
+        self.directory: str = directory
+        self.seed: int = seed
+        self.view_distance: int = view_distance
+
+        # resident regions
+        self.regions: dict[tuple[int, int], World] = {}
+        self.modified: set[tuple[int, int]] = set()
+
+        # regions being loaded or saved on background threads
+        self.executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=workers)
+        self.loading: dict[tuple[int, int], Future] = {}
+        self.saving: dict[tuple[int, int], Future] = {}
+
+        # regions are saved from snapshots every 'autosave_interval' seconds
+        self.autosave_interval: float = autosave_interval
+        self.autosaved: float = time.perf_counter()
+
+        # snapshots of regions before every edit
+        self.history: WorldHistory = WorldHistory()
+
+        # window; its block at (x, y, z) holds world block at (x, y, z) + 'origin' wrapped around the window.
+        # Its lightmap is swept again on background threads when the window moves
+        self.window: World = World()
+        self.window.build_occupancy()
+        self.window.build_lightmap(executor=self.executor)
+        self.window.build_heightmap()
+        self.origin: tuple[int, int] | None = None
+
+        # make sure the block registry is loaded before background threads use it
+        Blocks.load()
+
+    @property
+    def offset(self) -> tuple[int, int, int]:
+        """
+        Offset of the window origin within the wrapped window
+        """
+
+        return self.origin[0] % WORLD_SIZE, self.origin[1] % WORLD_SIZE, 0
+
+    def region_filename(self, region: tuple[int, int]) -> str:
+        """
+        Makes region save filename
+        :param region: region coordinates
+        :return: filename
+        """
+
+        return f"{self.directory}/{region[0]}.{region[1]}.cubw"
+
+    def update(self, position: tuple[float, float, float], wait: bool = False):
+        """
+        Streams regions around the position, and moves the window with it. Should be called once per frame.
+        :param position: camera position
+        :param wait: wait for all regions around the position to load
+        """
+
+        # regions within view distance are kept loaded; the rest is dropped with some leeway to avoid thrashing
+        wanted = self.regions_around(position, self.view_distance)
+        kept = self.regions_around(position, self.view_distance + WORLD_SIZE // 4)
+        for region in wanted:
+            if region not in self.regions and region not in self.loading:
+                self.loading[region] = self.executor.submit(self.load_region, region, self.saving.get(region))
+        for region in list(self.regions):
+            if region not in kept:
+                self.evict(region)
+
+        if wait:
+            for future in list(self.loading.values()):
+                future.result()
+        self.collect()
+
+        if self.autosave_interval > 0 and time.perf_counter() - self.autosaved >= self.autosave_interval:
+            self.autosave()
+
+        # move the window; it is centered on the camera, and aligned to the coarsest occupancy bricks
+        origin = tuple(
+            int(round(position[axis] / WINDOW_STEP)) * WINDOW_STEP - WORLD_SIZE // 2
+            for axis in range(2))
+        if origin != self.origin:
+            self.move_window(origin)
+
+    @staticmethod
+    def regions_around(position: tuple[float, float, float], distance: int) -> set[tuple[int, int]]:
+        """
+        Finds regions that are within distance of the position along X and Y
+        :param position: position
+        :param distance: distance
+        :return: set of region coordinates
+        """
+
+        low = [math.floor((position[axis] - distance) / WORLD_SIZE) for axis in range(2)]
+        high = [math.floor((position[axis] + distance) / WORLD_SIZE) for axis in range(2)]
+        return {(x, y) for x in range(low[0], high[0] + 1) for y in range(low[1], high[1] + 1)}
+
+    def load_region(self, region: tuple[int, int], saving: Future | None = None) -> World:
+        """
+        Loads region from its save file, or generates it. Runs on a background thread
+        :param region: region coordinates
+        :param saving: save of the region that has to finish first, if it was dropped recently
+        :return: loaded region
+        """
+
+        if saving is not None:
+            saving.result()
+
+        filename = self.region_filename(region)
+        if os.path.isfile(filename):
+            world = World()
+            world.load(filename)
+            world.load_chunks()
+            world.close_source()
+        else:
+            world = WorldGen.generate_region(region, WORLD_SIZE // 2, 32, self.seed, processes=1)
+
+        # occupancy of the region is copied into the window's together with its chunks
+        world.build_occupancy()
+        world.dirty_chunks.clear()
+        return world
+
+    def save_region(self, region: tuple[int, int], world: World | WorldSnapshot, saving: Future | None = None):
+        """
+        Saves region to its save file. Runs on a background thread
+        :param region: region coordinates
+        :param world: region, or its snapshot
+        :param saving: earlier save of the region that has to finish first, so that saves don't overlap
+        """
+
+        if saving is not None:
+            saving.result()
+
+        world.save(self.region_filename(region))
+
+    def autosave(self):
+        """
+        Saves modified regions on background threads. Regions are snapshotted, so that they can be changed
+        while being written. Regions that are still being saved are left for the next autosave
+        """
+
+        for region in list(self.modified):
+            if region in self.saving and not self.saving[region].done():
+                continue
+            snapshot = self.regions[region].snapshot()
+            self.saving[region] = self.executor.submit(self.save_region, region, snapshot, self.saving.get(region))
+            self.modified.discard(region)
+        self.autosaved = time.perf_counter()
+
+    def collect(self):
+        """
+        Takes in regions that finished loading, and copies their parts within the window into it
+        """
+
+        for region, future in list(self.loading.items()):
+            if not future.done():
+                continue
+            del self.loading[region]
+            self.regions[region] = future.result()
+
+            if self.origin is not None:
+                self.copy_columns(self.window_columns(self.origin) & self.region_columns(region))
+
+        for region, future in list(self.saving.items()):
+            if future.done():
+                future.result()
+                del self.saving[region]
+
+    def evict(self, region: tuple[int, int]):
+        """
+        Drops a region, saving it on a background thread when it was modified
+        :param region: region coordinates
+        """
+
+        world = self.regions.pop(region)
+        self.history.forget(world)
+        if region in self.modified:
+            self.modified.discard(region)
+            self.saving[region] = self.executor.submit(self.save_region, region, world, self.saving.get(region))
+
+    @staticmethod
+    def window_columns(origin: tuple[int, int]) -> set[tuple[int, int]]:
+        """
+        Lists chunk columns covered by the window
+        :param origin: window origin
+        :return: set of world chunk column coordinates
+        """
+
+        low = [axis // CHUNK_SIZE for axis in origin]
+        return {
+            (x, y)
+            for x in range(low[0], low[0] + WORLD_CHUNKS)
+            for y in range(low[1], low[1] + WORLD_CHUNKS)}
+
+    @staticmethod
+    def region_columns(region: tuple[int, int]) -> set[tuple[int, int]]:
+        """
+        Lists chunk columns of a region
+        :param region: region coordinates
+        :return: set of world chunk column coordinates
+        """
+
+        return {
+            (x, y)
+            for x in range(region[0] * WORLD_CHUNKS, (region[0] + 1) * WORLD_CHUNKS)
+            for y in range(region[1] * WORLD_CHUNKS, (region[1] + 1) * WORLD_CHUNKS)}
+
+    def move_window(self, origin: tuple[int, int]):
+        """
+        Moves the window, copying in chunk columns that weren't in the old one
+        :param origin: new window origin
+        """
+
+        exposed = self.window_columns(origin)
+        if self.origin is not None:
+            exposed -= self.window_columns(self.origin)
+        self.origin = origin
+        self.copy_columns(exposed)
+
+        # sun columns cross the window edges, which have moved; so do faces of the chunks at the edges.
+        # Lightmap is swept on a background thread, and swapped in when it is done
+        self.window.lightmap.move(self.offset)
+        self.window.heightmap.move(self.offset)
+        if self.window.mesh is not None:
+            self.window.mesh.move(self.offset)
+
+    def copy_columns(self, columns: set[tuple[int, int]]):
+        """
+        Copies chunk columns from the regions to their place in the wrapped window.
+        Columns of regions that aren't loaded yet are left empty, until the region is loaded
+        :param columns: world chunk column coordinates
+        """
+
+        if not columns:
+            return
+
+        # window wraps at region size, so column has the same place in the window as in its region
+        bricks = self.window.occupancy.levels[0]
+        brick_size = CHUNK_SIZE >> self.window.occupancy.bits[0]
+        for column_x, column_y in columns:
+            region = self.regions.get((column_x // WORLD_CHUNKS, column_y // WORLD_CHUNKS))
+            local_x, local_y = column_x % WORLD_CHUNKS, column_y % WORLD_CHUNKS
+            for chunk_z in range(WORLD_CHUNKS):
+                index = (chunk_z * WORLD_CHUNKS + local_y) * WORLD_CHUNKS + local_x
+                chunk = 0 if region is None else region.get_chunk(index)
+                self.window.chunks[index] = chunk if isinstance(chunk, int) else chunk.copy()
+                self.window.dirty_chunks.add(index)
+                self.window.lightmap.mark_chunk(index)
+                self.window.heightmap.mark_chunk(index)
+                if self.window.changes is not None:
+                    self.window.changes.record_chunk(index)
+                if self.window.mesh is not None:
+                    self.window.mesh.mark_chunk(index)
+
+            # finest occupancy bricks are copied from the region, instead of being recomputed from the blocks
+            brick_x = slice(local_x * brick_size, (local_x + 1) * brick_size)
+            brick_y = slice(local_y * brick_size, (local_y + 1) * brick_size)
+            bricks[:, brick_y, brick_x] = False if region is None else region.occupancy.levels[0][:, brick_y, brick_x]
+        self.window.occupancy.build_coarse()
+
+    def locate(self, coords: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Splits world coordinates into region coordinates and coordinates within the region
+        :param coords: array of world block coordinates (N, 3)
+        :return: arrays of region coordinates (N, 2) and local coordinates (N, 3)
+        """
+
+        coords = np.asarray(coords, dtype=np.int64).reshape(-1, 3)
+        regions = coords[:, :2] // WORLD_SIZE
+        local = coords.copy()
+        local[:, :2] -= regions * WORLD_SIZE
+        return regions, local
+
+    def in_window(self, coords: np.ndarray) -> np.ndarray:
+        """
+        Checks which world coordinates are within the window
+        :param coords: array of world block coordinates (N, 3)
+        :return: boolean array (N,)
+        """
+
+        if self.origin is None:
+            return np.zeros(coords.shape[0], dtype=np.bool_)
+        relative = coords[:, :2] - np.asarray(self.origin)
+        return np.all((relative > -1) & (relative < WORLD_SIZE), axis=1)
+
+    def surface(self, x: int, y: int) -> int:
+        """
+        Gets height above the top solid block of a world column within the window
+        :param x: world column x
+        :param y: world column y
+        :return: z of the lowest block with only non solid blocks above; 0 for empty columns or outside the window
+        """
+
+        if not self.in_window(np.array([[x, y, 0]]))[0]:
+            return 0
+        return self.window.heightmap.height(x % WORLD_SIZE, y % WORLD_SIZE)
+
+    def get(self, position: tuple[int, int, int]) -> int:
+        """
+        Gets block at world position
+        :param position: world block position
+        :return: block id; -1 when out of bounds or when the region isn't loaded
+        """
+
+        regions, local = self.locate(position)
+        region = self.regions.get(tuple(regions[0].tolist()))
+        if region is None:
+            return -1
+        return region.get(tuple(local[0].tolist()))
+
+    def get_many(self, coords: np.ndarray) -> np.ndarray:
+        """
+        Gets many blocks at world positions from the window
+        :param coords: array of world block coordinates (N, 3)
+        :return: array of N block ids; -1 outside the window, and in regions that aren't loaded
+        """
+
+        coords = np.asarray(coords, dtype=np.int64).reshape(-1, 3)
+        regions = coords[:, :2] // WORLD_SIZE
+        inside = self.in_window(coords) & np.isin(
+            regions[:, 0] * (2 ** 32) + regions[:, 1],
+            [x * (2 ** 32) + y for x, y in self.regions])
+
+        result = np.full(coords.shape[0], -1, dtype=np.int16)
+        wrapped = coords[inside].copy()
+        wrapped[:, :2] %= WORLD_SIZE
+        result[inside] = self.window.get_many(wrapped)
+        return result
+
+    def set(self, position: tuple[int, int, int], value: int | str) -> bool:
+        """
+        Sets block at world position
+        :param position: world block position
+        :param value: block id or name
+        :return: True when block was set; False when out of bounds or when the region isn't loaded
+        """
+
+        return self.set_many([position], value) == 1
+
+    def set_many(self, coords: np.ndarray, values: np.ndarray | int | str, undo: bool = True) -> int:
+        """
+        Sets many blocks at world positions; blocks in regions that aren't loaded are skipped
+        :param coords: array of world block coordinates (N, 3)
+        :param values: block ids or names, or a single block id or name for all of them
+        :param undo: whether the edit can be undone
+        :return: amount of set blocks
+        """
+
+        coords = np.asarray(coords, dtype=np.int64).reshape(-1, 3)
+        values = World.resolve(values) if isinstance(values, (int, str)) else values
+        if values is None:
+            return 0
+        values = np.broadcast_to(np.asarray(values), coords.shape[:1])
+
+        regions, local = self.locate(coords)
+        changed = 0
+
+        # snapshot the edited regions, so that the edit can be undone
+        edited = [tuple(region.tolist()) for region in np.unique(regions, axis=0)]
+        edited = [region for region in edited if region in self.regions]
+        if edited and undo:
+            self.history.record([self.regions[region] for region in edited])
+
+        for region in edited:
+            mask = np.all(regions == region, axis=1)
+            changed += self.regions[region].set_many(local[mask], values[mask])
+            self.modified.add(region)
+
+        # mirror the changes in the window
+        inside = self.in_window(coords) & np.isin(
+            regions[:, 0] * (2 ** 32) + regions[:, 1],
+            [x * (2 ** 32) + y for x, y in self.regions])
+        if inside.any():
+            wrapped = coords[inside].copy()
+            wrapped[:, :2] %= WORLD_SIZE
+            self.window.set_many(wrapped, values[inside])
+        return changed
+
+    def undo(self) -> bool:
+        """
+        Undoes the last edit made with 'set' or 'set_many'
+        :return: True when an edit was undone, False when there is nothing to undo
+        """
+
+        restored = self.history.undo()
+        regions = {id(world): region for region, world in self.regions.items()}
+        for world, chunk_indices in restored:
+            region = regions[id(world)]
+            self.modified.add(region)
+
+            # copy the restored chunk columns into the window
+            columns = {
+                (region[0] * WORLD_CHUNKS + chunk_index % WORLD_CHUNKS,
+                 region[1] * WORLD_CHUNKS + chunk_index // WORLD_CHUNKS % WORLD_CHUNKS)
+                for chunk_index in chunk_indices}
+            if self.origin is None:
+                continue
+            columns &= self.window_columns(self.origin)
+            self.copy_columns(columns)
+
+            # restored chunks are changed as a whole; window wraps at region size, so they keep their index
+            if self.window.ticker is not None:
+                for chunk_index in chunk_indices:
+                    if (region[0] * WORLD_CHUNKS + chunk_index % WORLD_CHUNKS,
+                            region[1] * WORLD_CHUNKS + chunk_index // WORLD_CHUNKS % WORLD_CHUNKS) in columns:
+                        self.window.ticker.mark_chunk(chunk_index)
+        return bool(restored)
+
+    def close(self):
+        """
+        Saves modified regions and stops background threads
+        """
+
+        for region in list(self.modified):
+            self.saving[region] = self.executor.submit(
+                self.save_region, region, self.regions[region], self.saving.get(region))
+        self.modified.clear()
+        self.executor.shutdown(wait=True)
+        for future in self.saving.values():
+            future.result()
+        self.saving.clear()
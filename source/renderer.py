@@ -0,0 +1,314 @@
+"""
+Headless CPU reference renderer
+"""
+
+
+import os
+import time
+import numpy as np
+from PIL import Image
+from concurrent.futures import ProcessPoolExecutor
+from source.world import *
+from source.options import *
+
+
+# renderer used by the tile rendering worker processes
+WORKER_RENDERER = None
+
+
+class CPURenderer:
+    """
+    Renders frames on the CPU, without a window or a GL context.
+    Follows the same steps as 'main.glsl' and 'sky.glsl', so the frames can be used as reference images
+    """
+
+    def __init__(self, world: World, resolution: tuple[int, int]):
+        """
+        :param world: world to render; all its chunks are loaded
+        :param resolution: image resolution
+        """
+
+        self.world: World = world
+        self.world.load_chunks()
+        self.world.close_source()
+        if self.world.occupancy is None:
+            self.world.build_occupancy()
+
+        self.resolution: tuple[int, int] = resolution
+
+        # textures are copied out of the block registry, so that the renderer can be sent to other processes
+        self.texture_layers: np.ndarray = Blocks.atlas.layers.astype(np.float32) / 255
+        self.texture_faces: np.ndarray = np.array(Blocks.faces, dtype=np.int64)
+
+        self.lookup: VoxelLookup | None = None
+
+        # counters of the last render
+        self.rays: int = 0
+        self.seconds: float = 0.0
+
+    def __getstate__(self) -> dict:
+        # lookup is remade by every process
+        state = self.__dict__.copy()
+        state["lookup"] = None
+        return state
+
+    @property
+    def rays_per_second(self) -> float:
+        """
+        Ray casting speed of the last render
+        """
+
+        return self.rays / self.seconds if self.seconds > 0 else 0.0
+
+    def render(
+            self,
+            position: tuple[float, float, float],
+            rotation: tuple[float, float],
+            fov: float,
+            processes: int | None = None) -> np.ndarray:
+        """
+        Renders a frame; 'Player.pos', 'Player.rot' and 'Player.fov' can be used as camera values
+        :param position: camera position
+        :param rotation: camera rotation
+        :param fov: camera fov, the same value as 'u_playerFov'
+        :param processes: amount of processes to render the tiles with; defaults to the amount of CPUs
+        :return: RGB image with shape (height, width, 3), top row first
+        """
+
+        width, height = self.resolution
+        tiles = [
+            (x, y, min(RENDER_TILE, width - x), min(RENDER_TILE, height - y), position, rotation, fov)
+            for y in range(0, height, RENDER_TILE)
+            for x in range(0, width, RENDER_TILE)]
+
+        start = time.perf_counter()
+        processes = os.cpu_count() if processes is None else processes
+        if processes > 1 and len(tiles) > 1:
+            with ProcessPoolExecutor(
+                    max_workers=min(processes, len(tiles)),
+                    initializer=CPURenderer.init_worker,
+                    initargs=(self,)) as executor:
+                results = list(executor.map(CPURenderer.render_worker_tile, tiles))
+        else:
+            results = [self.render_tile(*tile) for tile in tiles]
+        self.seconds = time.perf_counter() - start
+
+        # stitch tiles together; rows are bottom to top
+        image = np.empty([height, width, 3], dtype=np.uint8)
+        self.rays = 0
+        for (x, y, tile_width, tile_height, *_), (pixels, rays) in zip(tiles, results):
+            image[y: y + tile_height, x: x + tile_width] = pixels
+            self.rays += rays
+        return np.flipud(image)
+
+    def render_to_file(
+            self,
+            filename: str,
+            position: tuple[float, float, float],
+            rotation: tuple[float, float],
+            fov: float,
+            processes: int | None = None):
+        """
+        Renders a frame and saves it as an image
+        :param filename: image filename
+        :param position: camera position
+        :param rotation: camera rotation
+        :param fov: camera fov
+        :param processes: amount of processes to render with
+        """
+
+        Image.fromarray(self.render(position, rotation, fov, processes)).save(filename)
+
+    @staticmethod
+    def init_worker(renderer: "CPURenderer"):
+        """
+        Sets up a tile rendering process
+        :param renderer: renderer to use in the process
+        """
+
+        global WORKER_RENDERER
+        WORKER_RENDERER = renderer
+
+    @staticmethod
+    def render_worker_tile(tile: tuple) -> tuple[np.ndarray, int]:
+        """
+        Renders a tile in a worker process
+        :param tile: arguments for 'render_tile'
+        :return: rendered tile and amount of cast rays
+        """
+
+        return WORKER_RENDERER.render_tile(*tile)
+
+    def render_tile(
+            self,
+            x: int, y: int,
+            width: int, height: int,
+            position: tuple[float, float, float],
+            rotation: tuple[float, float],
+            fov: float) -> tuple[np.ndarray, int]:
+        """
+        Renders a part of the frame
+        :param x: tile x offset
+        :param y: tile y offset, from the bottom
+        :param width: tile width
+        :param height: tile height
+        :param position: camera position
+        :param rotation: camera rotation
+        :param fov: camera fov
+        :return: RGB tile with rows from bottom to top, and amount of cast rays
+        """
+
+        if self.lookup is None:
+            self.lookup = VoxelLookup(self.world)
+
+        # fragment coordinates
+        frag_x, frag_y = np.meshgrid(np.arange(x, x + width) + 0.5, np.arange(y, y + height) + 0.5)
+        frag_x, frag_y = frag_x.ravel(), frag_y.ravel()
+
+        # ray directions
+        res_x, res_y = self.resolution
+        directions = np.stack([(frag_x - res_x * 0.5) / res_y, np.full_like(frag_x, fov), (frag_y - res_y * 0.5) / res_y], axis=1)
+        directions /= np.linalg.norm(directions, axis=1)[:, None]
+        directions = self.rotate(directions, rotation)
+
+        # ray origins are moved to the world border
+        position = np.asarray(position, dtype=np.float64)
+        border_distance = max(np.linalg.norm(position - WORLD_SIZE / 2) - CUBE_DIAG / 2, 0.0)
+        origins = position + directions * border_distance
+
+        rays = [0]
+        colors = self.trace(origins, directions, True, rays)
+        sky = self.sky(frag_y, rotation[0])
+
+        # blend over the sky
+        pixels = colors[:, :3] * colors[:, 3:] + sky * (1 - colors[:, 3:])
+        pixels = np.round(np.clip(pixels, 0, 1) * 255).astype(np.uint8)
+        return pixels.reshape([height, width, 3]), rays[0]
+
+    def trace(self, origins: np.ndarray, directions: np.ndarray, shadows: bool, rays: list[int]) -> np.ndarray:
+        """
+        Casts rays through up to 'RENDER_LAYERS' blocks, accumulating their colors
+        :param origins: array of ray origins (N, 3)
+        :param directions: array of ray directions (N, 3)
+        :param shadows: whether to cast shadow rays from hit blocks
+        :param rays: one element list the amount of cast rays is added to
+        :return: array of accumulated colors (N, 4)
+        """
+
+        colors = np.zeros([origins.shape[0], 4], dtype=np.float64)
+        positions = origins.copy()
+        skip = np.full(origins.shape, -1, dtype=np.int64)
+        sun = np.asarray(self.world.sun, dtype=np.float64)
+
+        active = np.arange(origins.shape[0])
+        for _ in range(RENDER_LAYERS):
+            if not active.size:
+                break
+
+            # cast rays
+            rays[0] += active.size
+            blocks, ipos, hits, _ = Ray.cast_many(
+                self.world, positions[active], directions[active], skip[active], self.lookup)
+
+            # rays that ended in the sky or in the air at the world border add nothing
+            hit = blocks > 0
+            active, blocks, ipos, hits = active[hit], blocks[hit].astype(np.int64), ipos[hit], hits[hit]
+
+            # base color
+            normals, faces = self.normals(hits, ipos)
+            color = self.sample(self.texture_faces[blocks, faces], self.uv_coords(hits, normals))
+
+            # normal shading
+            color[:, :3] *= np.maximum(0.5, normals @ -sun)[:, None]
+
+            # cast shadow
+            if shadows:
+                shadow = self.trace(
+                    hits - directions[active] * 1e-3, np.broadcast_to(-sun, hits.shape), False, rays)
+                color[:, :3] *= np.maximum(0.3, 1 - shadow[:, 3])[:, None]
+
+            # accumulate color
+            colors[active] += color * (1 - colors[active, 3:])
+
+            # continue through transparent blocks
+            positions[active] = hits
+            skip[active] = ipos
+            active = active[colors[active, 3] < 1]
+        return colors
+
+    def sample(self, layers: np.ndarray, uvs: np.ndarray) -> np.ndarray:
+        """
+        Samples texture layers with nearest filter and repeat wrap
+        :param layers: array of texture layers (N,)
+        :param uvs: array of uv coordinates (N, 2)
+        :return: array of colors (N, 4)
+        """
+
+        size = self.texture_layers.shape[1]
+        texels = np.floor(uvs * size).astype(np.int64) % size
+        return self.texture_layers[layers, texels[:, 1], texels[:, 0]]
+
+    def sky(self, frag_y: np.ndarray, pitch: float) -> np.ndarray:
+        """
+        Computes sky colors
+        :param frag_y: array of fragment y coordinates (N,)
+        :param pitch: camera pitch
+        :return: array of colors (N, 3)
+        """
+
+        gradient = np.array([[int(color[i: i + 2], 16) for i in (0, 2, 4)] for color in SKY_GRADIENT]) / 255
+        slices = len(SKY_GRADIENT) - 1
+        t = (np.sin(pitch + frag_y * np.pi / self.resolution[1]) + 1) / 2
+        index = (t * slices).astype(np.int64)
+        color_t = (np.mod(t, 1 / slices) * slices)[:, None]
+        return gradient[index] * (1 - color_t) + gradient[np.minimum(index + 1, slices)] * color_t
+
+    @staticmethod
+    def rotate(vectors: np.ndarray, rotation: tuple[float, float]) -> np.ndarray:
+        """
+        Rotates vectors around X axis, then around Z axis
+        :param vectors: array of vectors (N, 3)
+        :param rotation: rotation around X and Z axes
+        :return: array of rotated vectors
+        """
+
+        sin_x, cos_x = np.sin(rotation[0]), np.cos(rotation[0])
+        sin_z, cos_z = np.sin(rotation[1]), np.cos(rotation[1])
+        x, y, z = vectors.T
+        y, z = y * cos_x - z * sin_x, z * cos_x + y * sin_x
+        x, y = x * cos_z - y * sin_z, y * cos_z + x * sin_z
+        return np.stack([x, y, z], axis=1)
+
+    @staticmethod
+    def normals(positions: np.ndarray, ipos: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Computes normals of hit blocks from the hit positions
+        :param positions: array of hit positions (N, 3)
+        :param ipos: array of hit block positions (N, 3)
+        :return: array of normals (N, 3) and array of face indices (N,) in 'BLOCK_FACES' order
+        """
+
+        delta = positions - ipos - 0.5
+        size = np.abs(delta)
+        axis = np.where(
+            (size[:, 0] > size[:, 1]) & (size[:, 0] > size[:, 2]), 0,
+            np.where(size[:, 1] > size[:, 2], 1, 2))
+        positive = delta[np.arange(axis.size), axis] > 0
+        normals = np.zeros(positions.shape, dtype=np.float64)
+        normals[np.arange(axis.size), axis] = np.where(positive, 1, -1)
+        return normals, axis * 2 + ~positive
+
+    @staticmethod
+    def uv_coords(positions: np.ndarray, normals: np.ndarray) -> np.ndarray:
+        """
+        Computes texture coordinates of hit positions
+        :param positions: array of hit positions (N, 3)
+        :param normals: array of hit normals (N, 3)
+        :return: array of uv coordinates (N, 2)
+        """
+
+        x, y, z = np.mod(positions, 1).T
+        nx, ny, nz = normals.T
+        u = np.select([nx > 0, nx < 0, ny > 0, ny < 0, nz > 0], [1 - y, y, x, 1 - x, x], 1 - x)
+        v = np.select([nx != 0, ny != 0, nz > 0], [z, z, y], 1 - y)
+        return np.stack([u, v], axis=1)
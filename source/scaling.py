@@ -0,0 +1,108 @@
+"""
+Dynamic resolution scaling
+"""
+
+
+import math
+from source.profiler import *
+from source.options import *
+
+
+class RenderScale:
+    """
+    Fraction of the window resolution the chunk pass is traced at.
+    In 'fixed' mode the scale never changes. In 'adaptive' mode it follows GPU time of the chunk pass,
+    so that the pass fits into 'RENDER_SCALE_BUDGET' of a 'WINDOW_FRAMERATE' frame.
+    GPU time is read a few frames late, so the scale changes in steps, and rises only when there is spare time
+    for a whole step, which keeps it from flickering between two values
+    """
+
+    def __init__(
+            self,
+            mode: str = RENDER_SCALE_MODE,
+            scale: float = RENDER_SCALE,
+            minimum: float = RENDER_SCALE_MIN,
+            step: float = RENDER_SCALE_STEP,
+            budget: float = RENDER_SCALE_BUDGET):
+        """
+        :param mode: 'fixed' or 'adaptive'
+        :param scale: scale of 'fixed' mode, and the starting scale of 'adaptive' mode
+        :param minimum: lowest scale of 'adaptive' mode
+        :param step: scale changes by multiples of this value
+        :param budget: fraction of the frame time the chunk pass should take
+        """
+
+        self.mode: str = mode
+        self.fixed_scale: float = scale
+        self.scale: float = scale
+        self.minimum: float = minimum
+        self.step: float = step
+        self.target: float = budget / WINDOW_FRAMERATE
+
+        # smoothed GPU time of the pass per full resolution frame; unknown until the first measurement
+        self.cost: float | None = None
+
+        # measures the pass; measurements are tagged with the scale they were made at
+        self.timer: GPUTimer = GPUTimer()
+
+    def cycle_mode(self):
+        """
+        Switches between 'fixed' and 'adaptive' mode
+        """
+
+        self.mode = "adaptive" if self.mode == "fixed" else "fixed"
+        self.scale = self.fixed_scale
+        self.cost = None
+
+    def resolution(self, size: tuple[int, int]) -> tuple[int, int]:
+        """
+        Scales a resolution
+        :param size: window resolution
+        :return: resolution the pass is traced at
+        """
+
+        return max(1, round(size[0] * self.scale)), max(1, round(size[1] * self.scale))
+
+    def begin(self) -> int:
+        """
+        Starts measuring the pass
+        :return: query to give to 'end'
+        """
+
+        return self.timer.timestamp()
+
+    def end(self, begin: int):
+        """
+        Finishes measuring the pass, and adjusts the scale using measurements that are ready
+        :param begin: query returned by 'begin'
+        """
+
+        self.timer.measure(begin, self.scale)
+        for scale, _, duration in self.timer.collect():
+            self.update(duration, scale)
+
+    def update(self, duration: float, scale: float):
+        """
+        Adjusts the scale after a measurement; only in 'adaptive' mode
+        :param duration: GPU time of the pass, in seconds
+        :param scale: scale the pass was traced at
+        """
+
+        if self.mode != "adaptive":
+            return
+
+        # time of the pass is proportional to the amount of traced pixels
+        cost = duration / (scale * scale)
+        self.cost = cost if self.cost is None else self.cost * 0.9 + cost * 0.1
+
+        ideal = math.sqrt(self.target / max(self.cost, 1e-9))
+        ideal = min(1.0, max(self.minimum, math.floor(ideal / self.step + 1e-6) * self.step))
+        if ideal < self.scale or ideal >= self.scale + self.step - 1e-6:
+            self.scale = ideal
+
+    def release(self):
+        """
+        Frees GL objects
+        """
+
+        self.timer.release()
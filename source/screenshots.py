@@ -0,0 +1,220 @@
+"""
+Tiled high resolution screenshots
+"""
+
+
+import os
+import ctypes
+import threading
+import numpy as np
+import arcade.gl
+from pyglet import gl
+from PIL import Image
+from collections.abc import Callable
+from source.options import *
+
+
+class TileReadback:
+    """
+    Asynchronous read of a rendered tile through a pixel pack buffer.
+    The pixels are copied on the GPU side, and are fetched once the fence says that the copy is done
+    """
+
+    def __init__(self, ctx: arcade.gl.Context, tile_size: int):
+        self.buffer: arcade.gl.Buffer = ctx.buffer(reserve=tile_size * tile_size * 3, usage="stream")
+        self.tile: tuple[int, int, int, int] | None = None
+        self.fence = None
+
+        # timer query for rendering of the tile
+        self.query: gl.GLuint = gl.GLuint()
+        gl.glGenQueries(1, ctypes.byref(self.query))
+
+    def begin(self, tile: tuple[int, int, int, int]):
+        """
+        Starts measuring rendering time of a tile
+        :param tile: tile x, y, width and height
+        """
+
+        self.tile = tile
+        gl.glBeginQuery(gl.GL_TIME_ELAPSED, self.query)
+
+    def end(self, framebuffer: arcade.gl.Framebuffer):
+        """
+        Stops measuring rendering time and starts copying the tile pixels
+        :param framebuffer: framebuffer the tile was rendered to
+        """
+
+        gl.glEndQuery(gl.GL_TIME_ELAPSED)
+        with framebuffer.activate():
+            gl.glPixelStorei(gl.GL_PACK_ALIGNMENT, 1)
+            gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, self.buffer.glo)
+            gl.glReadPixels(0, 0, self.tile[2], self.tile[3], gl.GL_RGB, gl.GL_UNSIGNED_BYTE, None)
+            gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, 0)
+        self.fence = gl.glFenceSync(gl.GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+
+    def ready(self) -> bool:
+        """
+        Checks, without waiting, whether the tile pixels were copied
+        """
+
+        return gl.glClientWaitSync(self.fence, 0, 0) in (gl.GL_ALREADY_SIGNALED, gl.GL_CONDITION_SATISFIED)
+
+    def read(self) -> tuple[np.ndarray, float]:
+        """
+        Fetches the copied tile
+        :return: tile pixels with shape (height, width, 3), rows from bottom to top, and tile rendering time
+        """
+
+        gl.glDeleteSync(self.fence)
+        self.fence = None
+
+        elapsed = gl.GLuint64()
+        gl.glGetQueryObjectui64v(self.query, gl.GL_QUERY_RESULT, ctypes.byref(elapsed))
+
+        width, height = self.tile[2:]
+        pixels = np.frombuffer(self.buffer.read(width * height * 3), dtype=np.uint8).reshape([height, width, 3])
+        return pixels, elapsed.value / 1e9
+
+    def delete(self):
+        """
+        Frees GL objects
+        """
+
+        if self.fence is not None:
+            gl.glDeleteSync(self.fence)
+            self.fence = None
+        gl.glDeleteQueries(1, ctypes.byref(self.query))
+        self.buffer.delete()
+
+
+class TiledScreenshot:
+    """
+    Screenshot that is rendered in tiles over several frames.
+    Every frame renders as many tiles as fit into the time budget, tiles are read back asynchronously,
+    and the image is encoded and written on a worker thread
+    """
+
+    def __init__(
+            self,
+            ctx: arcade.gl.Context,
+            resolution: tuple[int, int],
+            filename: str,
+            tile_size: int = SCREENSHOT_TILE,
+            budget: float = SCREENSHOT_FRAME_BUDGET):
+        """
+        :param ctx: GL context
+        :param resolution: screenshot resolution; not limited by max texture size
+        :param filename: image filename
+        :param tile_size: size of rendered tiles
+        :param budget: max rendering time of tiles per frame, in seconds
+        """
+
+        self.ctx: arcade.gl.Context = ctx
+        self.resolution: tuple[int, int] = resolution
+        self.filename: str = filename
+        self.tile_size: int = tile_size
+        self.budget: float = budget
+
+        # tiles waiting to be rendered; x and y offsets are from the bottom left corner
+        self.tiles: list[tuple[int, int, int, int]] = [
+            (x, y, min(tile_size, resolution[0] - x), min(tile_size, resolution[1] - y))
+            for y in range(0, resolution[1], tile_size)
+            for x in range(0, resolution[0], tile_size)][::-1]
+
+        self.framebuffer: arcade.gl.Framebuffer = ctx.framebuffer(
+            color_attachments=[ctx.texture((tile_size, tile_size), components=3)])
+        self.free: list[TileReadback] = []
+        self.reading: list[TileReadback] = []
+
+        # image rows are stored top to bottom
+        self.image: np.ndarray = np.empty([resolution[1], resolution[0], 3], dtype=np.uint8)
+
+        # average rendering time of a tile; unknown until the first tiles are read back
+        self.tile_time: float | None = None
+        self.measured: int = 0
+
+        self.writer: threading.Thread | None = None
+
+    @property
+    def finished(self) -> bool:
+        """
+        Whether the image was written
+        """
+
+        return self.writer is not None and not self.writer.is_alive()
+
+    def step(self, render: Callable[[tuple[int, int, int, int]], None]) -> bool:
+        """
+        Renders the next tiles and collects the tiles that were read back. Should be called once per frame.
+        :param render: renders a tile, given as x, y, width and height, into the active framebuffer
+        :return: True when all tiles were rendered and read back
+        """
+
+        self.collect()
+
+        # amount of tiles that fit into the budget; a tile is always rendered, so the screenshot progresses
+        amount = 1 if self.tile_time is None else max(1, int(self.budget / max(self.tile_time, 1e-6)))
+        for _ in range(min(amount, len(self.tiles))):
+            tile = self.tiles.pop()
+            readback = self.free.pop() if self.free else TileReadback(self.ctx, self.tile_size)
+
+            readback.begin(tile)
+            self.framebuffer.viewport = (0, 0, tile[2], tile[3])
+            with self.framebuffer.activate():
+                render(tile)
+            readback.end(self.framebuffer)
+            self.reading.append(readback)
+
+        if self.tiles or self.reading:
+            return False
+
+        # everything is read back; write the image
+        if self.writer is None:
+            self.release()
+            self.writer = threading.Thread(target=self.write, daemon=True)
+            self.writer.start()
+        return True
+
+    def collect(self):
+        """
+        Copies the read back tiles into the image
+        """
+
+        reading = []
+        for readback in self.reading:
+            if not readback.ready():
+                reading.append(readback)
+                continue
+
+            pixels, elapsed = readback.read()
+            x, y, width, height = readback.tile
+            bottom = self.resolution[1] - y
+
+            # GL rows go from bottom to top; they are flipped while being copied
+            self.image[bottom - height: bottom, x: x + width] = pixels[::-1]
+
+            # first measurement includes driver warm up, and is ignored
+            if self.measured > 0:
+                self.tile_time = elapsed if self.tile_time is None else self.tile_time * 0.75 + elapsed * 0.25
+            self.measured += 1
+            self.free.append(readback)
+        self.reading = reading
+
+    def release(self):
+        """
+        Frees GL objects
+        """
+
+        for readback in self.free + self.reading:
+            readback.delete()
+        self.free.clear()
+        self.reading.clear()
+        self.framebuffer.delete()
+
+    def write(self):
+        """
+        Encodes and writes the image
+        """
+
+        os.makedirs(os.path.dirname(self.filename) or ".", exist_ok=True)
+        Image.fromarray(self.image).save(self.filename)
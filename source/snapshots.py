@@ -0,0 +1,174 @@
+"""
+World snapshots and undo history
+"""
+
+
+import time
+import numpy as np
+from source.chunks import *
+from source.storage import *
+from source.options import *
+
+
+class WorldSnapshot:
+    """
+    Frozen chunks of a world. Taking a snapshot doesn't copy any block data; chunks are shared with the world,
+    which copies a shared chunk before changing it in place. Snapshots can be saved on another thread
+    while the world is being changed
+    """
+
+    def __init__(self, chunks: list[int | Chunk]):
+        """
+        :param chunks: chunks of the world; they must not be changed in place afterwards
+        """
+
+        self.chunks: list[int | Chunk] = chunks
+        self.created: float = time.perf_counter()
+
+    def changed(self, chunks: list[int | Chunk | None]) -> list[int]:
+        """
+        Finds chunks that differ from the snapshot; shared chunks are compared by identity
+        :param chunks: chunks to compare with
+        :return: chunk indices
+        """
+
+        return [chunk_index for chunk_index, (old, new) in enumerate(zip(self.chunks, chunks)) if old != new]
+
+    def nbytes_changed(self, chunks: list[int | Chunk | None]) -> int:
+        """
+        Approximate amount of memory used only by the snapshot, and not by the given chunks
+        :param chunks: chunks to compare with
+        :return: amount of bytes
+        """
+
+        total = 0
+        for old, new in zip(self.chunks, chunks):
+            if old != new and isinstance(old, Chunk):
+                total += old.nbytes
+        return total
+
+    def get_voxels(self) -> np.ndarray:
+        """
+        Unpacks the snapshot into the same layout as 'World.get_voxels'
+        :return: flat array of 'WORLD_SIZE ** 3' block ids
+        """
+
+        voxels = np.empty(
+            [WORLD_CHUNKS, CHUNK_SIZE, WORLD_CHUNKS, CHUNK_SIZE, WORLD_CHUNKS, CHUNK_SIZE], dtype=np.uint8)
+        for chunk_index, chunk in enumerate(self.chunks):
+            chunk_y, chunk_x = divmod(chunk_index, WORLD_CHUNKS)
+            chunk_z, chunk_y = divmod(chunk_y, WORLD_CHUNKS)
+            if isinstance(chunk, int):
+                voxels[chunk_z, :, chunk_y, :, chunk_x, :] = chunk
+            else:
+                voxels[chunk_z, :, chunk_y, :, chunk_x, :] = chunk.to_array().reshape(
+                    CHUNK_SIZE, CHUNK_SIZE, CHUNK_SIZE)
+        return voxels.reshape(-1)
+
+    def save(self, filename: str, codec: int = CODEC_ZLIB):
+        """
+        Saves the snapshot in the world save format. Safe to call from a background thread
+        :param filename: name of the file
+        :param codec: chunk compression codec
+        """
+
+        write_save(filename, self.chunks, None, codec)
+
+
+class WorldHistory:
+    """
+    Undo history made of snapshots of one or more worlds. Every step holds snapshots of the worlds it is about
+    to change. Snapshots share unchanged chunks with each other and with the worlds, so only the changed chunks
+    take memory; oldest steps are dropped when they take more than the limit
+    """
+
+    def __init__(self, limit: int = UNDO_MEMORY):
+        """
+        :param limit: max bytes of chunks kept only by the history
+        """
+
+        self.limit: int = limit
+
+        # steps from the oldest to the newest; every step is a list of [world, snapshot, bytes] entries,
+        # bytes are None for the newest snapshot of a world, which is compared with the world itself
+        self.steps: list[list[list]] = []
+
+    def record(self, worlds: list):
+        """
+        Snapshots the worlds before they are changed
+        :param worlds: worlds about to be changed
+        """
+
+        step = []
+        for world in worlds:
+            snapshot = world.snapshot()
+
+            # previous newest snapshot of the world now only keeps chunks changed since
+            entry = self.newest(world)
+            if entry is not None:
+                entry[2] = entry[1].nbytes_changed(snapshot.chunks)
+            step.append([world, snapshot, None])
+        self.steps.append(step)
+        self.trim()
+
+    def undo(self) -> list:
+        """
+        Restores the worlds of the newest step
+        :return: list of restored worlds and indices of their changed chunks; empty when there is nothing to undo
+        """
+
+        if not self.steps:
+            return []
+
+        restored = []
+        for world, snapshot, _ in self.steps.pop():
+            restored.append((world, world.restore(snapshot)))
+
+            # snapshot before it becomes the newest one again
+            entry = self.newest(world)
+            if entry is not None:
+                entry[2] = None
+        return restored
+
+    def forget(self, world):
+        """
+        Drops snapshots of the world, for example when it is unloaded
+        :param world: world to forget
+        """
+
+        for step in self.steps:
+            step[:] = [entry for entry in step if entry[0] is not world]
+        self.steps = [step for step in self.steps if step]
+
+    def newest(self, world) -> list | None:
+        """
+        Finds the newest snapshot entry of the world
+        :param world: world
+        :return: entry, or None when there is no snapshot of the world
+        """
+
+        for step in reversed(self.steps):
+            for entry in step:
+                if entry[0] is world:
+                    return entry
+        return None
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Approximate amount of memory used only by the history
+        """
+
+        total = 0
+        for step in self.steps:
+            for world, snapshot, nbytes in step:
+                total += snapshot.nbytes_changed(world.chunks) if nbytes is None else nbytes
+        return total
+
+    def trim(self):
+        """
+        Drops the oldest steps until the history fits in the limit; the newest step is always kept
+        """
+
+        while len(self.steps) > 1 and self.nbytes > self.limit:
+            self.steps.pop(0)
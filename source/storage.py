@@ -0,0 +1,211 @@
+"""
+World save file format
+"""
+
+
+import os
+import lzma
+import mmap
+import zlib
+import struct
+import hashlib
+import numpy as np
+from source.blocks import *
+from source.chunks import *
+from source.options import *
+from source.exceptions import *
+
+
+# file starts with a header, which is followed by the chunk index table and compressed chunks
+SAVE_MAGIC: bytes = b"CUBW"
+SAVE_VERSION: int = 1
+SAVE_HEADER = struct.Struct("<4sHHHH32sI")  # magic, version, world size, chunk size, codec, registry hash, chunks
+SAVE_INDEX = np.dtype([("offset", "<u8"), ("length", "<u4"), ("value", "<u2")])  # length 0 for single block chunk
+
+# legacy saves are raw numpy arrays
+NUMPY_MAGIC: bytes = b"\x93NUMPY"
+
+# chunk compression codecs
+CODECS: dict[int, tuple] = {
+    0: (zlib.compress, zlib.decompress),
+    1: (lzma.compress, lzma.decompress)}
+CODEC_ZLIB: int = 0
+CODEC_LZMA: int = 1
+
+
+def registry_hash() -> bytes:
+    """
+    Hashes the block registry, so that saves made with different block ids are not mixed up
+    """
+
+    registry = ";".join(f"{block_id}:{name}" for block_id, name in sorted(Blocks.numbered.items()))
+    return hashlib.sha256(registry.encode("ascii")).digest()
+
+
+def pack_chunk(chunk: Chunk) -> bytes:
+    """
+    Serializes a chunk; palette size, bits per index, palette and packed indices.
+    :param chunk: chunk to serialize
+    :return: uncompressed chunk data
+    """
+
+    return bytes([len(chunk.palette) - 1, chunk.bits, *chunk.palette]) + chunk.data
+
+
+def unpack_chunk(payload: bytes) -> Chunk:
+    """
+    Deserializes a chunk made by 'pack_chunk'.
+    :param payload: uncompressed chunk data
+    :return: chunk
+    """
+
+    palette_size = payload[0] + 1
+    return Chunk(list(payload[2:2 + palette_size]), payload[1], bytearray(payload[2 + palette_size:]))
+
+
+def is_legacy_save(filename: str) -> bool:
+    """
+    Checks whether the file is an old raw numpy save.
+    :param filename: name of the file
+    """
+
+    with open(filename, "rb") as file:
+        return file.read(len(NUMPY_MAGIC)) == NUMPY_MAGIC
+
+
+def load_legacy(filename: str) -> np.ndarray:
+    """
+    Loads old raw numpy save, checking its size before reading it.
+    :param filename: name of the file
+    :return: flat array of block ids
+    """
+
+    voxels = np.load(filename, mmap_mode="r")
+    if voxels.shape != (WORLD_SIZE**3,) or voxels.dtype != np.uint8:
+        raise WorldGenSizeError("Incorrect world size")
+    return np.asarray(voxels)
+
+
+class SaveFile:
+    """
+    Memory mapped save file. Chunks are decompressed only when requested
+    """
+
+    def __init__(self, filename: str):
+        self.filename: str = filename
+
+        self.file = open(filename, "rb")
+        try:
+            self.mmap: mmap.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty file can't be mapped
+            self.file.close()
+            raise WorldSaveError("Save file is empty")
+
+        try:
+            magic, version, world_size, chunk_size, codec, blocks_hash, chunk_amount = SAVE_HEADER.unpack_from(
+                self.mmap)
+            if magic != SAVE_MAGIC:
+                raise WorldSaveError("Not a world save file")
+            if version != SAVE_VERSION:
+                raise WorldSaveError(f"Unsupported save version {version}")
+            if world_size != WORLD_SIZE or chunk_size != CHUNK_SIZE or chunk_amount != WORLD_CHUNKS ** 3:
+                raise WorldGenSizeError("Incorrect world size")
+            if codec not in CODECS:
+                raise WorldSaveError(f"Unknown chunk codec {codec}")
+            if blocks_hash != registry_hash():
+                raise WorldSaveError("Save was made with a different block registry")
+        except (struct.error, GameException):
+            self.close()
+            raise
+
+        self.codec: int = codec
+        self.index: np.ndarray = np.frombuffer(
+            self.mmap, dtype=SAVE_INDEX, count=chunk_amount, offset=SAVE_HEADER.size).copy()
+
+    def read_raw(self, chunk_index: int) -> bytes:
+        """
+        Reads compressed chunk data.
+        :param chunk_index: chunk index
+        :return: compressed chunk data
+        """
+
+        entry = self.index[chunk_index]
+        return self.mmap[int(entry["offset"]):int(entry["offset"]) + int(entry["length"])]
+
+    def read_chunk(self, chunk_index: int) -> int | Chunk:
+        """
+        Reads and decompresses a chunk.
+        :param chunk_index: chunk index
+        :return: block id for single block chunk, chunk otherwise
+        """
+
+        entry = self.index[chunk_index]
+        if entry["length"] == 0:
+            return int(entry["value"])
+        return unpack_chunk(CODECS[self.codec][1](self.read_raw(chunk_index)))
+
+    def close(self) -> None:
+        """
+        Closes the file
+        """
+
+        if not self.mmap.closed:
+            self.mmap.close()
+        self.file.close()
+
+
+def write_save(
+        filename: str,
+        chunks: list,
+        source: SaveFile | None = None,
+        codec: int = CODEC_ZLIB) -> None:
+    """
+    Writes the save file. File is written under a temporary name and renamed after, so the old save
+    stays intact until the new one is complete.
+    :param filename: name of the file
+    :param chunks: list of chunks; None entries are not loaded and are copied from 'source' as is
+    :param source: save file the world was loaded from
+    :param codec: chunk compression codec
+    """
+
+    compress = CODECS[codec][0]
+    index = np.zeros(len(chunks), dtype=SAVE_INDEX)
+    offset = SAVE_HEADER.size + index.nbytes
+    payloads = []
+    for chunk_index, chunk in enumerate(chunks):
+        if chunk is None:
+            # not loaded chunks are unchanged; reuse compressed data when possible
+            if source.codec == codec:
+                entry = source.index[chunk_index]
+                if entry["length"] == 0:
+                    index["value"][chunk_index] = entry["value"]
+                    continue
+                payload = source.read_raw(chunk_index)
+            else:
+                chunk = source.read_chunk(chunk_index)
+        if chunk is not None:
+            if not isinstance(chunk, int):
+                chunk = chunk.compact()
+            if isinstance(chunk, int):
+                index["value"][chunk_index] = chunk
+                continue
+            payload = compress(pack_chunk(chunk))
+
+        index["offset"][chunk_index] = offset
+        index["length"][chunk_index] = len(payload)
+        offset += len(payload)
+        payloads.append(payload)
+
+    os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+    temp_filename = f"{filename}.tmp"
+    with open(temp_filename, "wb") as file:
+        file.write(SAVE_HEADER.pack(
+            SAVE_MAGIC, SAVE_VERSION, WORLD_SIZE, CHUNK_SIZE, codec, registry_hash(), len(chunks)))
+        file.write(index.tobytes())
+        for payload in payloads:
+            file.write(payload)
+
+    # mapped file can't be replaced on some platforms
+    if source is not None and os.path.abspath(source.filename) == os.path.abspath(filename):
+        source.close()
+    os.replace(temp_filename, filename)
@@ -0,0 +1,451 @@
+"""
+World sync over asyncio streams
+"""
+
+
+import time
+import zlib
+import struct
+import asyncio
+import numpy as np
+from source.world import *
+from source.options import *
+from source.exceptions import *
+
+
+# every message starts with its type and payload length
+SYNC_HEADER = struct.Struct("<BI")
+MSG_SUBSCRIBE: int = 1  # viewer asks for chunks; payload is '<u2' chunk indices, empty for all chunks
+MSG_CHUNKS: int = 2  # whole chunks; payload is a sequence of chunk entries, each followed by its compressed chunk
+MSG_BLOCKS: int = 3  # changed blocks; payload is a blocks header, followed by compressed keys and values
+SYNC_CHUNK = struct.Struct("<HHI")  # chunk index, block id of single block chunk, compressed length; 0 for single block
+SYNC_BLOCKS = struct.Struct("<dI")  # time of the oldest change, amount of blocks
+
+
+def encode_message(message_type: int, payload: bytes) -> bytes:
+    """
+    Makes a message
+    :param message_type: message type
+    :param payload: message payload
+    :return: message bytes
+    """
+
+    return SYNC_HEADER.pack(message_type, len(payload)) + payload
+
+
+async def read_message(reader: asyncio.StreamReader) -> tuple[int, bytes]:
+    """
+    Reads a message
+    :param reader: stream to read from
+    :return: message type and payload
+    """
+
+    message_type, length = SYNC_HEADER.unpack(await reader.readexactly(SYNC_HEADER.size))
+    return message_type, await reader.readexactly(length)
+
+
+def encode_chunk(chunk_index: int, chunk: int | Chunk) -> bytes:
+    """
+    Makes a chunk entry of a chunks message
+    :param chunk_index: chunk index
+    :param chunk: block id for single block chunk, chunk otherwise
+    :return: chunk entry bytes
+    """
+
+    if not isinstance(chunk, int):
+        chunk = chunk.compact()
+    if isinstance(chunk, int):
+        return SYNC_CHUNK.pack(chunk_index, chunk, 0)
+    payload = zlib.compress(pack_chunk(chunk))
+    return SYNC_CHUNK.pack(chunk_index, 0, len(payload)) + payload
+
+
+def encode_blocks(keys: np.ndarray, values: np.ndarray, since: float) -> bytes:
+    """
+    Makes a blocks message
+    :param keys: sorted array of block keys, 'chunk_index * CHUNK_VOLUME + local index'
+    :param values: array of block ids
+    :param since: time of the oldest change
+    :return: message bytes
+    """
+
+    # keys are sorted, so differences between them are small and compress well
+    steps = np.diff(keys, prepend=0).astype("<u4")
+    payload = zlib.compress(steps.tobytes() + values.astype(np.uint8).tobytes())
+    return encode_message(MSG_BLOCKS, SYNC_BLOCKS.pack(since, keys.size) + payload)
+
+
+def decode_blocks(payload: bytes) -> tuple[np.ndarray, np.ndarray, float]:
+    """
+    Reads a blocks message payload
+    :param payload: message payload
+    :return: array of block keys, array of block ids, and time of the oldest change
+    """
+
+    try:
+        since, count = SYNC_BLOCKS.unpack_from(payload)
+        data = zlib.decompress(payload[SYNC_BLOCKS.size:])
+    except (struct.error, zlib.error) as e:
+        raise WorldSyncError("Malformed blocks message") from e
+    if len(data) != count * 5:
+        raise WorldSyncError("Malformed blocks message")
+    keys = np.cumsum(np.frombuffer(data, dtype="<u4", count=count).astype(np.int64))
+    values = np.frombuffer(data, dtype=np.uint8, offset=count * 4)
+    if count and keys[-1] >= WORLD_CHUNKS ** 3 * CHUNK_VOLUME:
+        raise WorldSyncError("Block out of bounds")
+    return keys, values, since
+
+
+class SyncViewer:
+    """
+    Connection of a remote viewer, on the server side.
+    Changes are merged into a backlog while the viewer doesn't keep up, and sent together once it does
+    """
+
+    def __init__(self, writer: asyncio.StreamWriter):
+        """
+        :param writer: stream to the viewer
+        """
+
+        self.writer: asyncio.StreamWriter = writer
+
+        # subscribed chunks; None for all of them
+        self.mask: np.ndarray | None = None
+
+        # changes not yet sent to the viewer
+        self.blocks: dict[int, int] = {}
+        self.chunks: set[int] = set()
+        self.since: float | None = None
+
+    @property
+    def behind(self) -> bool:
+        """
+        Whether the viewer has too much data waiting to be sent
+        """
+
+        return self.writer.transport.get_write_buffer_size() > SYNC_HIGH_WATER
+
+    def merge(self, keys: np.ndarray, values: np.ndarray, chunks: list[int], since: float | None):
+        """
+        Merges changes into the backlog
+        :param keys: array of changed block keys
+        :param values: array of block ids
+        :param chunks: chunks changed as a whole
+        :param since: time of the oldest change
+        """
+
+        if since is None:
+            return
+        self.blocks.update(zip(keys.tolist(), values.tolist()))
+        self.chunks.update(chunks)
+        self.since = since if self.since is None else min(self.since, since)
+
+    def take(self) -> tuple[np.ndarray, np.ndarray, list[int], float | None]:
+        """
+        Takes the changes out of the backlog
+        :return: same as 'ChangeLog.flush'
+        """
+
+        log = ChangeLog()
+        log.blocks, log.chunks, log.since = self.blocks, self.chunks, self.since
+        self.blocks, self.chunks, self.since = {}, set(), None
+        return log.flush()
+
+
+class WorldSyncServer:
+    """
+    Shares a world with remote viewers. Viewers subscribe to chunks, and get them compressed; then they get
+    batches of changed blocks every 'interval' seconds. Every block keeps only its last value in a batch.
+    Compressed chunks are cached, and batches are compressed once for all viewers of the whole world,
+    so more viewers cost only the bytes sent to them.
+    Viewers that fall behind get their changes merged, instead of queued. The world must be changed
+    on the same thread the server runs on
+    """
+
+    def __init__(self, world: World, interval: float = SYNC_INTERVAL):
+        """
+        :param world: world to share
+        :param interval: seconds between batches of changes
+        """
+
+        self.world: World = world
+        self.changes: ChangeLog = world.changes if world.changes is not None else world.build_changes()
+        self.interval: float = interval
+
+        self.viewers: list[SyncViewer] = []
+        self.server: asyncio.AbstractServer | None = None
+        self.task: asyncio.Task | None = None
+
+        # compressed chunks entries; dropped when the chunk changes
+        self.encoded: dict[int, bytes] = {}
+
+        # sent data counters
+        self.sent_bytes: int = 0
+        self.sent_blocks: int = 0
+        self.sent_chunks: int = 0
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0, path: str | None = None):
+        """
+        Starts accepting viewers
+        :param host: host to listen on
+        :param port: port to listen on; 0 picks a free one
+        :param path: unix socket path to listen on instead of the host and port
+        """
+
+        if path is not None:
+            self.server = await asyncio.start_unix_server(self.serve, path)
+        else:
+            self.server = await asyncio.start_server(self.serve, host, port)
+        self.task = asyncio.create_task(self.run())
+
+    @property
+    def address(self):
+        """
+        Address the server listens on
+        """
+
+        return self.server.sockets[0].getsockname()
+
+    async def close(self):
+        """
+        Disconnects viewers and stops the server
+        """
+
+        self.task.cancel()
+        self.server.close()
+        for viewer in self.viewers:
+            viewer.writer.close()
+        await self.server.wait_closed()
+
+    async def run(self):
+        """
+        Sends batches of changes every 'interval' seconds
+        """
+
+        while True:
+            await asyncio.sleep(self.interval)
+            self.broadcast()
+
+    async def serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Serves a viewer; every subscription replaces the previous one, and sends the subscribed chunks
+        :param reader: stream from the viewer
+        :param writer: stream to the viewer
+        """
+
+        viewer = SyncViewer(writer)
+        try:
+            while True:
+                message_type, payload = await read_message(reader)
+                if message_type != MSG_SUBSCRIBE or len(payload) % 2:
+                    raise WorldSyncError("Unexpected message")
+                chunk_indices = np.frombuffer(payload, dtype="<u2")
+                if np.any(chunk_indices >= WORLD_CHUNKS ** 3):
+                    raise WorldSyncError("Chunk out of bounds")
+
+                if chunk_indices.size == 0:
+                    viewer.mask = None
+                    chunk_indices = range(WORLD_CHUNKS ** 3)
+                else:
+                    viewer.mask = np.zeros(WORLD_CHUNKS ** 3, dtype=np.bool_)
+                    viewer.mask[chunk_indices] = True
+                self.send(viewer, self.encode_chunks(chunk_indices))
+                if viewer not in self.viewers:
+                    self.viewers.append(viewer)
+        except (asyncio.IncompleteReadError, ConnectionError, WorldSyncError):
+            pass
+        finally:
+            if viewer in self.viewers:
+                self.viewers.remove(viewer)
+            writer.close()
+
+    def send(self, viewer: SyncViewer, data: bytes):
+        """
+        Queues data to the viewer
+        :param viewer: viewer
+        :param data: data to send
+        """
+
+        if data:
+            viewer.writer.write(data)
+            self.sent_bytes += len(data)
+
+    def encode_chunks(self, chunk_indices) -> bytes:
+        """
+        Makes a chunks message; chunks are compressed once, and reused until they change
+        :param chunk_indices: chunk indices
+        :return: message bytes
+        """
+
+        entries = []
+        for chunk_index in chunk_indices:
+            entry = self.encoded.get(chunk_index)
+            if entry is None:
+                entry = self.encoded[chunk_index] = encode_chunk(chunk_index, self.world.get_chunk(chunk_index))
+            entries.append(entry)
+        self.sent_chunks += len(entries)
+        return encode_message(MSG_CHUNKS, b"".join(entries))
+
+    def encode_changes(self, keys: np.ndarray, values: np.ndarray, chunks: list[int], since: float | None) -> bytes:
+        """
+        Makes messages of changed chunks and blocks
+        :param keys: sorted array of changed block keys
+        :param values: array of block ids
+        :param chunks: chunks changed as a whole
+        :param since: time of the oldest change
+        :return: message bytes
+        """
+
+        data = b""
+        if chunks:
+            data += self.encode_chunks(chunks)
+        if keys.size:
+            data += encode_blocks(keys, values, since)
+            self.sent_blocks += keys.size
+        return data
+
+    def broadcast(self):
+        """
+        Sends changes since the last call to the viewers
+        """
+
+        keys, values, chunks, since = self.changes.flush()
+        for chunk_index in chunks + np.unique(keys // CHUNK_VOLUME).tolist():
+            self.encoded.pop(chunk_index, None)
+
+        # changes of the whole world are encoded once for all viewers of the whole world
+        shared = None
+        for viewer in list(self.viewers):
+            if viewer.writer.is_closing():
+                continue
+
+            # subscribed changes only
+            viewer_keys, viewer_values, viewer_chunks = keys, values, chunks
+            if viewer.mask is not None:
+                kept = viewer.mask[keys // CHUNK_VOLUME]
+                viewer_keys, viewer_values = keys[kept], values[kept]
+                viewer_chunks = [chunk_index for chunk_index in chunks if viewer.mask[chunk_index]]
+
+            # viewers that fall behind get their changes merged
+            if viewer.since is not None or viewer.behind:
+                viewer.merge(viewer_keys, viewer_values, viewer_chunks, since)
+                if not viewer.behind:
+                    self.send(viewer, self.encode_changes(*viewer.take()))
+            elif since is not None and viewer.mask is None:
+                if shared is None:
+                    shared = self.encode_changes(keys, values, chunks, since)
+                self.send(viewer, shared)
+            elif since is not None:
+                self.send(viewer, self.encode_changes(viewer_keys, viewer_values, viewer_chunks, since))
+
+
+class WorldSyncClient:
+    """
+    Remote viewer of a world; keeps a copy of the subscribed chunks up to date.
+    Chunks that aren't subscribed to are air
+    """
+
+    def __init__(self):
+        self.world: World = World()
+        self.reader: asyncio.StreamReader | None = None
+        self.writer: asyncio.StreamWriter | None = None
+
+        # set once the subscribed chunks arrive
+        self.synced: asyncio.Event = asyncio.Event()
+
+        # received data counters; seconds from the oldest change of a batch until the batch was applied
+        self.received_bytes: int = 0
+        self.received_blocks: int = 0
+        self.latencies: list[float] = []
+
+    async def connect(self, host: str = "127.0.0.1", port: int = 0, path: str | None = None):
+        """
+        Connects to the server
+        :param host: server host
+        :param port: server port
+        :param path: server unix socket path, used instead of the host and port
+        """
+
+        if path is not None:
+            self.reader, self.writer = await asyncio.open_unix_connection(path)
+        else:
+            self.reader, self.writer = await asyncio.open_connection(host, port)
+
+    async def subscribe(self, chunk_indices: list[int] | None = None):
+        """
+        Asks for chunks; they are received by 'run'
+        :param chunk_indices: chunk indices; None for the whole world
+        """
+
+        self.synced.clear()
+        payload = np.array(chunk_indices or [], dtype="<u2").tobytes()
+        self.writer.write(encode_message(MSG_SUBSCRIBE, payload))
+        await self.writer.drain()
+
+    async def run(self):
+        """
+        Receives and applies messages until the server disconnects
+        """
+
+        try:
+            while True:
+                message_type, payload = await read_message(self.reader)
+                self.received_bytes += SYNC_HEADER.size + len(payload)
+                if message_type == MSG_CHUNKS:
+                    self.apply_chunks(payload)
+                    self.synced.set()
+                elif message_type == MSG_BLOCKS:
+                    self.apply_blocks(payload)
+                else:
+                    raise WorldSyncError(f"Unknown message type {message_type}")
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+
+    def apply_chunks(self, payload: bytes):
+        """
+        Replaces chunks with the received ones
+        :param payload: chunks message payload
+        """
+
+        offset = 0
+        while offset < len(payload):
+            try:
+                chunk_index, value, length = SYNC_CHUNK.unpack_from(payload, offset)
+                offset += SYNC_CHUNK.size
+                chunk = value if length == 0 else unpack_chunk(zlib.decompress(payload[offset:offset + length]))
+            except (struct.error, zlib.error, IndexError) as e:
+                raise WorldSyncError("Malformed chunks message") from e
+            if chunk_index >= WORLD_CHUNKS ** 3:
+                raise WorldSyncError("Chunk out of bounds")
+            offset += length
+            self.world.chunks[chunk_index] = chunk
+            self.world.mark_dirty(chunk_index)
+
+    def apply_blocks(self, payload: bytes):
+        """
+        Sets the received blocks
+        :param payload: blocks message payload
+        """
+
+        keys, values, since = decode_blocks(payload)
+        chunk_indices, indices = np.divmod(keys, CHUNK_VOLUME)
+        chunk_y, chunk_x = np.divmod(chunk_indices, WORLD_CHUNKS)
+        chunk_z, chunk_y = np.divmod(chunk_y, WORLD_CHUNKS)
+        local_y, local_x = np.divmod(indices, CHUNK_SIZE)
+        local_z, local_y = np.divmod(local_y, CHUNK_SIZE)
+        self.world.set_many(
+            np.stack([chunk_x, chunk_y, chunk_z], axis=1) * CHUNK_SIZE + np.stack([local_x, local_y, local_z], axis=1),
+            values)
+        self.received_blocks += keys.size
+        self.latencies.append(time.monotonic() - since)
+
+    async def close(self):
+        """
+        Disconnects from the server
+        """
+
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except ConnectionError:
+            pass
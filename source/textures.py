@@ -3,12 +3,10 @@ Texture manager
 """
 
 
-import os
-import json
-import glob
 import arcade
 import arcade.gl
 import numpy as np
+from source.blocks import *
 from source.options import *
 
 
@@ -17,91 +15,27 @@ class TextureManager:
     Manages textures
     """
 
-    def __init__(self):
-        self.ctx: arcade.context.ArcadeContext = arcade.get_window().ctx
-        self.texture_array: arcade.gl.TextureArray | None = None
-
-        self.texture_list: list[arcade.context.Texture2D] = []
-        self._named_mapping: dict[str, dict[str, int]] = {}
+    def __init__(self, ctx: arcade.gl.Context):
+        """
+        :param ctx: GL context to make textures in
+        """
 
-        self.block_texture_mapping: dict[int, dict[str, int | dict]] = {}
+        self.ctx: arcade.gl.Context = ctx
+        self.texture_array: arcade.gl.TextureArray | None = None
 
-        self.raw_texture_mapping: np.ndarray | None = None
+        # texture layer of every block face; storage buffer, written once
+        self.texture_mapping: arcade.gl.Buffer | None = None
 
     def load_textures(self):
         """
-        Loads textures
+        Loads textures from the block registry
         """
 
-        # create texture array
-        texture_size = 0
-        texture_amount = 0
-
-        # iterate through assets
-        configs = []
-        for file in glob.glob(TEXTURE_DIR + "/**/*", recursive=True):
-            # skip directories
-            if os.path.isdir(file):
-                continue
-
-            # make file and texture paths
-            filepath = file.replace("\\", "/")
-            texture_path = filepath[len(TEXTURE_DIR) + 1:].split("/")
-
-            # skip .json for now
-            if os.path.splitext(file)[1] == ".json":
-                configs.append(filepath)
-                continue
-
-            # if category doesn't exist -> make one
-            if texture_path[0] not in self._named_mapping:
-                self._named_mapping[texture_path[0]] = {}
-
-            # load image
-            texture = self.ctx.load_texture(filepath, filter=(self.ctx.NEAREST, self.ctx.NEAREST))
-
-            # append to texture list
-            self.texture_list.append(texture)
-
-            # use the index of list
-            self._named_mapping[texture_path[0]].update(
-                {os.path.splitext(texture_path[1])[0]: len(self.texture_list) - 1})
-
-            # count textures
-            texture_size = max(texture_size, texture.width)
-            texture_amount += 1
-
-        for config in configs:
-            with open(config, "r", encoding="ascii") as f:
-                config_data = json.load(f)
-            self.block_texture_mapping[config_data["id"]] = {
-                "id": config_data["id"],
-                "texture": config_data["texture"]}
-
-        # fill it with textures
-        texture_data = b''
-        for level, texture in enumerate(self.texture_list):
-            texture_data += texture.read()
-
-        # create texture array
+        # create texture array straight from the atlas layers
+        atlas = Blocks.atlas
         self.texture_array = self.ctx.texture_array(
-            (texture_size, texture_size, texture_amount),
+            (atlas.size, atlas.size, atlas.layers.shape[0]),
             filter=(self.ctx.NEAREST, self.ctx.NEAREST),
-            data=texture_data)
-
-    def generate_raw_texture_mapping(self):
-        """
-        Generates 'self.raw_texture_mapping' via
-        """
+            data=atlas.layers.data)
 
-        self.raw_texture_mapping = np.zeros(256 * 6, dtype=np.uint32)
-        for block_id, block_mapping in self.block_texture_mapping.items():
-            texture_mapping = list(map(
-                lambda x: self._named_mapping["blocks"][x], [
-                    block_mapping["texture"]["X+"],
-                    block_mapping["texture"]["X-"],
-                    block_mapping["texture"]["Y+"],
-                    block_mapping["texture"]["Y-"],
-                    block_mapping["texture"]["Z+"],
-                    block_mapping["texture"]["Z-"]]))
-            self.raw_texture_mapping[block_id * 6: block_id * 6 + 6] = texture_mapping
+        self.texture_mapping = self.ctx.buffer(data=np.ascontiguousarray(Blocks.faces, dtype="<u4"))
@@ -0,0 +1,343 @@
+"""
+Block ticks; growth, decay and falling blocks
+"""
+
+
+import time
+import heapq
+import numpy as np
+from source.blocks import *
+from source.chunks import *
+from source.options import *
+
+
+# positions are packed into single integers; X and Y are offset so that they are never negative
+KEY_OFFSET: int = 2 ** 26
+KEY_SHIFT_Y: int = 8
+KEY_SHIFT_X: int = 35
+
+# position and its 6 neighbours
+NEIGHBOURS = np.array([(0, 0, 0), (1, 0, 0), (-1, 0, 0), (0, 1, 0), (0, -1, 0), (0, 0, 1), (0, 0, -1)])
+
+
+class BlockTicker:
+    """
+    Block updates of the streamed world, run at a fixed tick rate independent of the frame rate.
+    Scheduled updates are kept in a heap ordered by their tick, in batches of packed positions. Pending positions
+    are kept in a set, so that neighbours of many changed blocks are updated only once. Every tick also updates
+    a few random blocks of every chunk within the window. The ticker is notified of every change of the window,
+    made by the player, by the rules or in any other way, and schedules updates of the changed blocks and their
+    neighbours. All the rules are applied to whole batches at once:
+    - grass block covered by an opaque block becomes dirt;
+    - dirt under a non opaque block next to a grass block becomes grass;
+    - leaves without logs within 'LEAVES_RANGE' blocks decay;
+    - falling blocks with air below move down
+    """
+
+    def __init__(self, regions, rate: int = TICK_RATE, budget: float = TICK_BUDGET, seed: int | None = None):
+        """
+        :param regions: streamed world to update
+        :param rate: ticks per second
+        :param budget: max seconds spent on scheduled updates per tick
+        :param seed: seed of random ticks
+        """
+
+        self.regions = regions
+        self.regions.window.ticker = self
+        self.rate: int = rate
+        self.budget: float = budget
+        self.random: np.random.Generator = np.random.default_rng(seed)
+
+        # current tick; time not yet ticked away
+        self.tick: int = 0
+        self.last_time: float = time.perf_counter()
+        self.lag: float = 0.0
+
+        # heap of tick, batch number and packed positions; pending positions
+        self.scheduled: list[tuple[int, int, np.ndarray]] = []
+        self.batches: int = 0
+        self.pending: set[int] = set()
+
+        # ticks until updates of changed blocks; rules set it while they change blocks
+        self.delay: int = 1
+
+        # block ids of the rules
+        named = Blocks.named
+        self.grass: int = named["grass_block"]
+        self.dirt: int = named["dirt_block"]
+        self.leaves: int = named["oak_leaves"]
+        self.logs: int = named["oak_logs"]
+        self.falling: np.ndarray = np.zeros(MAX_BLOCKS, dtype=np.bool_)
+        self.falling[[named[name] for name in FALLING_BLOCKS if name in named]] = True
+        self.opaque: np.ndarray = Blocks.solid & ~Blocks.transparent
+        self.reactive: set[int] = {self.grass, self.dirt, self.leaves, *np.flatnonzero(self.falling).tolist()}
+
+        # blocks the scheduled updates apply to
+        self.updated: np.ndarray = self.falling.copy()
+        self.updated[self.leaves] = True
+
+        # leaves look for logs within this box
+        span = np.arange(-LEAVES_RANGE, LEAVES_RANGE + 1)
+        self.leaves_box: np.ndarray = np.stack(np.meshgrid(span, span, span, indexing="ij"), axis=-1).reshape(-1, 3)
+
+        # counters of the last 'advance' call
+        self.ticked: int = 0
+        self.random_ticks: int = 0
+        self.processed_updates: int = 0
+        self.changed_blocks: int = 0
+        self.deferred_updates: int = 0
+
+    @staticmethod
+    def pack(coords: np.ndarray) -> np.ndarray:
+        """
+        Packs world positions into integers
+        :param coords: array of world block coordinates (N, 3)
+        :return: int64 array of N keys
+        """
+
+        return (
+            (coords[:, 0] + KEY_OFFSET) << KEY_SHIFT_X |
+            (coords[:, 1] + KEY_OFFSET) << KEY_SHIFT_Y |
+            coords[:, 2])
+
+    @staticmethod
+    def unpack(keys: np.ndarray) -> np.ndarray:
+        """
+        Unpacks integers made by 'pack'
+        :param keys: int64 array of N keys
+        :return: array of world block coordinates (N, 3)
+        """
+
+        return np.stack([
+            (keys >> KEY_SHIFT_X) - KEY_OFFSET,
+            ((keys >> KEY_SHIFT_Y) & (2 ** (KEY_SHIFT_X - KEY_SHIFT_Y) - 1)) - KEY_OFFSET,
+            keys & (2 ** KEY_SHIFT_Y - 1)], axis=1)
+
+    def schedule(self, coords: np.ndarray, delay: int = 1):
+        """
+        Schedules updates of the positions; positions that already wait for an update are skipped
+        :param coords: array of world block coordinates (N, 3)
+        :param delay: ticks until the update
+        """
+
+        coords = np.asarray(coords, dtype=np.int64).reshape(-1, 3)
+        coords = coords[(coords[:, 2] > -1) & (coords[:, 2] < WORLD_SIZE)]
+        keys = set(self.pack(coords).tolist()).difference(self.pending)
+        if not keys:
+            return
+        self.pending.update(keys)
+
+        # sorted positions are grouped by block columns, so updates of a batch touch few chunks
+        keys = np.sort(np.fromiter(keys, dtype=np.int64, count=len(keys)))
+        heapq.heappush(self.scheduled, (self.tick + delay, self.batches, keys))
+        self.batches += 1
+
+    def notify(self, coords: np.ndarray, delay: int = 1):
+        """
+        Schedules updates of changed blocks and their neighbours
+        :param coords: array of changed world block coordinates (N, 3)
+        :param delay: ticks until the update
+        """
+
+        coords = np.asarray(coords, dtype=np.int64).reshape(-1, 3)
+        self.schedule((coords[:, None, :] + NEIGHBOURS[None, :, :]).reshape(-1, 3), delay)
+
+    def to_world(self, coords: np.ndarray) -> np.ndarray:
+        """
+        Converts positions in the wrapped window layout to world positions
+        :param coords: array of window block coordinates (N, 3)
+        :return: array of world block coordinates (N, 3)
+        """
+
+        coords = np.array(coords, dtype=np.int64).reshape(-1, 3)
+        offset, origin = self.regions.offset, self.regions.origin
+        coords[:, :2] = (coords[:, :2] - offset[:2]) % WORLD_SIZE + origin
+        return coords
+
+    @staticmethod
+    def chunk_coords(chunk_index: int, indices: np.ndarray) -> np.ndarray:
+        """
+        Converts local block indices of a chunk to window positions
+        :param chunk_index: chunk index
+        :param indices: array of local block indices
+        :return: array of window block coordinates (N, 3)
+        """
+
+        chunk_y, chunk_x = divmod(chunk_index, WORLD_CHUNKS)
+        chunk_z, chunk_y = divmod(chunk_y, WORLD_CHUNKS)
+        indices = np.asarray(indices, dtype=np.int64)
+        return np.stack([
+            indices & CHUNK_MASK,
+            (indices >> CHUNK_BITS) & CHUNK_MASK,
+            indices >> (2 * CHUNK_BITS)], axis=1) + (chunk_x * CHUNK_SIZE, chunk_y * CHUNK_SIZE, chunk_z * CHUNK_SIZE)
+
+    def mark_block(self, position: tuple[int, int, int]):
+        """
+        Schedules updates around a changed block of the window
+        :param position: window block position
+        """
+
+        if self.regions.origin is not None:
+            self.notify(self.to_world(position), self.delay)
+
+    def mark_blocks(self, chunk_index: int, indices: np.ndarray):
+        """
+        Schedules updates around changed blocks of a window chunk
+        :param chunk_index: chunk index
+        :param indices: array of local block indices
+        """
+
+        if self.regions.origin is not None:
+            self.notify(self.to_world(self.chunk_coords(chunk_index, indices)), self.delay)
+
+    def mark_chunk(self, chunk_index: int):
+        """
+        Schedules updates of a window chunk changed as a whole. Instead of every block and its neighbours,
+        only the blocks the scheduled updates apply to are scheduled, within the reach of the rules around the chunk
+        :param chunk_index: chunk index
+        """
+
+        if self.regions.origin is None:
+            return
+
+        # box around the chunk; leaves see logs 'LEAVES_RANGE' blocks away, falling blocks see the block below
+        reach = max(LEAVES_RANGE, 1)
+        span = np.arange(-reach, CHUNK_SIZE + reach)
+        local = np.stack(np.meshgrid(span, span, span, indexing="ij"), axis=-1).reshape(-1, 3)
+        coords = self.to_world(self.chunk_coords(chunk_index, np.zeros(1, dtype=np.int64)) + local)
+        blocks = self.regions.get_many(coords)
+        self.schedule(coords[self.updated[np.maximum(blocks, 0)] & (blocks > -1)], self.delay)
+
+    def advance(self):
+        """
+        Runs the ticks due since the last call; at most 'TICK_CATCHUP' of them, the rest are dropped
+        """
+
+        now = time.perf_counter()
+        self.lag = min(self.lag + now - self.last_time, TICK_CATCHUP / self.rate)
+        self.last_time = now
+
+        self.ticked = self.random_ticks = self.processed_updates = self.changed_blocks = 0
+        while self.lag >= 1 / self.rate:
+            self.lag -= 1 / self.rate
+            self.step()
+            self.ticked += 1
+        self.deferred_updates = sum(
+            batch.size for tick, _, batch in self.scheduled if tick <= self.tick)
+
+    def step(self):
+        """
+        Runs a single tick; random ticks, then at least one batch of scheduled updates, and more of them
+        until the time budget runs out. Updates that don't fit in the budget are left for the next tick
+        """
+
+        start = time.perf_counter()
+        self.tick += 1
+        self.random_tick()
+
+        # at least one batch is applied every tick, so slow random ticks can't hold the scheduled updates back forever
+        processed = False
+        while self.scheduled and self.scheduled[0][0] <= self.tick:
+            if processed and time.perf_counter() - start > self.budget:
+                break
+            processed = True
+            tick, number, keys = heapq.heappop(self.scheduled)
+            if keys.size > TICK_BATCH:
+                heapq.heappush(self.scheduled, (tick, number, keys[TICK_BATCH:]))
+                keys = keys[:TICK_BATCH]
+            self.pending.difference_update(keys.tolist())
+            self.processed_updates += keys.size
+            self.update(self.unpack(keys))
+
+    def random_tick(self):
+        """
+        Updates random blocks of window chunks with blocks the rules apply to. Chunks take turns, so that every
+        chunk gets 'RANDOM_TICKS' random blocks updated once a second. Chunks of a single kind of block are skipped,
+        their blocks only touch other blocks at the chunk sides
+        """
+
+        chunks = self.regions.window.chunks
+        turn = self.tick % self.rate
+        chunk_indices = np.array([
+            chunk_index for chunk_index in range(turn, len(chunks), self.rate)
+            if isinstance(chunks[chunk_index], Chunk) and not self.reactive.isdisjoint(chunks[chunk_index].lookup)],
+            dtype=np.int64)
+        if chunk_indices.size == 0:
+            return
+
+        # random block of every chunk; from the wrapped window layout to world coordinates
+        local = self.random.integers(0, CHUNK_SIZE, [chunk_indices.size, RANDOM_TICKS, 3])
+        chunk_y, chunk_x = np.divmod(chunk_indices, WORLD_CHUNKS)
+        chunk_z, chunk_y = np.divmod(chunk_y, WORLD_CHUNKS)
+        coords = self.to_world(
+            (np.stack([chunk_x, chunk_y, chunk_z], axis=1)[:, None, :] * CHUNK_SIZE + local).reshape(-1, 3))
+
+        # blocks, blocks above them and random blocks around them are read at once; they are mostly in the same chunk
+        around = coords + self.random.integers(-1, 2, coords.shape)
+        blocks, above, neighbour = self.regions.get_many(
+            np.concatenate([coords, coords + (0, 0, 1), around])).reshape(3, -1)
+        covered = self.opaque[np.maximum(above, 0)]
+        self.random_ticks += coords.shape[0]
+
+        # grass spreads to a random block around it
+        grown = np.flatnonzero((blocks == self.dirt) & ~covered & (above > -1) & (neighbour == self.grass))
+
+        decayed = np.flatnonzero((blocks == self.grass) & covered)
+        fallen_leaves = self.decaying_leaves(coords[blocks == self.leaves])
+
+        self.apply(
+            np.concatenate([coords[grown], coords[decayed], fallen_leaves]),
+            np.concatenate([
+                np.full(grown.size, self.grass), np.full(decayed.size, self.dirt), np.zeros(len(fallen_leaves))]))
+
+    def decaying_leaves(self, coords: np.ndarray) -> np.ndarray:
+        """
+        Finds leaves without logs near them
+        :param coords: array of world coordinates of leaves (N, 3)
+        :return: array of world coordinates of decaying leaves
+        """
+
+        if coords.shape[0] == 0:
+            return coords
+        around = self.regions.get_many((coords[:, None, :] + self.leaves_box[None, :, :]).reshape(-1, 3))
+        around = around.reshape(coords.shape[0], -1)
+
+        # leaves near not loaded blocks are kept, their logs may be there
+        decaying = ~np.any(around == self.logs, axis=1) & ~np.any(around == -1, axis=1)
+        return coords[decaying]
+
+    def update(self, coords: np.ndarray):
+        """
+        Applies scheduled updates
+        :param coords: array of unique world block coordinates (N, 3)
+        """
+
+        blocks, below = self.regions.get_many(np.concatenate([coords, coords - (0, 0, 1)])).reshape(2, -1)
+
+        # falling blocks with air below move down
+        fall = np.flatnonzero(self.falling[np.maximum(blocks, 0)] & (below == 0) & (blocks > -1))
+        fallen_leaves = self.decaying_leaves(coords[blocks == self.leaves])
+
+        self.apply(
+            np.concatenate([coords[fall], coords[fall] - (0, 0, 1), fallen_leaves]),
+            np.concatenate([np.zeros(fall.size), blocks[fall], np.zeros(len(fallen_leaves))]),
+            delay=FALL_DELAY)
+
+    def apply(self, coords: np.ndarray, values: np.ndarray, delay: int = 1) -> int:
+        """
+        Sets blocks changed by the rules; the window notifies the ticker, which schedules updates of their neighbours
+        :param coords: array of world block coordinates (N, 3)
+        :param values: array of N block ids
+        :param delay: ticks until neighbour updates
+        :return: amount of changed blocks
+        """
+
+        if coords.shape[0] == 0:
+            return 0
+        self.delay = delay
+        try:
+            changed = self.regions.set_many(coords, values.astype(np.int64), undo=False)
+        finally:
+            self.delay = 1
+        self.changed_blocks += changed
+        return changed
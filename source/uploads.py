@@ -0,0 +1,107 @@
+"""
+Partial world buffer uploads
+"""
+
+
+import numpy as np
+from source.world import *
+from source.options import *
+
+
+class WorldUploader:
+    """
+    Keeps GPU copy of the world up to date by writing only modified parts of it.
+    Writes of the world and its lightmap share a per frame byte budget; whatever doesn't fit is written on later frames
+    """
+
+    def __init__(
+            self,
+            world: World,
+            buffer,
+            occupancy_buffer=None,
+            lightmap_buffer=None,
+            budget: int = WORLD_UPLOAD_BUDGET):
+        """
+        :param world: world to upload
+        :param buffer: buffer with the world in the chunk major layout; anything with 'write(data, offset)'
+        :param occupancy_buffer: buffer with packed occupancy pyramid of the world
+        :param lightmap_buffer: buffer with sun lightmap of the world, in the flat linear layout
+        :param budget: max amount of bytes written per frame
+        """
+
+        self.world: World = world
+        self.buffer = buffer
+        self.occupancy_buffer = occupancy_buffer
+        self.lightmap_buffer = lightmap_buffer
+        self.budget: int = budget
+
+        # ranges of the world and of the lightmap waiting for upload
+        self.pending: list[tuple[int, int]] = []
+        self.lightmap_pending: list[tuple[int, int]] = []
+
+        # counters
+        self.frame_bytes: int = 0
+        self.frame_writes: int = 0
+        self.total_bytes: int = 0
+
+    def upload(self) -> int:
+        """
+        Writes modified parts of the world to the buffer. Should be called once per frame.
+        :return: amount of bytes written
+        """
+
+        self.frame_bytes = 0
+        self.frame_writes = 0
+        self.pending, budget = self.write_ranges(
+            self.buffer, self.world.get_chunk_range, self.pending + self.world.pop_dirty_ranges(), self.budget)
+
+        # occupancy pyramid is small, so it is written as a whole
+        occupancy = self.world.occupancy
+        if self.occupancy_buffer is not None and occupancy is not None and occupancy.dirty:
+            data = occupancy.pack()
+            self.occupancy_buffer.write(data)
+            self.frame_bytes += data.nbytes
+            self.frame_writes += 1
+
+        # changed light gets the budget left by the world; whole sweeps after the window moves change most of it
+        lightmap = self.world.lightmap
+        if self.lightmap_buffer is not None and lightmap is not None:
+            lightmap.update()
+            ranges = self.lightmap_pending + lightmap.pop_changed_ranges()
+            self.lightmap_pending, budget = self.write_ranges(self.lightmap_buffer, lightmap.get_linear, ranges, budget)
+
+        self.total_bytes += self.frame_bytes
+        return self.frame_bytes
+
+    def write_ranges(self, buffer, get_linear, ranges: list[tuple[int, int]], budget: int) -> tuple[list, int]:
+        """
+        Writes ranges to a buffer until the budget runs out; the range that doesn't fit is split
+        :param buffer: buffer to write to
+        :param get_linear: gets the data of a range, like 'World.get_chunk_range'
+        :param ranges: list of start and end indices, in bytes; newly modified ranges and the ones left from
+                       previous frames
+        :param budget: max amount of bytes to write
+        :return: ranges left for later frames, and the budget left
+        """
+
+        if len(ranges) > 1:
+            starts, ends = np.array(ranges, dtype=np.int64).T
+            ranges = World.merge_ranges(starts, ends)
+
+        for range_index, (start, end) in enumerate(ranges):
+            if budget <= 0:
+                return ranges[range_index:], budget
+
+            # split the range when it doesn't fit into the budget
+            left = ranges[range_index + 1:]
+            if end - start > budget:
+                left = [(start + budget, end)] + left
+                end = start + budget
+
+            buffer.write(get_linear(start, end), offset=start)
+            budget -= end - start
+            self.frame_bytes += end - start
+            self.frame_writes += 1
+            if budget <= 0:
+                return left, budget
+        return [], budget
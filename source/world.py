@@ -3,26 +3,85 @@ World related operations
 """
 
 
+import os
+import math
 import random
 import numpy as np
-from scipy.ndimage import zoom
+from multiprocessing import shared_memory
+from concurrent.futures import Executor, ProcessPoolExecutor
 from source.blocks import *
+from source.chunks import *
+from source.noise import *
+from source.storage import *
+from source.occupancy import *
+from source.lightmap import *
+from source.meshing import *
+from source.heightmap import *
+from source.snapshots import *
+from source.changes import *
 from source.options import *
 from source.exceptions import *
 
 
+# shared memory used by the generation worker processes
+WORKER_MEMORY = None
+
+
 class World:
     """
-    Container for large amount of cubes
+    Container for large amount of cubes.
+    Cubes are stored in chunks of 'CHUNK_SIZE'; single block chunks are stored as a plain block id,
+    chunks that weren't yet read from the save file are None
     """
 
     def __init__(self):
-        self.voxels: np.ndarray = np.zeros(WORLD_SIZE ** 3, dtype=np.uint8)
+        self.chunks: list[int | Chunk | None] = [0] * WORLD_CHUNKS ** 3
+
+        # save file the not loaded chunks are read from
+        self.source: SaveFile | None = None
+
+        # indices of chunks modified since last 'pop_dirty_ranges' call
+        self.dirty_chunks: set[int] = set()
+
+        # indices of chunks shared with snapshots; they are copied before being changed in place
+        self.shared: set[int] = set()
+
+        # coarse occupancy grids, made by 'build_occupancy'
+        self.occupancy: OccupancyPyramid | None = None
+
+        # sun visibility of every block, made by 'build_lightmap'
+        self.lightmap: SunLightmap | None = None
+
+        # quads of visible block faces, made by 'build_mesh'
+        self.mesh: WorldMesh | None = None
+
+        # column heights and the box around solid blocks, made by 'build_heightmap'
+        self.heightmap: HeightMap | None = None
+
+        # changes not yet sent to remote viewers, made by 'build_changes'
+        self.changes: ChangeLog | None = None
+
+        # block ticker scheduling updates around changed blocks, set by 'BlockTicker' of the streamed window
+        self.ticker = None
 
         self.sun: tuple[float, float, float] = (1, 2, -3)
         length = (self.sun[0]**2 + self.sun[1]**2 + self.sun[2]**2) ** 0.5
         self.sun = (self.sun[0] / length, self.sun[1] / length, self.sun[2] / length)
 
+    @staticmethod
+    def locate(position: tuple[int, int, int]) -> tuple[int, int]:
+        """
+        Converts block position to chunk index and local block index within that chunk.
+        :param position: block position
+        :return: chunk index, local index
+        """
+
+        return (
+            ((position[2] >> CHUNK_BITS) * WORLD_CHUNKS + (position[1] >> CHUNK_BITS)) * WORLD_CHUNKS
+            + (position[0] >> CHUNK_BITS),
+            ((position[2] & CHUNK_MASK) * CHUNK_SIZE + (position[1] & CHUNK_MASK)) * CHUNK_SIZE
+            + (position[0] & CHUNK_MASK))
+
     def set_unsafe(self, position: tuple[int, int, int], value: int) -> None:
         """
         Sets block at given XYZ to given value.
@@ -31,7 +90,31 @@ class World:
         :param value: id to set
         """
 
-        self.voxels[position[2] * WORLD_LAYER + position[1] * WORLD_SIZE + position[0]] = value
+        chunk_index, index = self.locate(position)
+        chunk = self.chunks[chunk_index]
+        if chunk is None:
+            chunk = self.load_chunk(chunk_index)
+        if isinstance(chunk, int):
+            if chunk != value:
+                self.chunks[chunk_index] = Chunk.split(chunk, index, value)
+        else:
+            if chunk_index in self.shared:
+                self.shared.discard(chunk_index)
+                chunk = self.chunks[chunk_index] = chunk.copy()
+            chunk.set(index, value)
+        self.dirty_chunks.add(chunk_index)
+        if self.changes is not None:
+            self.changes.record_block(chunk_index, index, value)
+        if self.occupancy is not None:
+            self.occupancy.update(position, value)
+        if self.heightmap is not None:
+            self.heightmap.update_block(position, value)
+        if self.lightmap is not None:
+            self.lightmap.mark_chunk(chunk_index)
+        if self.mesh is not None:
+            self.mesh.mark_chunk(chunk_index)
+        if self.ticker is not None:
+            self.ticker.mark_block(position)
 
     def set(self, position: tuple[int, int, int], value: int | str) -> bool:
         """
@@ -47,11 +130,10 @@ class World:
                 return False
 
         if (-1 < position[0] < WORLD_SIZE) and (-1 < position[1] < WORLD_SIZE) and (-1 < position[2] < WORLD_SIZE):
-            self.voxels[position[2] * WORLD_LAYER + position[1] * WORLD_SIZE + position[0]] = value
+            self.set_unsafe(position, value)
             return True
         return False
 
-    # noinspection PyTypeChecker
     def get_unsafe(self, position: tuple[int, int, int]) -> int:
         """
         Gets block at given XYZ to given value.
@@ -59,9 +141,14 @@ class World:
         :param position: block position
         """
 
-        return self.voxels[position[2] * WORLD_LAYER + position[1] * WORLD_SIZE + position[0]]
+        chunk_index, index = self.locate(position)
+        chunk = self.chunks[chunk_index]
+        if chunk is None:
+            chunk = self.load_chunk(chunk_index)
+        if isinstance(chunk, int):
+            return chunk
+        return chunk.get(index)
 
-    # noinspection PyTypeChecker
     def get(self, position: tuple[int, int, int]) -> int:
         """
         Gets block at given XYZ to given value
@@ -70,28 +157,662 @@ class World:
         """
 
         if (-1 < position[0] < WORLD_SIZE) and (-1 < position[1] < WORLD_SIZE) and (-1 < position[2] < WORLD_SIZE):
-            return self.voxels[position[2] * WORLD_LAYER + position[1] * WORLD_SIZE + position[0]]
+            return self.get_unsafe(position)
         return -1
 
-    def save(self, filename: str):
+    @staticmethod
+    def resolve(value: int | str) -> int | None:
+        """
+        Converts block name to block id.
+        :param value: block id or name
+        :return: block id, None when there is no block with such name
+        """
+
+        if isinstance(value, str):
+            return Blocks.named.get(value)
+        return value
+
+    @staticmethod
+    def locate_many(coords: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Vectorized 'locate'.
+        :param coords: array of XYZ block positions with shape (N, 3)
+        :return: array of chunk indices, array of local indices
+        """
+
+        chunk_indices = (
+            ((coords[:, 2] >> CHUNK_BITS) * WORLD_CHUNKS + (coords[:, 1] >> CHUNK_BITS)) * WORLD_CHUNKS
+            + (coords[:, 0] >> CHUNK_BITS))
+        indices = (
+            ((coords[:, 2] & CHUNK_MASK) * CHUNK_SIZE + (coords[:, 1] & CHUNK_MASK)) * CHUNK_SIZE
+            + (coords[:, 0] & CHUNK_MASK))
+        return chunk_indices, indices
+
+    @staticmethod
+    def clip_box(
+            minimum: tuple[int, int, int],
+            maximum: tuple[int, int, int]) -> tuple[np.ndarray, np.ndarray] | None:
+        """
+        Clips box to world bounds.
+        :param minimum: min box corner
+        :param maximum: max box corner, exclusive
+        :return: clipped corners, None when box is outside the world or empty
+        """
+
+        minimum = np.clip(np.asarray(minimum, dtype=np.int64), 0, WORLD_SIZE)
+        maximum = np.clip(np.asarray(maximum, dtype=np.int64), 0, WORLD_SIZE)
+        if np.any(maximum <= minimum):
+            return None
+        return minimum, maximum
+
+    def get_chunk(self, chunk_index: int) -> int | Chunk:
+        """
+        Gets chunk, loading it from the save file when needed.
+        :param chunk_index: chunk index
+        :return: block id for single block chunk, chunk otherwise
+        """
+
+        chunk = self.chunks[chunk_index]
+        if chunk is None:
+            chunk = self.load_chunk(chunk_index)
+        return chunk
+
+    def get_chunk_array(self, chunk_index: int) -> np.ndarray:
+        """
+        Unpacks a chunk.
+        :param chunk_index: chunk index
+        :return: array of block ids with shape (CHUNK_SIZE, CHUNK_SIZE, CHUNK_SIZE) in ZYX order
+        """
+
+        chunk = self.get_chunk(chunk_index)
+        if isinstance(chunk, int):
+            return np.full([CHUNK_SIZE, CHUNK_SIZE, CHUNK_SIZE], chunk, dtype=np.uint8)
+        return chunk.to_array().reshape(CHUNK_SIZE, CHUNK_SIZE, CHUNK_SIZE)
+
+    def set_chunk_array(
+            self,
+            chunk_index: int,
+            voxels: np.ndarray,
+            changed: tuple[np.ndarray, np.ndarray] | None = None) -> None:
+        """
+        Packs and replaces a chunk.
+        :param chunk_index: chunk index
+        :param voxels: array of 'CHUNK_VOLUME' block ids in local ZYX order
+        :param changed: local indices and new ids of the changed blocks, when only a few blocks changed
+        """
+
+        self.chunks[chunk_index] = Chunk.from_array(voxels.reshape(-1))
+        self.mark_dirty(chunk_index, voxels, changed)
+
+    def mark_dirty(
+            self,
+            chunk_index: int,
+            voxels: np.ndarray | None = None,
+            changed: tuple[np.ndarray, np.ndarray] | None = None) -> None:
+        """
+        Marks the chunk as modified, updating everything that depends on it.
+        :param chunk_index: chunk index
+        :param voxels: new blocks of the chunk when they are already unpacked, in local ZYX order
+        :param changed: local indices and new ids of the changed blocks, when only a few blocks changed
+        """
+
+        self.dirty_chunks.add(chunk_index)
+        if self.changes is not None:
+            if changed is None:
+                self.changes.record_chunk(chunk_index)
+            else:
+                self.changes.record_blocks(chunk_index, *changed)
+        if self.occupancy is not None:
+            chunk_y, chunk_x = divmod(chunk_index, WORLD_CHUNKS)
+            chunk_z, chunk_y = divmod(chunk_y, WORLD_CHUNKS)
+            minimum = (chunk_x * CHUNK_SIZE, chunk_y * CHUNK_SIZE, chunk_z * CHUNK_SIZE)
+            self.occupancy.update_box(
+                minimum, tuple(axis + CHUNK_SIZE for axis in minimum),
+                None if voxels is None else voxels.reshape(CHUNK_SIZE, CHUNK_SIZE, CHUNK_SIZE))
+        if self.heightmap is not None:
+            self.heightmap.mark_chunk(chunk_index)
+        if self.lightmap is not None:
+            self.lightmap.mark_chunk(chunk_index)
+        if self.mesh is not None:
+            self.mesh.mark_chunk(chunk_index)
+        if self.ticker is not None:
+            if changed is None:
+                self.ticker.mark_chunk(chunk_index)
+            else:
+                self.ticker.mark_blocks(chunk_index, changed[0])
+
+    def build_occupancy(self) -> OccupancyPyramid:
+        """
+        Builds occupancy pyramid, which is then kept up to date on every change.
+        :return: occupancy pyramid
+        """
+
+        self.occupancy = OccupancyPyramid(self)
+        return self.occupancy
+
+    def build_lightmap(
+            self,
+            offset: tuple[int, int, int] = (0, 0, 0),
+            executor: Executor | None = None) -> SunLightmap:
+        """
+        Builds sun lightmap. Changed chunks are remembered, and swept again by 'SunLightmap.update'.
+        :param offset: offset of the world origin, when the world is a wrapped window
+        :param executor: executor later whole sweeps run on
+        :return: sun lightmap
+        """
+
+        self.lightmap = SunLightmap(self, self.sun, offset, executor)
+        return self.lightmap
+
+    def build_mesh(self, offset: tuple[int, int, int] = (0, 0, 0)) -> WorldMesh:
+        """
+        Makes world mesh. All chunks are meshed by the first 'WorldMesh.update' call, later only the changed ones.
+        :param offset: offset of the world origin, when the world is a wrapped window
+        :return: world mesh
+        """
+
+        self.mesh = WorldMesh(self, offset)
+        return self.mesh
+
+    def build_changes(self) -> ChangeLog:
+        """
+        Starts logging changes, which are then taken out of the log by its 'flush' calls.
+        :return: change log
+        """
+
+        self.changes = ChangeLog()
+        return self.changes
+
+    def build_heightmap(self, offset: tuple[int, int, int] = (0, 0, 0)) -> HeightMap:
+        """
+        Builds heightmap, which is then kept up to date on every change.
+        :param offset: offset of the world origin, when the world is a wrapped window
+        :return: heightmap
+        """
+
+        self.heightmap = HeightMap(self, offset)
+        return self.heightmap
+
+    def chunk_boxes(self, minimum: np.ndarray, maximum: np.ndarray):
+        """
+        Iterates over chunks that intersect the box.
+        :param minimum: min box corner, must be inside the world
+        :param maximum: max box corner, exclusive
+        :return: generator of chunk index and ZYX slices of the box part within that chunk;
+                 slices are None when the chunk is fully inside the box
+        """
+
+        low = minimum >> CHUNK_BITS
+        high = (maximum - 1) >> CHUNK_BITS
+        for chunk_z in range(low[2], high[2] + 1):
+            for chunk_y in range(low[1], high[1] + 1):
+                for chunk_x in range(low[0], high[0] + 1):
+                    origin = np.array([chunk_x, chunk_y, chunk_z]) * CHUNK_SIZE
+                    start = np.maximum(minimum - origin, 0)
+                    end = np.minimum(maximum - origin, CHUNK_SIZE)
+                    chunk_index = (chunk_z * WORLD_CHUNKS + chunk_y) * WORLD_CHUNKS + chunk_x
+                    if np.all(start == 0) and np.all(end == CHUNK_SIZE):
+                        yield chunk_index, None
+                    else:
+                        yield chunk_index, (
+                            slice(start[2], end[2]), slice(start[1], end[1]), slice(start[0], end[0]))
+
+    def set_many(self, coords: np.ndarray, values: np.ndarray | int | str) -> int:
+        """
+        Sets blocks at given positions. Out of bounds positions are skipped, for repeated positions the last
+        value is used.
+        :param coords: array of XYZ block positions with shape (N, 3)
+        :param values: block id or name, or array of N block ids or names
+        :return: amount of blocks that were changed
+        """
+
+        coords = np.asarray(coords, dtype=np.int64).reshape(-1, 3)
+        values = np.broadcast_to(np.asarray(values), coords.shape[:1])
+
+        # resolve names once per name
+        if values.dtype.kind in "US":
+            names, inverse = np.unique(values, return_inverse=True)
+            ids = np.array([Blocks.named.get(name, -1) for name in names.tolist()], dtype=np.int64)
+            values = ids[inverse]
+        else:
+            values = values.astype(np.int64)
+
+        inbound = np.all((coords > -1) & (coords < WORLD_SIZE), axis=1) & (values > -1)
+        chunk_indices, indices = self.locate_many(coords[inbound])
+        values = values[inbound]
+
+        # group by chunk; stable sort keeps the order of positions inside each chunk
+        order = np.argsort(chunk_indices, kind="stable")
+        chunk_indices, indices, values = chunk_indices[order], indices[order], values[order]
+        starts = np.flatnonzero(np.diff(chunk_indices, prepend=-1))
+        ends = np.append(starts[1:], chunk_indices.size)
+
+        changed = 0
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            chunk_index = int(chunk_indices[start])
+            voxels = self.get_chunk_array(chunk_index).reshape(-1)
+
+            # keep only the last value for each position
+            _, last = np.unique(indices[start:end][::-1], return_index=True)
+            chunk_positions = indices[start:end][::-1][last]
+            chunk_values = values[start:end][::-1][last]
+
+            different = voxels[chunk_positions] != chunk_values
+            difference = np.count_nonzero(different)
+            if difference:
+                voxels[chunk_positions] = chunk_values
+                self.set_chunk_array(
+                    chunk_index, voxels, (chunk_positions[different], chunk_values[different]))
+                changed += difference
+        return changed
+
+    def get_many(self, coords: np.ndarray) -> np.ndarray:
+        """
+        Gets blocks at given positions.
+        :param coords: array of XYZ block positions with shape (N, 3)
+        :return: array of N block ids; -1 for out of bounds positions
+        """
+
+        coords = np.asarray(coords, dtype=np.int64).reshape(-1, 3)
+        result = np.full(coords.shape[0], -1, dtype=np.int16)
+
+        inbound = np.flatnonzero(np.all((coords > -1) & (coords < WORLD_SIZE), axis=1))
+        chunk_indices, indices = self.locate_many(coords[inbound])
+
+        order = np.argsort(chunk_indices, kind="stable")
+        chunk_indices, indices, inbound = chunk_indices[order], indices[order], inbound[order]
+        starts = np.flatnonzero(np.diff(chunk_indices, prepend=-1))
+        ends = np.append(starts[1:], chunk_indices.size)
+
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            chunk = self.get_chunk(int(chunk_indices[start]))
+            if isinstance(chunk, int):
+                result[inbound[start:end]] = chunk
+            else:
+                result[inbound[start:end]] = chunk.get_many(indices[start:end])
+        return result
+
+    def fill_box(
+            self,
+            minimum: tuple[int, int, int],
+            maximum: tuple[int, int, int],
+            value: int | str) -> int:
+        """
+        Fills the box with given block. Box is clipped to world bounds.
+        :param minimum: min box corner
+        :param maximum: max box corner, exclusive
+        :param value: block id or name
+        :return: amount of blocks that were changed
+        """
+
+        value = self.resolve(value)
+        box = self.clip_box(minimum, maximum)
+        if value is None or box is None:
+            return 0
+
+        changed = 0
+        for chunk_index, region in self.chunk_boxes(*box):
+            chunk = self.get_chunk(chunk_index)
+            if isinstance(chunk, int) and chunk == value:
+                continue
+
+            voxels = self.get_chunk_array(chunk_index)
+            if region is None:
+                changed += np.count_nonzero(voxels != value)
+                self.chunks[chunk_index] = value
+                self.mark_dirty(chunk_index)
+            else:
+                difference = np.count_nonzero(voxels[region] != value)
+                if difference:
+                    voxels[region] = value
+                    self.set_chunk_array(chunk_index, voxels)
+                    changed += difference
+        return changed
+
+    def replace(
+            self,
+            old: int | str,
+            new: int | str,
+            region: tuple[tuple[int, int, int], tuple[int, int, int]] | None = None) -> int:
+        """
+        Replaces all blocks of one type with another.
+        :param old: block id or name to replace
+        :param new: block id or name to replace with
+        :param region: min and max (exclusive) box corners to replace within; whole world when None
+        :return: amount of blocks that were changed
+        """
+
+        old = self.resolve(old)
+        new = self.resolve(new)
+        box = self.clip_box(*region) if region is not None else self.clip_box((0, 0, 0), (WORLD_SIZE,) * 3)
+        if old is None or new is None or box is None or old == new:
+            return 0
+
+        changed = 0
+        for chunk_index, region in self.chunk_boxes(*box):
+            chunk = self.get_chunk(chunk_index)
+
+            # skip chunks without the block
+            if isinstance(chunk, int):
+                if chunk != old:
+                    continue
+                if region is None:
+                    self.chunks[chunk_index] = new
+                    self.mark_dirty(chunk_index)
+                    changed += CHUNK_VOLUME
+                    continue
+            elif old not in chunk.lookup:
+                continue
+
+            voxels = self.get_chunk_array(chunk_index)
+            part = voxels if region is None else voxels[region]
+            mask = part == old
+            difference = np.count_nonzero(mask)
+            if difference:
+                part[mask] = new
+                self.set_chunk_array(chunk_index, voxels)
+                changed += difference
+        return changed
+
+    def get_box(self, minimum: tuple[int, int, int], maximum: tuple[int, int, int]) -> np.ndarray:
+        """
+        Gets blocks within the box.
+        :param minimum: min box corner, must be inside the world
+        :param maximum: max box corner, exclusive, must be inside the world
+        :return: array of block ids in ZYX order
+        """
+
+        minimum = np.asarray(minimum, dtype=np.int64)
+        maximum = np.asarray(maximum, dtype=np.int64)
+        size = maximum - minimum
+        voxels = np.empty([size[2], size[1], size[0]], dtype=np.uint8)
+        for chunk_index, region in self.chunk_boxes(minimum, maximum):
+            chunk_y, chunk_x = divmod(chunk_index, WORLD_CHUNKS)
+            chunk_z, chunk_y = divmod(chunk_y, WORLD_CHUNKS)
+            offset = np.array([chunk_x, chunk_y, chunk_z]) * CHUNK_SIZE - minimum
+            if region is None:
+                region = (slice(0, CHUNK_SIZE),) * 3
+            target = tuple(
+                slice(part.start + offset[axis], part.stop + offset[axis])
+                for part, axis in zip(region, (2, 1, 0)))
+
+            chunk = self.get_chunk(chunk_index)
+            if isinstance(chunk, int):
+                voxels[target] = chunk
+            else:
+                voxels[target] = chunk.to_array().reshape(CHUNK_SIZE, CHUNK_SIZE, CHUNK_SIZE)[region]
+        return voxels
+
+    def get_chunk_major(self) -> np.ndarray:
+        """
+        Unpacks the world into the chunk major layout of the GPU buffer: chunks one after another in chunk index
+        order, blocks of every chunk in local ZYX order. Index is 'chunk_index * CHUNK_VOLUME + local index'.
+        :return: flat array of 'WORLD_SIZE ** 3' block ids
+        """
+
+        return self.get_chunk_range(0, WORLD_SIZE ** 3)
+
+    def get_chunk_range(self, start: int, end: int) -> np.ndarray:
+        """
+        Gets part of the world in the chunk major layout, same as 'get_chunk_major()[start:end]'.
+        :param start: start index
+        :param end: end index, exclusive
+        :return: flat array of block ids
+        """
+
+        first, last = start // CHUNK_VOLUME, (end - 1) // CHUNK_VOLUME + 1
+        voxels = np.empty([last - first, CHUNK_VOLUME], dtype=np.uint8)
+        for row, chunk_index in enumerate(range(first, last)):
+            chunk = self.get_chunk(chunk_index)
+            voxels[row] = chunk if isinstance(chunk, int) else chunk.to_array()
+        return voxels.reshape(-1)[start - first * CHUNK_VOLUME:end - first * CHUNK_VOLUME]
+
+    def pop_dirty_ranges(self) -> list[tuple[int, int]]:
+        """
+        Converts modified chunks to index ranges in the chunk major layout and resets them.
+        Every chunk is one range of 'CHUNK_VOLUME' blocks; ranges of chunks following each other are merged.
+        :return: sorted list of non overlapping (start, end) ranges, end is exclusive
+        """
+
+        if not self.dirty_chunks:
+            return []
+
+        starts = np.fromiter(self.dirty_chunks, dtype=np.int64, count=len(self.dirty_chunks)) * CHUNK_VOLUME
+        self.dirty_chunks.clear()
+        return World.merge_ranges(starts, starts + CHUNK_VOLUME)
+
+    @staticmethod
+    def merge_ranges(starts: np.ndarray, ends: np.ndarray) -> list[tuple[int, int]]:
+        """
+        Merges overlapping and adjacent ranges.
+        :param starts: array of range starts
+        :param ends: array of range ends, exclusive
+        :return: sorted list of merged (start, end) ranges
+        """
+
+        if starts.size == 0:
+            return []
+        order = np.argsort(starts, kind="stable")
+        starts, ends = starts[order], np.maximum.accumulate(ends[order])
+
+        # new range begins where start is past every previous end
+        breaks = np.flatnonzero(starts[1:] > ends[:-1]) + 1
+        first = np.concatenate([[0], breaks])
+        last = np.concatenate([breaks - 1, [starts.size - 1]])
+        return list(zip(starts[first].tolist(), ends[last].tolist()))
+
+    def get_voxels(self) -> np.ndarray:
+        """
+        Unpacks the world into the flat linear layout used by the shader, index is 'z * WORLD_LAYER + y * WORLD_SIZE + x'.
+        :return: flat array of 'WORLD_SIZE ** 3' block ids
+        """
+
+        voxels = np.empty(
+            [WORLD_CHUNKS, CHUNK_SIZE, WORLD_CHUNKS, CHUNK_SIZE, WORLD_CHUNKS, CHUNK_SIZE], dtype=np.uint8)
+        for chunk_index, chunk in enumerate(self.chunks):
+            chunk_y, chunk_x = divmod(chunk_index, WORLD_CHUNKS)
+            chunk_z, chunk_y = divmod(chunk_y, WORLD_CHUNKS)
+            if chunk is None:
+                chunk = self.load_chunk(chunk_index)
+            if isinstance(chunk, int):
+                voxels[chunk_z, :, chunk_y, :, chunk_x, :] = chunk
+            else:
+                voxels[chunk_z, :, chunk_y, :, chunk_x, :] = chunk.to_array().reshape(
+                    CHUNK_SIZE, CHUNK_SIZE, CHUNK_SIZE)
+        return voxels.reshape(-1)
+
+    def set_voxels(self, voxels: np.ndarray) -> None:
+        """
+        Replaces the whole world with given blocks.
+        :param voxels: flat array of 'WORLD_SIZE ** 3' block ids in the same layout as 'get_voxels'
+        """
+
+        if voxels.shape != (WORLD_SIZE**3,):
+            raise WorldGenSizeError("Incorrect world size")
+
+        # reorder to one row per chunk
+        chunks = voxels.astype(np.uint8, copy=False).reshape(
+            WORLD_CHUNKS, CHUNK_SIZE, WORLD_CHUNKS, CHUNK_SIZE, WORLD_CHUNKS, CHUNK_SIZE
+        ).transpose(0, 2, 4, 1, 3, 5).reshape(WORLD_CHUNKS ** 3, CHUNK_VOLUME)
+
+        # single block chunks are found for all chunks at once
+        lowest = chunks.min(axis=1)
+        uniform = lowest == chunks.max(axis=1)
+        self.close_source()
+        self.chunks = lowest.tolist()
+        for chunk_index in np.flatnonzero(~uniform).tolist():
+            self.chunks[chunk_index] = Chunk.from_array(chunks[chunk_index])
+
+        # everything depending on the blocks is updated once all chunks are in place
+        self.dirty_chunks.update(range(WORLD_CHUNKS ** 3))
+        if self.occupancy is not None:
+            self.occupancy.build()
+        if self.heightmap is not None:
+            self.heightmap.pending_chunks.update(range(WORLD_CHUNKS ** 2))
+        if self.changes is not None:
+            for chunk_index in range(WORLD_CHUNKS ** 3):
+                self.changes.record_chunk(chunk_index)
+        if self.lightmap is not None:
+            self.lightmap.pending.update(range(WORLD_CHUNKS ** 3))
+        if self.mesh is not None:
+            self.mesh.pending.update(range(WORLD_CHUNKS ** 3))
+
+    def compact(self) -> None:
+        """
+        Repacks all chunks, dropping unused palette entries
+        """
+
+        for chunk_index, chunk in enumerate(self.chunks):
+            if isinstance(chunk, Chunk):
+                self.chunks[chunk_index] = chunk.compact()
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Approximate amount of memory used by block data
+        """
+
+        return sum(chunk.nbytes if isinstance(chunk, Chunk) else 8 for chunk in self.chunks)
+
+    def load_chunk(self, chunk_index: int) -> int | Chunk:
+        """
+        Reads not yet loaded chunk from the save file.
+        :param chunk_index: chunk index
+        :return: loaded chunk
+        """
+
+        chunk = self.source.read_chunk(chunk_index)
+        self.chunks[chunk_index] = chunk
+        return chunk
+
+    def load_chunks(self) -> None:
+        """
+        Reads all not yet loaded chunks and closes the save file
+        """
+
+        if self.source is None:
+            return
+        for chunk_index, chunk in enumerate(self.chunks):
+            if chunk is None:
+                self.load_chunk(chunk_index)
+        self.close_source()
+
+    def close_source(self) -> None:
+        """
+        Closes the save file; not loaded chunks are lost
+        """
+
+        if self.source is not None:
+            self.source.close()
+            self.source = None
+
+    def snapshot(self) -> WorldSnapshot:
+        """
+        Freezes the current state of the world. Block data isn't copied; chunks are shared with the snapshot
+        until they are changed. Not loaded chunks are read from the save file first.
+        :return: snapshot
+        """
+
+        self.load_chunks()
+        self.shared = {chunk_index for chunk_index, chunk in enumerate(self.chunks) if isinstance(chunk, Chunk)}
+        return WorldSnapshot(list(self.chunks))
+
+    def restore(self, snapshot: WorldSnapshot) -> list[int]:
+        """
+        Brings the world back to the state of the snapshot. Only the chunks that differ are replaced.
+        :param snapshot: snapshot of this world
+        :return: indices of replaced chunks
+        """
+
+        changed = snapshot.changed(self.chunks)
+        for chunk_index in changed:
+            chunk = snapshot.chunks[chunk_index]
+            self.chunks[chunk_index] = chunk
+            self.mark_dirty(chunk_index)
+            if isinstance(chunk, Chunk):
+                self.shared.add(chunk_index)
+        return changed
+
+    def save(self, filename: str, codec: int = CODEC_ZLIB):
         """
         Saves the world to file with given name.
+        Chunks that weren't loaded are copied from the old save without decompression.
         :param filename: name of the file
+        :param codec: chunk compression codec
         """
 
-        np.save(filename, self.voxels)
+        write_save(filename, self.chunks, self.source, codec)
+
+        # file the chunks were read from was replaced by the new save
+        if self.source is not None and self.source.mmap.closed:
+            self.source = SaveFile(filename) if None in self.chunks else None
 
     def load(self, filename: str) -> None:
         """
         Loads the world from a file with given name.
+        Chunks are decompressed when they are first accessed. Old numpy saves are read as a whole.
         :param filename: name of the file
         """
 
-        self.voxels = np.load(filename)
+        if is_legacy_save(filename):
+            self.set_voxels(load_legacy(filename))
+            return
+
+        source = SaveFile(filename)
+        self.close_source()
+        self.chunks = [None] * WORLD_CHUNKS ** 3
+        self.source = source
+        self.dirty_chunks.update(range(WORLD_CHUNKS ** 3))
+        if self.occupancy is not None:
+            self.occupancy.build()
+        if self.heightmap is not None:
+            self.heightmap.pending_chunks.update(range(WORLD_CHUNKS ** 2))
+        if self.changes is not None:
+            for chunk_index in range(WORLD_CHUNKS ** 3):
+                self.changes.record_chunk(chunk_index)
+        if self.lightmap is not None:
+            self.lightmap.pending.update(range(WORLD_CHUNKS ** 3))
+        if self.mesh is not None:
+            self.mesh.pending.update(range(WORLD_CHUNKS ** 3))
 
-        # Check correct world size
-        if self.voxels.shape != (WORLD_SIZE**3,):
-            raise WorldGenSizeError("Incorrect world size")
+
+class VoxelLookup:
+    """
+    Fast vectorized block lookups for many repeated queries, such as ray casting.
+    Mixed chunks are unpacked once, when first touched; lookups must not be mixed with world changes
+    """
+
+    def __init__(self, world: World):
+        self.world: World = world
+
+        # block id of single block chunks, -1 for the rest
+        self.values: np.ndarray = np.array(
+            [chunk if isinstance(chunk, int) else -1 for chunk in world.chunks], dtype=np.int16)
+
+        # unpacked chunks; slot -1 means the chunk wasn't unpacked yet
+        self.slots: np.ndarray = np.full(len(world.chunks), -1, dtype=np.int64)
+        self.unpacked: np.ndarray = np.empty([np.count_nonzero(self.values < 0), CHUNK_VOLUME], dtype=np.uint8)
+        self.used: int = 0
+
+    def get(self, coords: np.ndarray) -> np.ndarray:
+        """
+        Gets blocks at given positions.
+        :param coords: array of XYZ block positions with shape (N, 3), must be inside the world
+        :return: array of N block ids
+        """
+
+        chunk_indices, indices = World.locate_many(coords)
+        result = self.values[chunk_indices]
+
+        mixed = result < 0
+        if np.any(mixed):
+            # unpack chunks seen for the first time
+            for chunk_index in np.unique(chunk_indices[mixed][self.slots[chunk_indices[mixed]] < 0]).tolist():
+                self.unpacked[self.used] = self.world.get_chunk_array(chunk_index).reshape(-1)
+                self.slots[chunk_index] = self.used
+                self.used += 1
+            result[mixed] = self.unpacked[self.slots[chunk_indices[mixed]], indices[mixed]]
+        return result
 
 
 class WorldGen:
@@ -107,11 +828,11 @@ class WorldGen:
         :return: generated world
         """
 
+        voxels = np.zeros([WORLD_SIZE, WORLD_LAYER], dtype=np.uint8)
+        voxels[:level] = 1
+
         world = World()
-        for y in range(WORLD_SIZE):
-            for x in range(WORLD_SIZE):
-                for z in range(level):
-                    world.set_unsafe((x, y, z), 1)
+        world.set_voxels(voxels.reshape(-1))
         return world
 
     @staticmethod
@@ -124,49 +845,278 @@ class WorldGen:
 
         world = World()
         voxels = np.random.random(WORLD_SIZE ** 3)
-        world.voxels = (np.vectorize(lambda x: x < infill)(voxels)).astype(np.uint8)
+        world.set_voxels((voxels < infill).astype(np.uint8))
         return world
 
     @staticmethod
-    def generate_landscape(level: int, magnitude: float) -> World:
+    def generate_landscape(level: int, magnitude: float, seed: int | None = None, processes: int | None = None) -> World:
         """
         Generates simple landscape
         :param level: sea level
         :param magnitude: magnitude
+        :param seed: random seed; same seed results in the same world
+        :param processes: amount of processes to generate with; defaults to the amount of CPUs
         :return: generated world
         """
 
-        print("Generating height map...")
-        octets = [
-            (2, 0.05),
-            (4, 0.05),
-            (8, 0.2),
-            (16, 0.2),
-            (32, 0.5)]
-        height_map = np.zeros([WORLD_SIZE, WORLD_SIZE], dtype=np.float64)
-        for octet, influence in octets:
-            temp_height_map = np.random.random([WORLD_SIZE // octet, WORLD_SIZE // octet]).astype(np.float64)
-            height_map += zoom(temp_height_map, octet) * influence
-        print("done;\n")
-
-        print("Putting in the blocks...")
-        world = World()
-        for y in range(WORLD_SIZE):
-            for x in range(WORLD_SIZE):
-                height = int((height_map[y][x] - 0.5) * magnitude + level)
-                for z in range(height):
-                    if z == height - 1:  # grass
-                        world.set((x, y, z), "grass_block")
-                    else:  # dirt
-                        world.set((x, y, z), "dirt_block")
-                if random.random() > 0.9:
-                    WorldGen.generate_tree(world, (x, y, height))
-            if y % (WORLD_SIZE // 25) == 0:
-                print(f"{y / WORLD_SIZE * 100:.2f}% done;")
-        print("done;\n")
+        seed = random.getrandbits(63) if seed is None else seed
+        return WorldGen.generate_region((0, 0), level, magnitude, seed, processes)
 
+    @staticmethod
+    def generate_region(
+            region: tuple[int, int],
+            level: int,
+            magnitude: float,
+            seed: int = 0,
+            processes: int | None = None) -> World:
+        """
+        Generates a region of an unbounded landscape. Everything is derived from world coordinates,
+        so neighbouring regions line up seamlessly, and the result doesn't depend on the amount of processes.
+        Region is generated in jobs of 'GENERATION_JOB_ROWS' rows of chunk columns
+        :param region: region x and y; region covers 'WORLD_SIZE' blocks on both axes starting at region * 'WORLD_SIZE'
+        :param level: sea level
+        :param magnitude: magnitude
+        :param seed: world seed
+        :param processes: amount of processes to generate with; defaults to the amount of CPUs
+        :return: generated region
+        """
+
+        jobs = [
+            (region, (row, min(row + GENERATION_JOB_ROWS, WORLD_CHUNKS)), level, magnitude, seed)
+            for row in range(0, WORLD_CHUNKS, GENERATION_JOB_ROWS)]
+
+        processes = os.cpu_count() if processes is None else processes
+        if processes > 1 and len(jobs) > 1:
+            # packed chunks are written into shared memory, only their palettes are sent back
+            memory = shared_memory.SharedMemory(create=True, size=WORLD_CHUNKS ** 3 * CHUNK_VOLUME)
+            try:
+                with ProcessPoolExecutor(
+                        max_workers=min(processes, len(jobs)),
+                        initializer=WorldGen.init_worker,
+                        initargs=(memory.name,)) as executor:
+                    results = list(executor.map(WorldGen.generate_worker_rows, jobs))
+                chunk_data = np.ndarray([WORLD_CHUNKS ** 3, CHUNK_VOLUME], dtype=np.uint8, buffer=memory.buf)
+                world = WorldGen.assemble(results, chunk_data)
+                del chunk_data
+            finally:
+                memory.close()
+                memory.unlink()
+        else:
+            chunk_data = np.empty([WORLD_CHUNKS ** 3, CHUNK_VOLUME], dtype=np.uint8)
+            world = WorldGen.assemble([WorldGen.generate_rows(chunk_data, *job) for job in jobs], chunk_data)
         return world
 
+    @staticmethod
+    def init_worker(memory_name: str):
+        """
+        Sets up a generation process
+        :param memory_name: name of the shared memory the packed chunks are written into
+        """
+
+        global WORKER_MEMORY
+        WORKER_MEMORY = shared_memory.SharedMemory(name=memory_name)
+
+    @staticmethod
+    def generate_worker_rows(job: tuple) -> list[tuple[int, int | tuple[list[int], int, int]]]:
+        """
+        Generates rows of chunk columns in a worker process
+        :param job: arguments for 'generate_rows'
+        :return: generated chunks
+        """
+
+        chunk_data = np.ndarray([WORLD_CHUNKS ** 3, CHUNK_VOLUME], dtype=np.uint8, buffer=WORKER_MEMORY.buf)
+        return WorldGen.generate_rows(chunk_data, *job)
+
+    @staticmethod
+    def generate_rows(
+            chunk_data: np.ndarray,
+            region: tuple[int, int],
+            rows: tuple[int, int],
+            level: int,
+            magnitude: float,
+            seed: int) -> list[tuple[int, int | tuple[list[int], int, int]]]:
+        """
+        Generates rows of chunk columns of a region. Random values come from noise of the world coordinates,
+        so any part of the world can be generated on its own
+        :param chunk_data: array with a row of 'CHUNK_VOLUME' bytes for every chunk; packed chunks are written there
+        :param region: region coordinates
+        :param rows: first and last (exclusive) chunk row along Y
+        :param level: sea level
+        :param magnitude: magnitude
+        :param seed: world seed
+        :return: list of chunk index with either a block id, or palette, bits and packed data length
+        """
+
+        # area is generated with a margin of 1 block, so trees of neighbouring columns put their leaves in
+        size_x, size_y = WORLD_SIZE + 2, (rows[1] - rows[0]) * CHUNK_SIZE + 2
+        xs = np.arange(size_x, dtype=np.int64)[None, :] + region[0] * WORLD_SIZE - 1
+        ys = np.arange(size_y, dtype=np.int64)[:, None] + region[1] * WORLD_SIZE + rows[0] * CHUNK_SIZE - 1
+
+        height_map = Noise.fractal(Noise.value, seed, TERRAIN_OCTAVES, xs, ys)
+        heights = ((height_map - 0.5) * magnitude + level).astype(np.int32)
+
+        voxels = np.zeros([WORLD_SIZE, size_y, size_x], dtype=np.uint8)
+        WorldGen.place_terrain(voxels, heights)
+        WorldGen.carve_caves(voxels, heights, xs.ravel(), ys.ravel(), level - CAVE_DEPTH, seed)
+
+        # trees don't grow on top of caves
+        tree_mask = Noise.hash_random(seed, -1, xs, ys) > 0.9
+        tree_mask &= np.take_along_axis(voxels, np.maximum(heights - 1, 0)[None], axis=0)[0] != 0
+        tree_heights = (Noise.hash_random(seed, -2, xs, ys) * 4).astype(np.int32) + 3
+        leaves_heights = Noise.hash_random(seed, -3, xs, ys) * 2 + 1
+        WorldGen.place_trees(voxels, heights, tree_mask, tree_heights, leaves_heights)
+
+        # pack the chunks; ZYX area without the margin is reordered to one row per chunk
+        chunks = voxels[:, 1:-1, 1:-1].reshape(
+            WORLD_CHUNKS, CHUNK_SIZE, rows[1] - rows[0], CHUNK_SIZE, WORLD_CHUNKS, CHUNK_SIZE
+        ).transpose(0, 2, 4, 1, 3, 5).reshape(-1, CHUNK_VOLUME)
+        chunk_z, chunk_y, chunk_x = np.meshgrid(
+            np.arange(WORLD_CHUNKS), np.arange(rows[0], rows[1]), np.arange(WORLD_CHUNKS), indexing="ij")
+        indices = ((chunk_z * WORLD_CHUNKS + chunk_y) * WORLD_CHUNKS + chunk_x).reshape(-1).tolist()
+
+        # single block chunks are found for all chunks at once
+        lowest = chunks.min(axis=1)
+        uniform = (lowest == chunks.max(axis=1)).tolist()
+        results = []
+        for row, (index, value) in enumerate(zip(indices, lowest.tolist())):
+            if uniform[row]:
+                results.append((index, value))
+                continue
+            chunk = Chunk.from_array(chunks[row])
+            chunk_data[index, :len(chunk.data)] = np.frombuffer(chunk.data, dtype=np.uint8)
+            results.append((index, (chunk.palette, chunk.bits, len(chunk.data))))
+        return results
+
+    @staticmethod
+    def assemble(results: list[list[tuple[int, int | tuple[list[int], int, int]]]], chunk_data: np.ndarray) -> World:
+        """
+        Makes a world out of generated chunks
+        :param results: results of 'generate_rows'
+        :param chunk_data: array the packed chunks were written into
+        :return: generated world
+        """
+
+        world = World()
+        for result in results:
+            for index, chunk in result:
+                if isinstance(chunk, int):
+                    world.chunks[index] = chunk
+                else:
+                    palette, bits, length = chunk
+                    world.chunks[index] = Chunk(palette, bits, bytearray(chunk_data[index, :length]))
+        world.dirty_chunks.update(range(WORLD_CHUNKS ** 3))
+        return world
+
+    @staticmethod
+    def place_terrain(voxels: np.ndarray, heights: np.ndarray) -> None:
+        """
+        Fills columns of a ZYX voxel array with dirt, topped with a grass block
+        :param voxels: voxel array in ZYX order
+        :param heights: YX array of terrain heights
+        """
+
+        # layers below the lowest column are solid dirt, so only the layers in between need comparisons
+        bottom = min(max(int(heights.min()) - 1, 0), voxels.shape[0])
+        top = min(max(int(heights.max()), 0), voxels.shape[0])
+        voxels[:bottom] = Blocks.named["dirt_block"]
+        z_index = np.arange(bottom, top, dtype=np.int32)[:, None, None]
+        voxels[bottom:top][z_index < heights - 1] = Blocks.named["dirt_block"]
+        voxels[bottom:top][z_index == heights - 1] = Blocks.named["grass_block"]
+
+    @staticmethod
+    def carve_caves(voxels: np.ndarray, heights: np.ndarray, xs: np.ndarray, ys: np.ndarray, bottom: int, seed: int):
+        """
+        Carves caves out of the terrain where 3D noise is above 'CAVE_THRESHOLD'; caves can open on the surface
+        :param voxels: voxel array in ZYX order
+        :param heights: YX array of terrain heights
+        :param xs: world x coordinates of the voxel array columns
+        :param ys: world y coordinates of the voxel array rows
+        :param bottom: caves are carved above this height
+        :param seed: world seed
+        """
+
+        bottom = min(max(bottom, 0), voxels.shape[0])
+        top = min(max(int(heights.max()), bottom), voxels.shape[0])
+        if top == bottom:
+            return
+
+        zs = np.arange(bottom, top)
+        density = Noise.sparse_grid(
+            lambda *coords: Noise.fractal(Noise.perlin, seed, CAVE_OCTAVES, *coords, salt=-4), CAVE_STEP, zs, ys, xs)
+        voxels[bottom:top][(density > CAVE_THRESHOLD) & (zs[:, None, None] < heights)] = 0
+
+    @staticmethod
+    def place_trees(
+            voxels: np.ndarray,
+            heights: np.ndarray,
+            tree_mask: np.ndarray,
+            tree_heights: np.ndarray,
+            leaves_heights: np.ndarray) -> None:
+        """
+        Places a batch of trees into a ZYX voxel array.
+        Result is the same as calling 'generate_tree' column by column (Y then X) right after the column's
+        terrain was placed: later trees overwrite earlier ones, and terrain of later columns overwrites leaves.
+        :param voxels: voxel array in ZYX order
+        :param heights: YX array of terrain heights; trees are placed on top of them
+        :param tree_mask: YX boolean array of columns with trees
+        :param tree_heights: YX array of tree heights
+        :param leaves_heights: YX array of heights at which leaves start
+        """
+
+        tree_y, tree_x = np.nonzero(tree_mask)
+        tree_z = heights[tree_y, tree_x]
+        tree_height = tree_heights[tree_y, tree_x]
+        leaves_height = leaves_heights[tree_y, tree_x]
+
+        # tree layers; trees are at most 'tree_heights.max()' blocks tall
+        layer = np.arange(max(int(tree_height.max(initial=0)), 1))[None, :]
+        logs = layer < tree_height[:, None]
+        leaves = logs & (layer >= leaves_height[:, None])
+
+        # block offsets relative to tree base, in the same order as in 'generate_tree'
+        offsets = [
+            ((0, 0), logs, "oak_logs"),
+            ((0, 1), leaves, "oak_leaves"),
+            ((0, -1), leaves, "oak_leaves"),
+            ((1, 0), leaves, "oak_leaves"),
+            ((-1, 0), leaves, "oak_leaves")]
+        xs, ys, zs, ids, order = [], [], [], [], []
+        for (dx, dy), mask, name in offsets:
+            tree, level = np.nonzero(mask)
+            xs.append(tree_x[tree] + dx)
+            ys.append(tree_y[tree] + dy)
+            zs.append(tree_z[tree] + level)
+            ids.append(np.full(tree.size, Blocks.named[name], dtype=np.uint8))
+            order.append(tree)
+        xs.append(tree_x)
+        ys.append(tree_y)
+        zs.append(tree_z + tree_height)
+        ids.append(np.full(tree_x.size, Blocks.named["oak_leaves"], dtype=np.uint8))
+        order.append(np.arange(tree_x.size))
+
+        xs, ys, zs = np.concatenate(xs), np.concatenate(ys), np.concatenate(zs)
+        ids, order = np.concatenate(ids), np.concatenate(order)
+
+        # drop out of bounds blocks
+        size_z, size_y, size_x = voxels.shape
+        inbound = (
+            (xs > -1) & (xs < size_x) &
+            (ys > -1) & (ys < size_y) &
+            (zs > -1) & (zs < size_z))
+
+        # drop blocks which would've been overwritten by terrain of columns generated after the tree
+        later_column = (ys * size_x + xs) > (tree_y[order] * size_x + tree_x[order])
+        inbound[inbound] &= ~(later_column[inbound] & (zs[inbound] < heights[ys[inbound], xs[inbound]]))
+
+        xs, ys, zs, ids, order = xs[inbound], ys[inbound], zs[inbound], ids[inbound], order[inbound]
+
+        # for overlapping blocks only the last placed tree is kept
+        index = (zs * size_y + ys) * size_x + xs
+        sorting = np.lexsort((order, index))
+        index, ids = index[sorting], ids[sorting]
+        last = np.append(index[1:] != index[:-1], True)
+        voxels.reshape(-1)[index[last]] = ids[last]
+
     @staticmethod
     def generate_tree(world: World, pos: tuple[int, int, int]):
         """
@@ -175,15 +1125,21 @@ class WorldGen:
 
         height = int(random.random() * 4) + 3
         leaves_height = random.random() * 2 + 1
-        for i in range(height):
-            world.set((pos[0], pos[1], pos[2] + i), "oak_logs")
 
-            if i >= leaves_height:
-                world.set((pos[0], pos[1] + 1, pos[2] + i), "oak_leaves")
-                world.set((pos[0], pos[1] - 1, pos[2] + i), "oak_leaves")
-                world.set((pos[0] + 1, pos[1], pos[2] + i), "oak_leaves")
-                world.set((pos[0] - 1, pos[1], pos[2] + i), "oak_leaves")
-        world.set((pos[0], pos[1], pos[2] + height), "oak_leaves")
+        # logs, then leaves around the trunk starting at 'leaves_height', then leaves on top
+        layers = np.arange(height)
+        leaf_layers = layers[layers >= leaves_height]
+        coords = [np.stack([np.full(height, pos[0]), np.full(height, pos[1]), pos[2] + layers], axis=1)]
+        values = [np.full(height, Blocks.named["oak_logs"])]
+        for dx, dy in ((0, 1), (0, -1), (1, 0), (-1, 0)):
+            coords.append(np.stack([
+                np.full(leaf_layers.size, pos[0] + dx),
+                np.full(leaf_layers.size, pos[1] + dy),
+                pos[2] + leaf_layers], axis=1))
+            values.append(np.full(leaf_layers.size, Blocks.named["oak_leaves"]))
+        coords.append(np.array([[pos[0], pos[1], pos[2] + height]]))
+        values.append(np.array([Blocks.named["oak_leaves"]]))
+        world.set_many(np.concatenate(coords), np.concatenate(values))
 
 
 class Ray:
@@ -199,8 +1155,180 @@ class Ray:
         self.float_position: list[float] = [0, 0, 0]
         self.length: float = 0
 
-    def cast(self, world: World) -> "Ray":
+        # id of the hit block; 0 or -1 (out of bounds) when nothing was hit
+        self.block: int = -1
+
+        # amount of DDA iterations made
+        self.steps: int = 0
+
+    def cast(self, world: World, skip: tuple[int, int, int] | None = None, skipping: bool = True) -> "Ray":
         """
-        Casts the ray for the given world.
+        Casts the ray for the given world. Same as 'castRay' in 'main.glsl'.
+        :param world: world to cast the ray in
+        :param skip: block position that is never hit
+        :param skipping: whether to skip empty bricks when world has occupancy pyramid
         :returns: ray
         """
+
+        origin, direction = self.origin, self.direction
+        skip = list(skip) if skip is not None else None
+        occupancy = world.occupancy if skipping else None
+
+        # compute DDA variables
+        ipos = [math.floor(origin[axis]) for axis in range(3)]
+        ustep = [abs(1 / direction[axis]) if direction[axis] != 0 else math.inf for axis in range(3)]
+        istep = [1 if direction[axis] > 0 else -1 for axis in range(3)]
+        first = [
+            math.inf if ustep[axis] == math.inf
+            else (ipos[axis] - origin[axis] + 1) * ustep[axis] if direction[axis] > 0
+            else (origin[axis] - ipos[axis]) * ustep[axis]
+            for axis in range(3)]
+
+        # lengths are always computed as 'first + count * ustep', so that skipping lands on the same values
+        count = [0, 0, 0]
+        alen = first[:]
+
+        voxel_id, dist, steps = -1, 0.0, 0
+        while True:
+            steps += 1
+            bits = occupancy.empty_brick(ipos) if occupancy is not None else 0
+            if bits:
+                # cross the whole brick; it is either all air or all out of bounds
+                crossed = ipos[:], count[:], alen[:]
+                length = OccupancyPyramid.skip_brick(bits, crossed[0], istep, ustep, first, *crossed[1:])
+                if length > CUBE_DIAG:
+                    # ray ends within the brick; it goes to the last block before the max length,
+                    # and makes its last step from there, as without skipping
+                    OccupancyPyramid.advance_to(CUBE_DIAG, ipos, istep, ustep, first, count, alen)
+                    bits = 0
+                else:
+                    inside = all(-1 < ipos[axis] < WORLD_SIZE for axis in range(3))
+                    voxel_id = 0 if inside else -1
+                    ipos, count, alen = crossed
+                    dist = length
+            if not bits:
+                if ipos != skip:
+                    voxel_id = world.get(ipos)
+                    if voxel_id > 0:
+                        break
+
+                # make a step
+                if alen[0] < alen[1] and alen[0] < alen[2]:
+                    axis = 0
+                elif alen[1] < alen[2]:
+                    axis = 1
+                else:
+                    axis = 2
+                ipos[axis] += istep[axis]
+                dist = alen[axis]
+                count[axis] += 1
+                alen[axis] = first[axis] + count[axis] * ustep[axis]
+
+            # check for length; if too far then return
+            if dist > CUBE_DIAG:
+                break
+
+        self.block = voxel_id
+        self.integer_position = ipos
+        self.float_position = [origin[axis] + direction[axis] * dist for axis in range(3)]
+        self.length = dist
+        self.steps = steps
+        return self
+
+    @staticmethod
+    def cast_many(
+            world: World,
+            origins: np.ndarray,
+            directions: np.ndarray,
+            skip: np.ndarray | None = None,
+            lookup: VoxelLookup | None = None,
+            skipping: bool = True) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Casts many rays at once; vectorized version of 'cast'. All rays are stepped together,
+        finished rays are dropped from further steps.
+        :param world: world to cast the rays in
+        :param origins: array of ray origins with shape (N, 3)
+        :param directions: array of normalized ray directions with shape (N, 3)
+        :param skip: array of block positions that are never hit with shape (N, 3)
+        :param lookup: voxel lookup to reuse between calls; made for this call when not given
+        :param skipping: whether to skip empty bricks when world has occupancy pyramid
+        :return: arrays of hit block ids (N,), integer positions (N, 3), float positions (N, 3) and lengths (N,)
+        """
+
+        origins = np.asarray(origins, dtype=np.float64).reshape(-1, 3)
+        directions = np.asarray(directions, dtype=np.float64).reshape(-1, 3)
+        if skip is not None:
+            skip = np.asarray(skip, dtype=np.int64).reshape(-1, 3)
+
+        # compute DDA variables
+        ipos = np.floor(origins).astype(np.int64)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ustep = np.abs(1 / directions)
+            istep = np.where(directions > 0, 1, -1)
+            first = np.where(directions > 0, (ipos - origins + 1) * ustep, (origins - ipos) * ustep)
+        first[np.isinf(ustep)] = np.inf
+        count = np.zeros_like(ipos)
+        alen = first.copy()
+
+        blocks = np.full(origins.shape[0], -1, dtype=np.int16)
+        dist = np.zeros(origins.shape[0], dtype=np.float64)
+
+        lookup_cache = VoxelLookup(world) if lookup is None else lookup
+        occupancy = world.occupancy if skipping else None
+
+        active = np.arange(origins.shape[0])
+        while active.size:
+            # empty bricks are crossed in a single step
+            if occupancy is not None:
+                bits = occupancy.empty_bricks(ipos[active])
+                crossing = active[bits > 0]
+                if crossing.size:
+                    # DDA state is advanced on copies, and written back for rays that stay within the max length
+                    state = ipos[crossing], count[crossing], alen[crossing]
+                    lengths = OccupancyPyramid.skip_bricks(
+                        bits[bits > 0], state[0], istep[crossing], ustep[crossing], first[crossing], *state[1:])
+                    kept = lengths <= CUBE_DIAG
+                    inside = np.all((ipos[crossing[kept]] > -1) & (ipos[crossing[kept]] < WORLD_SIZE), axis=1)
+                    blocks[crossing[kept]] = np.where(inside, 0, -1)
+                    dist[crossing[kept]] = lengths[kept]
+                    ipos[crossing[kept]], count[crossing[kept]], alen[crossing[kept]] = (
+                        array[kept] for array in state)
+
+                    # rays that end within the brick go to the last block before the max length,
+                    # and make their last step from there, as without skipping
+                    ending = crossing[~kept]
+                    if ending.size:
+                        state = ipos[ending], count[ending], alen[ending]
+                        OccupancyPyramid.advance_to_many(
+                            CUBE_DIAG, state[0], istep[ending], ustep[ending], first[ending], *state[1:])
+                        ipos[ending], count[ending], alen[ending] = state
+                        bits[np.isin(active, ending)] = 0
+                stepping = active[bits == 0]
+            else:
+                stepping = active
+            position = ipos[stepping]
+
+            # fetch blocks
+            fetch = np.ones(stepping.size, dtype=np.bool_) if skip is None else np.any(position != skip[stepping], axis=1)
+            inside = np.all((position > -1) & (position < WORLD_SIZE), axis=1)
+            voxels = np.where(inside, 0, -1).astype(np.int16)
+            voxels[fetch & inside] = lookup_cache.get(position[fetch & inside])
+            blocks[stepping[fetch]] = voxels[fetch]
+
+            # make a step with rays that didn't collide
+            hit = stepping[fetch & (voxels > 0)]
+            stepping = stepping[~(fetch & (voxels > 0))]
+            lengths = alen[stepping]
+            axis = np.where(
+                (lengths[:, 0] < lengths[:, 1]) & (lengths[:, 0] < lengths[:, 2]), 0,
+                np.where(lengths[:, 1] < lengths[:, 2], 1, 2))
+            ipos[stepping, axis] += istep[stepping, axis]
+            dist[stepping] = lengths[np.arange(stepping.size), axis]
+            count[stepping, axis] += 1
+            alen[stepping, axis] = first[stepping, axis] + count[stepping, axis] * ustep[stepping, axis]
+
+            # check for length; drop rays that collided or went too far
+            active = np.setdiff1d(active, hit, assume_unique=True)
+            active = active[dist[active] <= CUBE_DIAG]
+
+        return blocks, ipos, origins + directions * dist[:, None], dist